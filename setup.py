@@ -13,6 +13,10 @@ requirements = (
     'PyYAML==5.1'
 )
 
+amazon_requirements = (
+    'boto3>=1.9',
+)
+
 dev_requirements = (
     'flake8',
     'flake8-docstrings',
@@ -50,7 +54,8 @@ setup(
     license='GPLv3',
     install_requires=requirements,
     extras_require={
-        'dev': dev_requirements
+        'dev': dev_requirements,
+        'amazon': amazon_requirements
     },
     packages=find_packages('src'),
     package_dir={'': 'src'},
@@ -19,6 +19,7 @@ from werkzeug.exceptions import HTTPException, default_exceptions
 from . import settings
 from .lib.logging import configure_logging
 from .lib.storage import get_media_storage
+from .lib.wrappers import Request
 from .celery_app import init_celery
 
 
@@ -38,6 +39,7 @@ def get_app(config=None):
     :return: a new SuperdeskEve app instance
     """
     app = Flask(__name__)
+    app.request_class = Request
 
     if config is None:
         config = {}
@@ -73,6 +75,8 @@ def get_app(config=None):
     # https://flask-pymongo.readthedocs.io
     def init_db():
         app.mongo = PyMongo(app)
+        # uploads by digest look up projects whose content was remuxed to faststart
+        app.mongo.db.projects.create_index('metadata.source_sha256', sparse=True)
 
     app.init_db = init_db
     app.init_db()
@@ -1,7 +1,8 @@
 import copy
 import logging
+import mimetypes
 import os
-import re
+import uuid
 from ast import literal_eval
 from datetime import datetime
 
@@ -12,15 +13,18 @@ from pymongo import ReturnDocument
 from pymongo.errors import ServerSelectionTimeoutError
 from werkzeug.exceptions import BadRequest, Conflict, InternalServerError, NotFound
 
+from videoserver.celery_app import celery
+from videoserver.lib.image import get_image_meta
 from videoserver.lib.video_editor import get_video_editor
 from videoserver.lib.views import MethodView
 from videoserver.lib.utils import (
-    add_urls, create_file_name, get_request_address, json_response,
-    paginate, save_activity_log, storage2response, validate_document
+    add_urls, byteranges2response, create_file_name, delete_renders, delete_segments, find_keyframe_offset,
+    get_media_index, get_render_key, get_request_address, is_range_fresh, json_response, paginate,
+    parse_byte_ranges, save_activity_log, save_media_index, storage2response, validate_document
 )
 
 from . import bp
-from .tasks import edit_video, generate_preview_thumbnail, generate_timeline_thumbnails
+from .tasks import edit_video, generate_preview_thumbnail, generate_timeline_thumbnails, index_video, render_edits
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +36,18 @@ class ListUploadProject(MethodView):
             'required': True
         }
     }
+    SCHEMA_UPLOAD_DIGEST = {
+        'sha256': {
+            'type': 'string',
+            'required': True,
+            'regex': '^[0-9a-fA-F]{64}$'
+        },
+        'filename': {
+            'type': 'string',
+            'required': True,
+            'regex': r'^[^/\\]+\.[^/\\.]+$'
+        }
+    }
 
     def post(self):
         """
@@ -44,7 +60,19 @@ class ListUploadProject(MethodView):
           name: file
           type: file
           description: video file to upload
+        - in: formData
+          name: sha256
+          type: string
+          description: >
+            sha256 hex digest of a video file, send it with `filename` instead of `file`
+            to create a project from a content which is already in the storage, without uploading it again
+        - in: formData
+          name: filename
+          type: string
+          description: original filename of a video file, required with `sha256`
         responses:
+          404:
+            description: content with `sha256` is unknown, upload a `file` instead
           201:
             description: Created project details
             schema:
@@ -92,12 +120,26 @@ class ListUploadProject(MethodView):
                       size:
                         type: int
                         example: 14567890
+                      faststart:
+                        type: boolean
+                        description: mp4 and mov only, `moov` atom is before media data
+                        example: True
+                      source_sha256:
+                        type: string
+                        description: sha256 of uploaded content if it was remuxed to faststart
+                        example: 2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae
                   url:
                     type: string
                     example: http://localhost:5050/projects/5cbd5acfe24f6045607e51aa/raw/video
                   mime_type:
                     type: string
                     example: video/mp4
+                  etag:
+                    type: string
+                    example: 2c1a57-15e4c6c4b52d7a40-27f206
+                  last_modified:
+                    type: string
+                    example: 2019-07-02T15:02:32+00:00
                   create_time:
                     type: string
                     example: 2019-07-02T15:02:32+00:00
@@ -118,6 +160,7 @@ class ListUploadProject(MethodView):
                     properties:
                       video:
                         type: boolean
+                        description: mp4 and mov video which is not faststart is processing until it's remuxed
                         example: False
                       thumbnail_preview:
                         type: boolean
@@ -125,6 +168,33 @@ class ListUploadProject(MethodView):
                       thumbnails_timeline:
                         type: boolean
                         example: False
+                  progress:
+                    type: object
+                    description: Progress of running tasks, `null` if a task is not running
+                    properties:
+                      video:
+                        type: object
+                        properties:
+                          percent:
+                            type: number
+                            example: 42.5
+                          fps:
+                            type: number
+                            example: 96.3
+                          speed:
+                            type: number
+                            description: Processed seconds of video per second
+                            example: 3.85
+                          eta:
+                            type: number
+                            description: Estimated seconds until a task is finished
+                            example: 12.4
+                          updated:
+                            type: string
+                            example: 2019-07-02T15:02:32+00:00
+                      thumbnails_timeline:
+                        type: object
+                        example: null
                   thumbnails:
                     type: object
                     properties:
@@ -137,49 +207,106 @@ class ListUploadProject(MethodView):
         """
 
         # validate request
-        if 'file' not in request.files:
+        if 'file' not in request.files and 'sha256' not in request.form:
             # to avoid TypeError: cannot serialize '_io.BufferedRandom' error
             raise BadRequest({"file": ["required field"]})
-        document = validate_document(request.files, self.SCHEMA_UPLOAD)
 
-        # validate codec
-        file_stream = document['file'].stream.read()
-        metadata = get_video_editor().get_meta(file_stream)
-        if metadata.get('codec_name') not in app.config.get('CODEC_SUPPORT_VIDEO'):
-            raise BadRequest({'file': [f"Codec: '{metadata.get('codec_name')}' is not supported."]})
+        project_id = bson.ObjectId()
+        if 'file' in request.files:
+            document = validate_document(request.files, self.SCHEMA_UPLOAD)
+            original_filename = document['file'].filename
+            mime_type = document['file'].mimetype
+            filename = create_file_name(ext=original_filename.rsplit('.')[-1])
+
+            # validate codec
+            # upload is already spooled into a named temporary file, see `videoserver.lib.wrappers.Request`
+            file_stream = document['file'].stream
+            metadata = get_video_editor().get_meta_from_path(file_stream.name)
+            self._validate_codec(metadata, 'file')
+
+            # put file into storage, it's remuxed and indexed by `index_video` task
+            with open(file_stream.name, 'rb') as content:
+                storage_id = app.fs.put(
+                    content=content,
+                    filename=filename,
+                    project_id=project_id,
+                    content_type=mime_type
+                )
+            # storage can link a blob to the temporary file, remove it before the task replaces the blob
+            file_stream.close()
+        else:
+            document = validate_document(request.form.to_dict(), self.SCHEMA_UPLOAD_DIGEST)
+            original_filename = document['filename']
+            mime_type = mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
+            filename = create_file_name(ext=original_filename.rsplit('.')[-1])
+
+            # link content which is already in storage
+            storage_id = app.fs.put_by_digest(
+                digest=document['sha256'],
+                filename=filename,
+                project_id=project_id
+            )
+            source_digest = None
+            if storage_id is None:
+                # uploaded content could be remuxed to faststart, remuxed video is linked instead
+                source_digest = document['sha256'].lower()
+                source = app.mongo.db.projects.find_one(
+                    {'metadata.source_sha256': source_digest},
+                    projection={'storage_id': True}
+                )
+                if source:
+                    storage_id = app.fs.copy(source['storage_id'], filename, project_id=project_id)
+            if storage_id is None:
+                raise NotFound({'sha256': ['Content is unknown, upload a file instead.']})
+
+            # storage which doesn't keep files locally downloads linked content
+            with app.fs.local_file(storage_id) as path_video:
+                # validate codec
+                metadata = get_video_editor().get_meta_from_path(path_video)
+            if source_digest:
+                metadata['source_sha256'] = source_digest
+            try:
+                self._validate_codec(metadata, 'sha256')
+            except BadRequest:
+                app.fs.delete_dir(storage_id)
+                raise
+
+        # mp4 or mov video which has `moov` atom after media data is remuxed to faststart by `index_video` task,
+        # video is processing until it's replaced
+        remux = bool(app.config.get('FFMPEG_FASTSTART')) and metadata.get('faststart') is False
+        job_id = str(uuid.uuid4())
 
         # add record to database
         project = {
-            '_id': bson.ObjectId(),
-            'filename': create_file_name(ext=document['file'].filename.rsplit('.')[-1]),
-            'storage_id': None,
+            '_id': project_id,
+            'filename': filename,
+            'storage_id': storage_id,
             'metadata': metadata,
             'create_time': datetime.utcnow(),
-            'mime_type': document['file'].mimetype,
+            'mime_type': mime_type,
             'request_address': get_request_address(request.headers.environ),
-            'original_filename': document['file'].filename,
+            'original_filename': original_filename,
             'version': 1,
             'parent': None,
             'processing': {
-                'video': False,
+                'video': remux,
                 'thumbnail_preview': False,
                 'thumbnails_timeline': False
             },
+            'progress': {
+                'video': None,
+                'thumbnails_timeline': None
+            },
             'thumbnails': {
                 'timeline': [],
                 'preview': None
             }
         }
-
-        # put file stream into storage
-        storage_id = app.fs.put(
-            content=file_stream,
-            filename=project['filename'],
-            project_id=project['_id'],
-            content_type=document['file'].mimetype
-        )
-        # set 'storage_id' for project
-        project['storage_id'] = storage_id
+        if remux:
+            # remux can be cancelled, see `CancelProcessing`
+            project['jobs'] = {'video': job_id}
+        # set http cache validators for project
+        project.update(app.fs.get_validators(storage_id))
 
         try:
             # save project
@@ -191,10 +318,20 @@ class ListUploadProject(MethodView):
 
         logger.info(f"New project was created. ID: {project['_id']}")
         save_activity_log('UPLOAD', project['_id'], project)
+
+        # media index is pending until the task is done, tasks and seeks probe a video without it
+        index_video.apply_async(args=(project,), task_id=job_id)
+        # task could be finished already
+        project = app.mongo.db.projects.find_one({'_id': project_id}) or project
         add_urls(project)
 
         return json_response(project, status=201)
 
+    @staticmethod
+    def _validate_codec(metadata, field):
+        if metadata.get('codec_name') not in app.config.get('CODEC_SUPPORT_VIDEO'):
+            raise BadRequest({field: [f"Codec: '{metadata.get('codec_name')}' is not supported."]})
+
     def get(self):
         """
         List of projects
@@ -275,6 +412,12 @@ class ListUploadProject(MethodView):
                       mime_type:
                         type: string
                         example: video/mp4
+                      etag:
+                        type: string
+                        example: 2c1a57-15e4c6c4b52d7a40-27f206
+                      last_modified:
+                        type: string
+                        example: 2019-07-02T15:02:32+00:00
                       create_time:
                         type: string
                         example: 2019-07-02T15:02:32+00:00
@@ -302,6 +445,33 @@ class ListUploadProject(MethodView):
                           thumbnails_timeline:
                             type: boolean
                             example: False
+                      progress:
+                        type: object
+                        description: Progress of running tasks, `null` if a task is not running
+                        properties:
+                          video:
+                            type: object
+                            properties:
+                              percent:
+                                type: number
+                                example: 42.5
+                              fps:
+                                type: number
+                                example: 96.3
+                              speed:
+                                type: number
+                                description: Processed seconds of video per second
+                                example: 3.85
+                              eta:
+                                type: number
+                                description: Estimated seconds until a task is finished
+                                example: 12.4
+                              updated:
+                                type: string
+                                example: 2019-07-02T15:02:32+00:00
+                          thumbnails_timeline:
+                            type: object
+                            example: null
                       thumbnails:
                         type: object
                         properties:
@@ -333,6 +503,8 @@ class ListUploadProject(MethodView):
 
 
 class RetrieveEditDestroyProject(MethodView):
+    #: keys of an edit document which are edit rules, other keys tell how to edit a video
+    EDIT_RULES = ('trim', 'rotate', 'scale', 'crop')
 
     @property
     def schema_edit(self):
@@ -351,6 +523,10 @@ class RetrieveEditDestroyProject(MethodView):
                         'min': 1,
                         'required': True
                     },
+                    'snap': {
+                        'type': 'boolean',
+                        'required': False
+                    },
                 }
             },
             'rotate': {
@@ -392,6 +568,29 @@ class RetrieveEditDestroyProject(MethodView):
                         'min': 0
                     }
                 }
+            },
+            'profile': {
+                'type': 'string',
+                'required': False,
+                'allowed': sorted({
+                    name for profiles in app.config.get('FFMPEG_ENCODER_PROFILES').values() for name in profiles
+                })
+            },
+            'thumbnails': {
+                'type': 'dict',
+                'required': False,
+                'schema': {
+                    'timeline': {
+                        'type': 'integer',
+                        'min': 1,
+                        'required': False
+                    },
+                    'preview': {
+                        'type': 'float',
+                        'min': 0,
+                        'required': False
+                    },
+                }
             }
         }
 
@@ -453,12 +652,26 @@ class RetrieveEditDestroyProject(MethodView):
                       size:
                         type: int
                         example: 14567890
+                      faststart:
+                        type: boolean
+                        description: mp4 and mov only, `moov` atom is before media data
+                        example: True
+                      source_sha256:
+                        type: string
+                        description: sha256 of uploaded content if it was remuxed to faststart
+                        example: 2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae
                   url:
                     type: string
                     example: http://localhost:5050/projects/5cbd5acfe24f6045607e51aa/raw/video
                   mime_type:
                     type: string
                     example: video/mp4
+                  etag:
+                    type: string
+                    example: 2c1a57-15e4c6c4b52d7a40-27f206
+                  last_modified:
+                    type: string
+                    example: 2019-07-02T15:02:32+00:00
                   create_time:
                     type: string
                     example: 2019-07-02T15:02:32+00:00
@@ -486,6 +699,33 @@ class RetrieveEditDestroyProject(MethodView):
                       thumbnails_timeline:
                         type: boolean
                         example: False
+                  progress:
+                    type: object
+                    description: Progress of running tasks, `null` if a task is not running
+                    properties:
+                      video:
+                        type: object
+                        properties:
+                          percent:
+                            type: number
+                            example: 42.5
+                          fps:
+                            type: number
+                            example: 96.3
+                          speed:
+                            type: number
+                            description: Processed seconds of video per second
+                            example: 3.85
+                          eta:
+                            type: number
+                            description: Estimated seconds until a task is finished
+                            example: 12.4
+                          updated:
+                            type: string
+                            example: 2019-07-02T15:02:32+00:00
+                      thumbnails_timeline:
+                        type: object
+                        example: null
                   thumbnails:
                     type: object
                     properties:
@@ -495,8 +735,41 @@ class RetrieveEditDestroyProject(MethodView):
                       preview:
                         type: object
                         example: {}
+                  edits:
+                    type: object
+                    description: Edit list, see `edits` endpoint. `metadata`, `thumbnails` and validators of a project
+                                 describe a source video, while `raw/video` serves a render of applied edits.
+                    properties:
+                      list:
+                        type: array
+                        example:
+                          - scale: 640
+                      position:
+                        type: integer
+                        example: 1
+                      render:
+                        type: object
+                        description: Render of applied edits, `null` until they are rendered
+                        properties:
+                          metadata:
+                            type: object
+                            example: {"width": 640, "height": 360, "duration": 15.0, "size": 1016443}
+                          etag:
+                            type: string
+                            example: 8b1a9953c4611296a827abf8c47804d7
+                          last_modified:
+                            type: string
+                            example: 2019-07-02T15:02:32+00:00
         """
 
+        edits = self.project.get('edits')
+        if edits and edits.get('position'):
+            render = RetrieveApplyClearEdits._get_render(self.project)
+            edits['render'] = {
+                'metadata': render['metadata'],
+                'etag': render.get('etag'),
+                'last_modified': render.get('last_modified')
+            } if render else None
         add_urls(self.project)
         return json_response(self.project)
 
@@ -528,6 +801,11 @@ class RetrieveEditDestroyProject(MethodView):
                   end:
                     type: integer
                     example: 10
+                  snap:
+                    type: boolean
+                    description: Move `start` to the nearest preceding keyframe and trim without re-encoding.
+                                 Applies only if video is not cropped, rotated or scaled.
+                    example: false
               crop:
                 type: object
                 properties:
@@ -546,10 +824,32 @@ class RetrieveEditDestroyProject(MethodView):
               rotate:
                 type: integer
                 enum: [-270, -180, -90, 90, 180, 270]
+                description: Degrees to rotate clockwise. If video is only rotated, mp4 and mov videos are not
+                             re-encoded, rotation is stored in a display matrix instead.
                 example: 90
               scale:
                 type: integer
                 example: 800
+              profile:
+                type: string
+                enum: [balanced, fast, quality]
+                description: Encoder profile, it trades encoding speed for quality and size of an edited video.
+                             Configured default profile is used if it's not set.
+                example: fast
+              thumbnails:
+                type: object
+                description: Thumbnails of an edited video which are captured while it's encoded, so a client
+                             doesn't have to request them after editing and video is not decoded again.
+                properties:
+                  timeline:
+                    type: integer
+                    description: Amount of timeline thumbnails, timeline is cleared if it's not set
+                    example: 40
+                  preview:
+                    type: number
+                    description: Position of a preview thumbnail in an edited video, the current preview thumbnail
+                                 is kept if it's not set
+                    example: 2.5
         responses:
           202:
             description: Editing started
@@ -576,20 +876,57 @@ class RetrieveEditDestroyProject(MethodView):
         if self.project['version'] == 1:
             raise BadRequest({"project_id": [f"Video with version 1 is not editable, use duplicated project instead."]})
 
+        if self.project.get('edits', {}).get('list'):
+            raise BadRequest({"edits": ["Video with an edit list is not editable, clear an edit list first."]})
+
         request_json = request.get_json()
         document = validate_document(
             request_json if request_json else {},
             self.schema_edit
         )
 
-        if not document:
+        self._validate_edit(document, self.project['metadata'])
+
+        # set processing flag, edit list could be applied by another request in the meantime
+        job_id = str(uuid.uuid4())
+        project = app.mongo.db.projects.find_one_and_update(
+            {'_id': self.project['_id'], 'edits.list.0': {'$exists': False}},
+            {'$set': {'processing.video': True, 'progress.video': None, 'jobs.video': job_id}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not project:
+            raise BadRequest({"edits": ["Video with an edit list is not editable, clear an edit list first."]})
+        self.project = project
+        logger.info(f"New project editing task was started. ID: {self.project['_id']}")
+        save_activity_log("EDIT", self.project['_id'], document)
+
+        # run task, job id is a task id, so a queued task can be revoked
+        edit_video.apply_async(
+            args=(self.project,),
+            kwargs={'changes': document},
+            task_id=job_id
+        )
+
+        return json_response({"processing": True}, status=202)
+
+    @classmethod
+    def _validate_edit(cls, document, metadata):
+        """
+        Validate edit rules against a video they are applied to
+        :param document: edit document validated by `schema_edit`
+        :type document: dict
+        :param metadata: metadata of a video, `width`, `height` and `duration` are required
+        :type metadata: dict
+        :raise: `BadRequest` if edit can't be applied to a video
+        """
+
+        # profile and thumbnails are not edit rules, they tell how to encode an edited video and what to capture
+        if not document.keys() & set(cls.EDIT_RULES):
             raise BadRequest({
                 'edit': [f"At least one of the edit rules is required. "
-                         f"Available edit rules are: {', '.join(self.schema_edit.keys())}"]
+                         f"Available edit rules are: {', '.join(cls.EDIT_RULES)}"]
             })
 
-        metadata = self.project['metadata']
-
         # validate trim
         if 'trim' in document:
             if document['trim']['start'] >= document['trim']['end']:
@@ -637,23 +974,12 @@ class RetrieveEditDestroyProject(MethodView):
                     {"scale": [f"interpolation is permitted only for videos which have width less than "
                                f"{app.config.get('INTERPOLATION_LIMIT')}px"]}
                 ]})
-
-        # set processing flag
-        self.project = app.mongo.db.projects.find_one_and_update(
-            {'_id': self.project['_id']},
-            {'$set': {'processing.video': True}},
-            return_document=ReturnDocument.AFTER
-        )
-        logger.info(f"New project editing task was started. ID: {self.project['_id']}")
-        save_activity_log("EDIT", self.project['_id'], document)
-
-        # run task
-        edit_video.delay(
-            self.project,
-            changes=document
-        )
-
-        return json_response({"processing": True}, status=202)
+        # validate thumbnails
+        if document.get('thumbnails', {}).get('preview') is not None:
+            duration = document['trim']['end'] - document['trim']['start'] if 'trim' in document \
+                else metadata['duration']
+            if document['thumbnails']['preview'] > duration:
+                raise BadRequest({"thumbnails": [{"preview": ["outside of edited video's length"]}]})
 
     def delete(self, project_id):
         """
@@ -675,6 +1001,8 @@ class RetrieveEditDestroyProject(MethodView):
         logger.info(f"Project was deleted. ID: {self.project['_id']}")
         save_activity_log("DELETE", self.project['_id'])
         app.mongo.db.projects.delete_one({'_id': self.project['_id']})
+        save_media_index(self.project['_id'], None)
+        delete_renders(self.project['_id'])
 
         return json_response(status=204)
 
@@ -739,12 +1067,26 @@ class DuplicateProject(MethodView):
                       size:
                         type: int
                         example: 14567890
+                      faststart:
+                        type: boolean
+                        description: mp4 and mov only, `moov` atom is before media data
+                        example: True
+                      source_sha256:
+                        type: string
+                        description: sha256 of uploaded content if it was remuxed to faststart
+                        example: 2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae
                   url:
                     type: string
                     example: http://localhost:5050/projects/5cbd5acfe24f6045607e51aa/raw/video
                   mime_type:
                     type: string
                     example: video/mp4
+                  etag:
+                    type: string
+                    example: 2c1a57-15e4c6c4b52d7a40-27f206
+                  last_modified:
+                    type: string
+                    example: 2019-07-02T15:02:32+00:00
                   create_time:
                     type: string
                     example: 2019-07-02T15:02:32+00:00
@@ -772,6 +1114,33 @@ class DuplicateProject(MethodView):
                       thumbnails_timeline:
                         type: boolean
                         example: False
+                  progress:
+                    type: object
+                    description: Progress of running tasks, `null` if a task is not running
+                    properties:
+                      video:
+                        type: object
+                        properties:
+                          percent:
+                            type: number
+                            example: 42.5
+                          fps:
+                            type: number
+                            example: 96.3
+                          speed:
+                            type: number
+                            description: Processed seconds of video per second
+                            example: 3.85
+                          eta:
+                            type: number
+                            description: Estimated seconds until a task is finished
+                            example: 12.4
+                          updated:
+                            type: string
+                            example: 2019-07-02T15:02:32+00:00
+                      thumbnails_timeline:
+                        type: object
+                        example: null
                   thumbnails:
                     type: object
                     properties:
@@ -808,13 +1177,12 @@ class DuplicateProject(MethodView):
         }
         app.mongo.db.projects.insert_one(child_project)
 
-        # put a video file stream into storage
+        # copy a video file, storage shares content instead of writing it again
         try:
-            storage_id = app.fs.put(
-                content=app.fs.get(self.project['storage_id']),
+            storage_id = app.fs.copy(
+                src_storage_id=self.project['storage_id'],
                 filename=child_project['filename'],
-                project_id=child_project['_id'],
-                content_type=child_project['mime_type']
+                project_id=child_project['_id']
             )
         except Exception as e:
             # remove record from db
@@ -822,25 +1190,29 @@ class DuplicateProject(MethodView):
             raise InternalServerError(str(e))
 
         try:
-            # set 'storage_id' for child_project
+            # set 'storage_id' and http cache validators for child_project
             child_project = app.mongo.db.projects.find_one_and_update(
                 {'_id': child_project['_id']},
-                {'$set': {'storage_id': storage_id}},
+                {'$set': {'storage_id': storage_id, **app.fs.get_validators(storage_id)}},
                 return_document=ReturnDocument.AFTER
             )
+            # video is the same, so is its index
+            media_index = get_media_index(self.project['_id'])
+            if media_index:
+                save_media_index(child_project['_id'], media_index)
 
             # save preview thumbnail
             if self.project['thumbnails']['preview']:
-                storage_id = app.fs.put(
-                    content=app.fs.get(self.project['thumbnails']['preview']['storage_id']),
+                storage_id = app.fs.copy(
+                    src_storage_id=self.project['thumbnails']['preview']['storage_id'],
                     filename=self.project['thumbnails']['preview']['filename'],
                     project_id=None,
                     asset_type='thumbnails',
-                    storage_id=child_project['storage_id'],
-                    content_type=self.project['thumbnails']['preview']['mimetype']
+                    storage_id=child_project['storage_id']
                 )
                 child_project['thumbnails']['preview'] = self.project['thumbnails']['preview']
                 child_project['thumbnails']['preview']['storage_id'] = storage_id
+                child_project['thumbnails']['preview'].update(app.fs.get_validators(storage_id))
                 # set preview thumbnail in db
                 child_project = app.mongo.db.projects.find_one_and_update(
                     {'_id': child_project['_id']},
@@ -853,13 +1225,12 @@ class DuplicateProject(MethodView):
             # save timeline thumbnails
             timeline_thumbnails = []
             for thumbnail in self.project['thumbnails']['timeline']:
-                storage_id = app.fs.put(
-                    content=app.fs.get(thumbnail['storage_id']),
+                storage_id = app.fs.copy(
+                    src_storage_id=thumbnail['storage_id'],
                     filename=thumbnail['filename'],
                     project_id=None,
                     asset_type='thumbnails',
-                    storage_id=child_project['storage_id'],
-                    content_type=thumbnail['mimetype']
+                    storage_id=child_project['storage_id']
                 )
                 timeline_thumbnails.append({
                     'filename': thumbnail['filename'],
@@ -867,7 +1238,9 @@ class DuplicateProject(MethodView):
                     'mimetype': thumbnail['mimetype'],
                     'width': thumbnail['width'],
                     'height': thumbnail['height'],
-                    'size': thumbnail['size']
+                    'size': thumbnail['size'],
+                    'mode': thumbnail.get('mode', 'accurate'),
+                    **app.fs.get_validators(storage_id)
                 })
             if timeline_thumbnails:
                 child_project = app.mongo.db.projects.find_one_and_update(
@@ -883,6 +1256,7 @@ class DuplicateProject(MethodView):
             app.fs.delete_dir(storage_id)
             # remove record from db
             app.mongo.db.projects.delete_one({'_id': child_project['_id']})
+            save_media_index(child_project['_id'], None)
             raise InternalServerError(str(e))
 
         logger.info(f"Project was duplicated. Parent ID: {self.project['_id']}. Child ID: {child_project['_id']}")
@@ -892,6 +1266,319 @@ class DuplicateProject(MethodView):
         return json_response(child_project, status=201)
 
 
+class RetrieveApplyClearEdits(MethodView):
+
+    @property
+    def schema_edit(self):
+        # entries of an edit list are edits which are applied to a result of previous entries
+        schema = RetrieveEditDestroyProject().schema_edit
+        del schema['thumbnails']
+        return schema
+
+    def get(self, project_id):
+        """
+        Get project's edit list.
+        Edits are applied to a source video in order, only the first `position` edits are applied,
+        the rest can be reapplied by redo. Source video is never changed, `raw/video` serves a render of applied edits.
+        ---
+        parameters:
+        - in: path
+          name: project_id
+          type: string
+          required: True
+          description: Unique project id
+        responses:
+          200:
+            description: Edit list
+            schema:
+              type: object
+              properties:
+                list:
+                  type: array
+                  example:
+                    - trim:
+                        start: 2.0
+                        end: 10.0
+                    - scale: 640
+                position:
+                  type: integer
+                  example: 2
+        """
+
+        return json_response(self._get_edits(self.project))
+
+    def post(self, project_id):
+        """
+        Apply an edit, edits which were undone are dropped.
+        Edit is not rendered until `raw/video` is requested.
+        ---
+        consumes:
+        - application/json
+        parameters:
+        - in: path
+          name: project_id
+          type: string
+          required: True
+          description: Unique project id
+        - in: body
+          name: action
+          description: Edit rules, the same as for editing a project, they are applied to a result of previous edits
+          required: True
+          schema:
+            type: object
+            properties:
+              trim:
+                type: object
+                example: {"start": 2.0, "end": 10.0}
+              crop:
+                type: object
+                example: {"width": 480, "height": 360, "x": 10, "y": 10}
+              rotate:
+                type: integer
+                example: 90
+              scale:
+                type: integer
+                example: 640
+              profile:
+                type: string
+                example: fast
+        responses:
+          201:
+            description: Edit was applied
+            schema:
+              type: object
+              properties:
+                list:
+                  type: array
+                  example:
+                    - scale: 640
+                position:
+                  type: integer
+                  example: 1
+          409:
+            description: Video is processing or edit list was changed by another request
+            schema:
+              type: object
+              properties:
+                processing:
+                  type: array
+                  example:
+                    - Task edit video is still processing
+        """
+
+        request_json = request.get_json()
+        document = validate_document(
+            request_json if request_json else {},
+            self.schema_edit
+        )
+        edit = self._normalize_edit(document)
+        edits = self._get_edits(self.project)
+        applied = edits['list'][:edits['position']]
+        RetrieveEditDestroyProject._validate_edit(edit, self._get_edited_metadata(self.project['metadata'], applied))
+
+        self.project = self._update_edits(self.project, applied + [edit], len(applied) + 1)
+        save_activity_log("EDIT", self.project['_id'], edit)
+
+        return json_response(self._get_edits(self.project), status=201)
+
+    def delete(self, project_id):
+        """
+        Clear project's edit list, renders are kept in cache.
+        ---
+        parameters:
+        - in: path
+          name: project_id
+          type: string
+          required: True
+          description: Unique project id
+        responses:
+          204:
+            description: Edit list was cleared
+          409:
+            description: Video is processing or edit list was changed by another request
+            schema:
+              type: object
+              properties:
+                processing:
+                  type: array
+                  example:
+                    - Task edit video is still processing
+        """
+
+        self._update_edits(self.project, [], 0)
+        save_activity_log("CLEAR_EDITS", self.project['_id'])
+        return json_response(status=204)
+
+    @classmethod
+    def _update_edits(cls, project, edits, position):
+        """
+        Save an edit list of a project, it's not saved if it was changed by another request or while a video is
+        processed, a destructive edit clears an edit list when it's finished
+        :param project: project doc which a change was made for
+        :type project: dict
+        :param edits: edits
+        :type edits: list
+        :param position: number of applied edits
+        :type position: int
+        :return: updated project
+        :rtype: dict
+        """
+
+        if project['processing']['video']:
+            raise Conflict({"processing": ["Task edit video is still processing"]})
+
+        current_position = cls._get_edits(project)['position']
+        project = app.mongo.db.projects.find_one_and_update(
+            {
+                '_id': project['_id'],
+                'edits.position': current_position or {'$in': [0, None]},
+                'processing.video': False
+            },
+            {'$set': {'edits.list': edits, 'edits.position': position}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not project:
+            raise Conflict({"edits": ["Edit list was changed by another request or video is processing"]})
+        return project
+
+    @staticmethod
+    def _get_edits(project):
+        """
+        Get an edit list of a project, it's empty if project was never edited non-destructively
+        :param project: project doc
+        :type project: dict
+        :return: `list` of edits and `position`, a number of applied edits
+        :rtype: dict
+        """
+
+        edits = project.get('edits') or {}
+        return {'list': edits.get('list', []), 'position': edits.get('position', 0)}
+
+    @staticmethod
+    def _get_render(project):
+        """
+        Get a cached render of applied edits of a project's edit list
+        :param project: project doc
+        :type project: dict
+        :return: render doc, `None` if edits were not rendered yet
+        :rtype: dict
+        """
+
+        edits = project.get('edits') or {}
+        if not edits.get('source_sha256'):
+            # digest of a source is calculated by the first render
+            return None
+        key = get_render_key(edits['source_sha256'], edits['list'][:edits['position']])
+        return app.mongo.db.renders.find_one({'_id': key})
+
+    @staticmethod
+    def _normalize_edit(document):
+        """
+        Normalize an edit, so the same edits have the same render key
+        :param document: edit validated by `schema_edit`
+        :type document: dict
+        :return: edit
+        :rtype: dict
+        """
+
+        # empty crop is not an edit
+        edit = {key: value for key, value in document.items() if value}
+        if 'rotate' in edit:
+            # -90 and 270 is the same rotation
+            edit['rotate'] %= 360
+        if 'trim' in edit:
+            # 2 and 2.0 is the same position, snap is set only if it's used
+            edit['trim'] = {
+                'start': float(edit['trim']['start']),
+                'end': float(edit['trim']['end']),
+                **({'snap': True} if edit['trim'].get('snap') else {})
+            }
+        return edit
+
+    @staticmethod
+    def _get_edited_metadata(metadata, edits):
+        """
+        Predict dimensions and duration of a video after edits are applied, video is not rendered
+        :param metadata: metadata of a source video
+        :type metadata: dict
+        :param edits: applied edits
+        :type edits: list
+        :return: `width`, `height` and `duration`
+        :rtype: dict
+        """
+
+        width, height, duration = metadata['width'], metadata['height'], metadata['duration']
+        # the same order as a filter graph applies edits
+        for edit in edits:
+            if 'trim' in edit:
+                duration = edit['trim']['end'] - edit['trim']['start']
+            if 'crop' in edit:
+                width, height = edit['crop']['width'], edit['crop']['height']
+            if 'scale' in edit:
+                # height keeps aspect ratio and is even
+                width, height = edit['scale'], round(height * edit['scale'] / width / 2) * 2
+            if edit.get('rotate', 0) % 180:
+                width, height = height, width
+        return {'width': width, 'height': height, 'duration': duration}
+
+
+class UndoRedoEdit(MethodView):
+
+    def post(self, project_id, action):
+        """
+        Undo or redo the last edit of project's edit list, nothing is rendered, a render is cached already or
+        it's rendered on the next `raw/video` request.
+        ---
+        parameters:
+        - in: path
+          name: project_id
+          type: string
+          required: True
+          description: Unique project id
+        - in: path
+          name: action
+          type: string
+          enum: [undo, redo]
+          required: True
+        responses:
+          200:
+            description: Edit was undone or redone
+            schema:
+              type: object
+              properties:
+                list:
+                  type: array
+                  example:
+                    - scale: 640
+                position:
+                  type: integer
+                  example: 0
+          400:
+            description: There is nothing to undo or redo
+          409:
+            description: Video is processing or edit list was changed by another request
+            schema:
+              type: object
+              properties:
+                processing:
+                  type: array
+                  example:
+                    - Task edit video is still processing
+        """
+
+        if action not in ('undo', 'redo'):
+            raise NotFound(f"Action '{action}' does not exist.")
+        edits = RetrieveApplyClearEdits._get_edits(self.project)
+        position = edits['position'] + (1 if action == 'redo' else -1)
+        if not 0 <= position <= len(edits['list']):
+            raise BadRequest({"edits": [f"There is nothing to {action}."]})
+
+        self.project = RetrieveApplyClearEdits._update_edits(self.project, edits['list'], position)
+        save_activity_log(action.upper(), self.project['_id'])
+
+        return json_response(RetrieveApplyClearEdits._get_edits(self.project))
+
+
 class RetrieveOrCreateThumbnails(MethodView):
     SCHEMA_UPLOAD = {
         'file': {
@@ -920,7 +1607,7 @@ class RetrieveOrCreateThumbnails(MethodView):
                     {
                         'allowed': ['preview'],
                         'dependencies': ['position'],
-                        'excludes': 'amount',
+                        'excludes': ['amount', 'mode'],
                     }
                 ],
             },
@@ -929,6 +1616,10 @@ class RetrieveOrCreateThumbnails(MethodView):
                 'coerce': int,
                 'min': 1,
             },
+            'mode': {
+                'type': 'string',
+                'allowed': ['accurate', 'fast'],
+            },
             'position': {
                 'type': 'float',
                 'coerce': float,
@@ -989,6 +1680,14 @@ class RetrieveOrCreateThumbnails(MethodView):
           in: query
           type: integer
           description: Amount of thumbnails to generate for a timeline. Used only when `type` is `timeline`.
+        - name: mode
+          in: query
+          type: string
+          enum: [accurate, fast]
+          default: accurate
+          description: >
+            `accurate` captures frames exactly at evenly spaced positions, `fast` snaps every position to
+            the keyframe at or before it and decodes keyframes only. Used only when `type` is `timeline`.
         - name: position
           in: query
           type: float
@@ -1057,7 +1756,8 @@ class RetrieveOrCreateThumbnails(MethodView):
 
         if document['type'] == 'timeline':
             return self._get_timeline_thumbnails(
-                amount=document.get('amount', app.config.get('DEFAULT_TOTAL_TIMELINE_THUMBNAILS'))
+                amount=document.get('amount', app.config.get('DEFAULT_TOTAL_TIMELINE_THUMBNAILS')),
+                mode=document.get('mode', 'accurate')
             )
 
         return self._get_preview_thumbnail(document['position'], document.get('crop'), document.get('rotate', 0))
@@ -1096,6 +1796,12 @@ class RetrieveOrCreateThumbnails(MethodView):
                 mime_type:
                   type: string
                   example: video/mp4
+                etag:
+                  type: string
+                  example: 2c1a57-15e4c6c4b52d7a40-27f206
+                last_modified:
+                  type: string
+                  example: 2019-07-02T15:02:32+00:00
                 width:
                   type: integer
                   example: 640
@@ -1125,9 +1831,12 @@ class RetrieveOrCreateThumbnails(MethodView):
             raise BadRequest({"file": ["required field"]})
         document = validate_document(request.files, self.SCHEMA_UPLOAD)
 
-        # validate codec
-        file_stream = document['file'].stream.read()
-        metadata = get_video_editor().get_meta(file_stream)
+        # validate codec, supported images are recognized by a header
+        file_stream = document['file'].stream
+        metadata = get_image_meta(file_stream)
+        if metadata is None:
+            # probe it to tell what was uploaded
+            metadata = get_video_editor().get_meta_from_path(file_stream.name)
         if metadata.get('codec_name') not in app.config.get('CODEC_SUPPORT_IMAGE'):
             raise BadRequest({'file': [f"Codec: '{metadata.get('codec_name')}' is not supported."]})
 
@@ -1165,7 +1874,8 @@ class RetrieveOrCreateThumbnails(MethodView):
                     'width': metadata.get('width'),
                     'height': metadata.get('height'),
                     'size': metadata.get('size'),
-                    'position': 'custom'
+                    'position': 'custom',
+                    **app.fs.get_validators(storage_id)
                 }
             }},
             return_document=ReturnDocument.AFTER
@@ -1174,11 +1884,13 @@ class RetrieveOrCreateThumbnails(MethodView):
 
         return json_response(self.project['thumbnails']['preview'])
 
-    def _get_timeline_thumbnails(self, amount):
+    def _get_timeline_thumbnails(self, amount, mode='accurate'):
         """
         Get list or create thumbnails for timeline
         :param amount: amount of thumbnails
         :type amount: int
+        :param mode: capture mode, 'accurate' or 'fast'
+        :type mode: str
         :return: json response
         :rtype: flask.wrappers.Response
         """
@@ -1187,20 +1899,29 @@ class RetrieveOrCreateThumbnails(MethodView):
         # triggered by edit video right after it finished
         if self.project['processing']['video'] or self.project['processing']['thumbnails_timeline']:
             raise Conflict({"processing": ["Task get timeline thumbnails video is still processing"]})
-        # no need to generate thumbnails
-        elif amount == len(self.project['thumbnails']['timeline']):
+        # no need to generate thumbnails, accurate thumbnails are good for fast mode as well
+        elif amount == len(self.project['thumbnails']['timeline']) and (
+                mode == 'fast' or
+                all(thumbnail.get('mode', 'accurate') == 'accurate'
+                    for thumbnail in self.project['thumbnails']['timeline'])
+        ):
             return json_response(self.project['thumbnails']['timeline'])
         else:
             # set processing flag
+            job_id = str(uuid.uuid4())
             self.project = app.mongo.db.projects.find_one_and_update(
                 {'_id': self.project['_id']},
-                {'$set': {'processing.thumbnails_timeline': True}},
+                {'$set': {
+                    'processing.thumbnails_timeline': True,
+                    'progress.thumbnails_timeline': None,
+                    'jobs.thumbnails_timeline': job_id
+                }},
                 return_document=ReturnDocument.AFTER
             )
             # run task
-            generate_timeline_thumbnails.delay(
-                self.project,
-                amount
+            generate_timeline_thumbnails.apply_async(
+                args=(self.project, amount, mode),
+                task_id=job_id
             )
             return json_response({"processing": True}, status=202)
 
@@ -1237,17 +1958,16 @@ class RetrieveOrCreateThumbnails(MethodView):
             })
         else:
             # set processing flag
+            job_id = str(uuid.uuid4())
             self.project = app.mongo.db.projects.find_one_and_update(
                 {'_id': self.project['_id']},
-                {'$set': {'processing.thumbnail_preview': True}},
+                {'$set': {'processing.thumbnail_preview': True, 'jobs.thumbnail_preview': job_id}},
                 return_document=ReturnDocument.AFTER
             )
             # run task
-            generate_preview_thumbnail.delay(
-                self.project,
-                position,
-                crop,
-                rotate,
+            generate_preview_thumbnail.apply_async(
+                args=(self.project, position, crop, rotate),
+                task_id=job_id
             )
             return json_response({"processing": True}, status=202)
 
@@ -1256,13 +1976,22 @@ class GetRawVideo(MethodView):
     def get(self, project_id):
         """
         Get video stream.
-        If `HTTP_RANGE` header is specified - return chunked video stream, else full file.
+        If `Range` header is specified - return requested bytes of video stream, else full file.
+        Single range is returned as is, an open-ended range is limited by `MAX_RANGE_CHUNK_SIZE` bytes.
+        Multiple ranges are returned as `multipart/byteranges`.
+        If `t` is specified - return a range which starts at the keyframe at or before `t` seconds,
+        like an open-ended range, `Range` header is ignored.
+        If project has an edit list - return a render of applied edits, it's rendered on the first request.
         ---
         parameters:
         - in: path
           name: project_id
           type: string
           required: True
+        - in: query
+          name: t
+          type: number
+          description: position in seconds to seek to
         produces:
           - video/mp4
         responses:
@@ -1280,6 +2009,32 @@ class GetRawVideo(MethodView):
                 schema:
                   type: string
                   format: binary
+              multipart/byteranges:
+                schema:
+                  type: string
+                  format: binary
+            headers:
+              X-Keyframe-Time:
+                description: position of keyframe in seconds where a range starts, if `t` is specified
+                schema:
+                  type: number
+          202:
+            description: Applied edits of an edit list are being rendered, request video again when it's finished
+            schema:
+              type: object
+              properties:
+                processing:
+                  type: boolean
+                  example: True
+          400:
+            description: Invalid position
+            schema:
+              type: object
+              properties:
+                t:
+                  type: array
+                  example:
+                    - must be a non-negative number
           409:
             description: Timeline/preview task is still processing
             schema:
@@ -1289,24 +2044,56 @@ class GetRawVideo(MethodView):
                   type: array
                   example:
                     - Task edit video is still processing
+          416:
+            description: Requested range is not satisfiable
         """
 
         # video is processing
         if self.project['processing']['video']:
             raise Conflict({"processing": ["Task edit video is still processing"]})
 
+        video = self._get_video()
+        if not video:
+            return json_response({"processing": True}, status=202)
+
         # get stream file for video
-        video_range = request.headers.environ.get('HTTP_RANGE')
-        length = self.project['metadata'].get('size')
-        if video_range:
-            start = int(re.split('[= | -]', video_range)[1])
-            # TODO doublecheck streaming range
-            end = length - 1
+        length = video['metadata'].get('size')
+        validators = {
+            'etag': video.get('etag'),
+            'last_modified': video.get('last_modified')
+        }
+        ranges = None
+        headers = {}
+        # front server can't serve a range which is not in a request
+        offload = 't' not in request.args
+        if 't' in request.args:
+            keyframe_time, start = self._seek(request.args['t'], video)
+            headers['X-Keyframe-Time'] = str(keyframe_time)
+            ranges = parse_byte_ranges(f'bytes={start}-', length, app.config.get('MAX_RANGE_CHUNK_SIZE'))
+        elif is_range_fresh(**validators):
+            ranges = parse_byte_ranges(
+                request.headers.get('Range'),
+                length,
+                app.config.get('MAX_RANGE_CHUNK_SIZE')
+            )
+
+        if ranges and len(ranges) > 1:
+            return byteranges2response(
+                storage_id=video['storage_id'],
+                ranges=ranges,
+                size=length,
+                content_type=self.project.get("mime_type"),
+                **validators
+            )
+
+        if ranges:
+            start, end = ranges[0]
             chunksize = end - start + 1
 
             return storage2response(
-                storage_id=self.project['storage_id'],
+                storage_id=video['storage_id'],
                 headers={
+                    **headers,
                     'Content-Range': f'bytes {start}-{end}/{length}',
                     'Accept-Ranges': 'bytes',
                     'Content-Length': chunksize,
@@ -1314,16 +2101,81 @@ class GetRawVideo(MethodView):
                 },
                 status=206,
                 start=start,
-                length=chunksize
+                length=chunksize,
+                offload=offload,
+                **validators
             )
 
         return storage2response(
-            storage_id=self.project.get('storage_id'),
+            storage_id=video['storage_id'],
             headers={
+                'Accept-Ranges': 'bytes',
                 'Content-Length': length,
                 'Content-Type': self.project.get("mime_type"),
-            }
+            },
+            **validators
+        )
+
+    def _get_video(self):
+        """
+        Get a video to serve, it's a render of applied edits if project has an edit list, see `RetrieveApplyClearEdits`.
+        Rendering is started if applied edits were not rendered yet.
+        :return: `storage_id`, `metadata`, validators and `media_index_id` of a video,
+                 `None` if video is being rendered
+        :rtype: dict
+        """
+
+        edits = self.project.get('edits') or {}
+        if not edits.get('position'):
+            return {**self.project, 'media_index_id': self.project['_id']}
+
+        render = RetrieveApplyClearEdits._get_render(self.project)
+        if render:
+            return {**render, 'media_index_id': render['_id']}
+
+        # render lazily, source digest is calculated by a task if it's unknown
+        job_id = str(uuid.uuid4())
+        project = app.mongo.db.projects.find_one_and_update(
+            {'_id': self.project['_id'], 'processing.video': False},
+            {'$set': {'processing.video': True, 'progress.video': None, 'jobs.video': job_id}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not project:
+            # rendering was started by a concurrent request
+            return None
+        self.project = project
+        logger.info(f"Rendering of edit list was started. ID: {self.project['_id']}")
+        render_edits.apply_async(
+            args=(self.project,),
+            task_id=job_id
         )
+        return None
+
+    def _seek(self, position, video):
+        """
+        Find a byte offset of the keyframe at or before a position, using a keyframe index built at upload and edit.
+        Video is read from the start if it was not indexed.
+        :param position: position in seconds
+        :type position: str
+        :param video: video to seek, see `_get_video`
+        :type video: dict
+        :return: keyframe position in seconds, byte offset
+        :rtype: tuple
+        """
+
+        try:
+            position = float(position)
+        except ValueError:
+            position = -1
+        # `not` catches nan as well
+        if not position >= 0:
+            raise BadRequest({"t": ["must be a non-negative number"]})
+
+        media_index = get_media_index(video['media_index_id'], fields=('video.keyframe_offsets',))
+        keyframe = find_keyframe_offset(media_index['video'].get('keyframe_offsets') if media_index else None, position)
+        if not keyframe or keyframe[1] >= video['metadata'].get('size'):
+            return 0.0, 0
+        return keyframe
 
 
 class GetRawPreviewThumbnail(MethodView):
@@ -1353,9 +2205,15 @@ class GetRawPreviewThumbnail(MethodView):
         if not self.project['thumbnails']['preview']:
             raise NotFound()
 
+        thumbnail = self.project['thumbnails']['preview']
         return storage2response(
-            storage_id=self.project['thumbnails']['preview']['storage_id'],
-            headers={'Content-Type': self.project['thumbnails']['preview']['mimetype']}
+            storage_id=thumbnail['storage_id'],
+            headers={
+                'Content-Length': thumbnail['size'],
+                'Content-Type': thumbnail['mimetype']
+            },
+            etag=thumbnail.get('etag'),
+            last_modified=thumbnail.get('last_modified')
         )
 
 
@@ -1395,10 +2253,68 @@ class GetRawTimelineThumbnail(MethodView):
 
         return storage2response(
             storage_id=thumbnail['storage_id'],
-            headers={'Content-Type': thumbnail['mimetype']}
+            headers={
+                'Content-Length': thumbnail['size'],
+                'Content-Type': thumbnail['mimetype']
+            },
+            etag=thumbnail.get('etag'),
+            last_modified=thumbnail.get('last_modified')
         )
 
 
+class CancelProcessing(MethodView):
+
+    def delete(self, project_id, kind):
+        """
+        Cancel a running task of a project.
+        A queued task is revoked, a running media tool process is killed within a few seconds,
+        files created by the task are removed. Processing flag is reset immediately.
+        ---
+        parameters:
+        - in: path
+          name: project_id
+          type: string
+          required: True
+          description: Unique project id
+        - in: path
+          name: kind
+          type: string
+          enum: [video, thumbnails_timeline, thumbnail_preview]
+          required: True
+          description: Kind of task to cancel
+        responses:
+          204:
+            description: Task was cancelled
+          404:
+            description: Task is not running
+        """
+
+        if kind not in self.project['processing']:
+            raise NotFound(f"Task '{kind}' does not exist.")
+        if not self.project['processing'][kind]:
+            raise NotFound(f"Task '{kind}' is not running.")
+
+        # a running task checks its job id and stops when it's changed
+        job_id = self.project.get('jobs', {}).get(kind)
+        app.mongo.db.projects.update_one(
+            {'_id': self.project['_id']},
+            {'$set': {
+                f'processing.{kind}': False,
+                f'progress.{kind}': None,
+                f'jobs.{kind}': None
+            }}
+        )
+        if job_id and not app.config.get('CELERY_TASK_ALWAYS_EAGER'):
+            celery.control.revoke(job_id)
+        if kind == 'video' and job_id:
+            # segments which are encoded already, running segment tasks stop by a job id
+            delete_segments(job_id)
+        logger.info(f"Task '{kind}' was cancelled. ID: {self.project['_id']}")
+        save_activity_log("CANCEL", self.project['_id'], {'kind': kind})
+
+        return json_response(status=204)
+
+
 # register all urls
 bp.add_url_rule(
     '/',
@@ -1412,6 +2328,14 @@ bp.add_url_rule(
     '/<project_id>/duplicate',
     view_func=DuplicateProject.as_view('duplicate_project')
 )
+bp.add_url_rule(
+    '/<project_id>/edits',
+    view_func=RetrieveApplyClearEdits.as_view('retrieve_apply_clear_edits')
+)
+bp.add_url_rule(
+    '/<project_id>/edits/<action>',
+    view_func=UndoRedoEdit.as_view('undo_redo_edit')
+)
 bp.add_url_rule(
     '/<project_id>/thumbnails',
     view_func=RetrieveOrCreateThumbnails.as_view('retrieve_or_create_thumbnails')
@@ -1428,3 +2352,7 @@ bp.add_url_rule(
     '/<project_id>/raw/thumbnails/timeline/<int:index>',
     view_func=GetRawTimelineThumbnail.as_view('get_raw_timeline_thumbnail')
 )
+bp.add_url_rule(
+    '/<project_id>/processing/<kind>',
+    view_func=CancelProcessing.as_view('cancel_processing')
+)
@@ -1,110 +1,820 @@
 import logging
-from time import time
+import os
+from contextlib import ExitStack
+from datetime import datetime
+from time import monotonic, time
 
 from bson import ObjectId
+from celery import group
 from celery.exceptions import MaxRetriesExceededError
 from flask import current_app as app
 from pymongo import ReturnDocument
 
 from videoserver.celery_app import celery
 from videoserver.lib.video_editor import get_video_editor
+from videoserver.lib.utils import (
+    delete_segments, get_file_sha256, get_media_index, get_render_key, save_media_index
+)
+from videoserver.lib.video_editor.exceptions import ProcessCancelled, ProcessTimeout
 
 logger = logging.getLogger(__name__)
 
 
+def _get_cancel_check(project, kind):
+    """
+    Create a callable which tells if a processing job of a project was cancelled, see `CancelProcessing`.
+    Job is cancelled when a job id stored in `jobs.<kind>` of a project is changed.
+    :param project: project doc passed to a task
+    :type project: dict
+    :param kind: processing kind, e.g. 'video'
+    :type kind: str
+    :return: callable or `None` if project has no job id
+    :rtype: callable
+    """
+
+    job_id = project.get('jobs', {}).get(kind)
+    if not job_id:
+        return None
+    # collection is thread safe, unlike `app` which is bound to a task's thread
+    projects = app.mongo.db.projects
+
+    def is_cancelled():
+        return not projects.count_documents({'_id': ObjectId(project['_id']), f'jobs.{kind}': job_id}, limit=1)
+
+    return is_cancelled
+
+
+def _get_timeout(duration):
+    """
+    Get time limit of processing a video
+    :param duration: video's duration in seconds
+    :type duration: float
+    :return: timeout in seconds
+    :rtype: float
+    """
+
+    return app.config.get('FFMPEG_TIMEOUT_BASE') + app.config.get('FFMPEG_TIMEOUT_FACTOR') * (duration or 0)
+
+
+def _get_processing_load():
+    """
+    Get load of workers, edits which are processed at the same time share workers
+    :return: expected slowdown of an edit, 1.0 if there are enough workers
+    :rtype: float
+    """
+
+    processing = app.mongo.db.projects.count_documents({'processing.video': True})
+    return max(1.0, processing / app.config.get('FFMPEG_ADAPTIVE_WORKERS'))
+
+
+def _get_encoder_profile(project, changes, duration, load=None):
+    """
+    Pick encoder profile of an edit, the slowest profile which is expected to finish an edit
+    within `FFMPEG_TARGET_TURNAROUND` seconds is used, the fastest one if none of them does.
+    Expected time grows with duration and frame size of an edited video and with a number of edits
+    which are processed at the same time.
+    :param project: project doc passed to a task
+    :type project: dict
+    :param changes: changes apply to the video
+    :type changes: dict
+    :param duration: duration of edited video in seconds
+    :type duration: float
+    :param load: load of workers, see `_get_processing_load`, it's queried if `None`
+    :type load: float
+    :return: profile name, `None` if default profile must be used
+    :rtype: str
+    """
+
+    profile_speeds = app.config.get('FFMPEG_ADAPTIVE_PROFILE_SPEEDS')
+    if changes.get('profile') or not app.config.get('FFMPEG_ADAPTIVE_PROFILE') or not profile_speeds:
+        return changes.get('profile')
+
+    width, height = project['metadata'].get('width') or 0, project['metadata'].get('height') or 0
+    if changes.get('crop'):
+        width, height = changes['crop']['width'], changes['crop']['height']
+    if changes.get('scale') and width:
+        width, height = changes['scale'], height * changes['scale'] / width
+    # megapixel-seconds
+    work = (duration or 0) * width * height / 1e6
+    if load is None:
+        load = _get_processing_load()
+
+    for profile, speed in profile_speeds:
+        if work / speed * load <= app.config.get('FFMPEG_TARGET_TURNAROUND'):
+            break
+    else:
+        # none of profiles meets target turnaround
+        profile = profile_speeds[-1][0]
+    logger.info(f"Encoder profile '{profile}' was picked for project {project.get('_id')}: "
+                f"{work:.0f} megapixel-seconds, load {load:.1f}.")
+    return profile
+
+
+def _get_progress_callback(project_id, kind, duration):
+    """
+    Create a callback which saves a progress of ffmpeg into `progress.<kind>` of a project,
+    updates are throttled to one per `PROGRESS_UPDATE_INTERVAL` seconds.
+    :param project_id: project id
+    :type project_id: bson.objectid.ObjectId
+    :param kind: processing kind, e.g. 'video'
+    :type kind: str
+    :param duration: expected duration of processed video in seconds
+    :type duration: float
+    :return: progress callback for a video editor
+    :rtype: callable
+    """
+
+    last_update = None
+
+    def progress_callback(progress):
+        nonlocal last_update
+        now = monotonic()
+        if last_update is not None and now - last_update < app.config.get('PROGRESS_UPDATE_INTERVAL'):
+            return
+        last_update = now
+
+        out_time = min(progress['out_time'], duration) if duration else progress['out_time']
+        speed = progress.get('speed')
+        app.mongo.db.projects.update_one(
+            {'_id': ObjectId(project_id)},
+            {'$set': {f'progress.{kind}': {
+                'percent': round(out_time / duration * 100, 1) if duration else None,
+                'fps': progress.get('fps'),
+                'speed': speed,
+                'eta': round((duration - out_time) / speed, 1) if duration and speed else None,
+                'updated': datetime.utcnow(),
+            }}},
+            upsert=False
+        )
+
+    return progress_callback
+
+
+def _index_edited_video(video_editor, project, path_output):
+    """
+    Get media index of an edited or uploaded video, index is an optimization, so a task doesn't fail without it
+    :param video_editor: video editor
+    :type video_editor: VideoEditorInterface
+    :param project: project doc passed to a task
+    :type project: dict
+    :param path_output: edited video file path
+    :type path_output: str
+    :return: media index or `None`
+    :rtype: dict
+    """
+
+    try:
+        return video_editor.get_media_index_from_path(path_output)
+    except ProcessCancelled:
+        raise
+    except Exception as e:
+        logger.warning(f"Video of project {project.get('_id')} was not indexed: {e}")
+        return None
+
+
+def _put_edit_thumbnails(project, timeline_thumbnails, preview_thumbnail, preview_position):
+    """
+    Save thumbnails which were captured while editing into a storage
+    :param project: project doc passed to a task
+    :type project: dict
+    :param timeline_thumbnails: list of (file stream, metadata) of timeline thumbnails
+    :type timeline_thumbnails: list
+    :param preview_thumbnail: (file stream, metadata) of a preview thumbnail or `None`
+    :type preview_thumbnail: tuple
+    :param preview_position: position of a preview thumbnail
+    :type preview_position: float
+    :return: timeline thumbnail docs, preview thumbnail doc or `None`
+    :rtype: list, dict
+    """
+
+    name = project['filename'].rsplit('.', 1)[0]
+    # old thumbnails have the same names until an edit is saved
+    version = project['version'] + 1
+    thumbnails = [
+        (f"{name}_timeline_{count}-{len(timeline_thumbnails)}_v{version}", stream, meta)
+        for count, (stream, meta) in enumerate(timeline_thumbnails, 1)
+    ]
+    if preview_thumbnail:
+        thumbnails.append((f"{name}_preview-{preview_position}_v{version}", *preview_thumbnail))
+
+    docs = []
+    try:
+        for filename, stream, meta in thumbnails:
+            filename = f"{filename}.{app.config.get('CODEC_EXTENSION_MAP')[meta.get('codec_name')]}"
+            storage_id = app.fs.put(
+                content=stream,
+                filename=filename,
+                project_id=None,
+                asset_type='thumbnails',
+                storage_id=project['storage_id'],
+                content_type=meta.get('mimetype')
+            )
+            docs.append({
+                'filename': filename,
+                'storage_id': storage_id,
+                'mimetype': meta.get('mimetype'),
+                'width': meta.get('width'),
+                'height': meta.get('height'),
+                'size': meta.get('size'),
+                **app.fs.get_validators(storage_id)
+            })
+    except Exception:
+        for doc in docs:
+            app.fs.delete(doc['storage_id'])
+        raise
+
+    for doc in docs[:len(timeline_thumbnails)]:
+        doc['mode'] = 'accurate'
+    preview_doc = None
+    if preview_thumbnail:
+        preview_doc = {**docs.pop(), 'position': preview_position}
+    if thumbnails:
+        logger.info(f"Created and saved {len(docs)} timeline thumbnails and {int(bool(preview_doc))} preview thumbnail "
+                    f"to {app.fs.__class__.__name__} in project {project.get('_id')}.")
+    return docs, preview_doc
+
+
+def _delete_edit_thumbnails(timeline_thumbnails, preview_thumbnail):
+    """
+    Delete thumbnails of an edit which failed, see `_put_edit_thumbnails`
+    :param timeline_thumbnails: timeline thumbnail docs
+    :type timeline_thumbnails: list
+    :param preview_thumbnail: preview thumbnail doc or `None`
+    :type preview_thumbnail: dict
+    """
+
+    for thumbnail in [*timeline_thumbnails, *([preview_thumbnail] if preview_thumbnail else [])]:
+        app.fs.delete(thumbnail['storage_id'])
+
+
+def _reset_edit(project):
+    """
+    Reset processing flags of an edit which failed or didn't change a project's video
+    :param project: project doc passed to a task
+    :type project: dict
+    """
+
+    app.mongo.db.projects.update_one(
+        {'_id': ObjectId(project.get('_id'))},
+        {"$set": {
+            'processing.video': False,
+            'progress.video': None,
+            'jobs.video': None,
+        }},
+        upsert=False
+    )
+
+
+def _save_edit(project, metadata, media_index, timeline_thumbnails=None, preview_thumbnail=None):
+    """
+    Save an edited video into a project after its file was replaced in a storage
+    :param project: project doc passed to a task
+    :type project: dict
+    :param metadata: metadata of edited video
+    :type metadata: dict
+    :param media_index: media index of edited video
+    :type media_index: dict
+    :param timeline_thumbnails: timeline thumbnails of edited video, see `_put_edit_thumbnails`
+    :type timeline_thumbnails: list
+    :param preview_thumbnail: preview thumbnail of edited video, an old preview is kept if `None`
+    :type preview_thumbnail: dict
+    """
+
+    # delete old timeline thumbnails
+    old_timeline_thumbnails = project['thumbnails'].get('timeline', [])
+    for old_thumbnail in old_timeline_thumbnails:
+        app.fs.delete(old_thumbnail.get('storage_id'))
+    logger.info(f"Removed {len(old_timeline_thumbnails)} old thumbnails from {app.fs.__class__.__name__} "
+                f"in project {project.get('_id')}")
+
+    preview_update = {}
+    if preview_thumbnail:
+        if project['thumbnails'].get('preview'):
+            app.fs.delete(project['thumbnails']['preview'].get('storage_id'))
+        preview_update = {'thumbnails.preview': preview_thumbnail}
+
+    # update project record, a digest of edit list's source is not valid anymore
+    app.mongo.db.projects.find_one_and_update(
+        {'_id': project['_id']},
+        {'$set': {
+            'processing.video': False,
+            'progress.video': None,
+            'jobs.video': None,
+            'metadata': metadata,
+            'thumbnails.timeline': timeline_thumbnails or [],
+            **preview_update,
+            'version': project['version'] + 1,
+            **app.fs.get_validators(project['storage_id'])
+        }, '$unset': {'edits': ''}},
+        return_document=ReturnDocument.BEFORE
+    )
+    # index of a previous version is removed if edited video was not indexed
+    save_media_index(project['_id'], media_index)
+    logger.info(f"Finished editing for project {project.get('_id')}.")
+
+
 @celery.task(bind=True, default_retry_delay=10)
 def edit_video(self, project, changes):
     """
     Task use tool for edit video and record the data and update status after finished,
+    long edits are split into segments which are encoded by `encode_segment` tasks in parallel
     :param project: project doc
     :param changes: changes apply to the video
     """
 
     video_editor = get_video_editor()
+    thumbnails = changes.get('thumbnails') or {}
+    timeline_docs, preview_doc = [], None
 
     try:
-        # Use tool for editing video
-        edited_video_stream, metadata = video_editor.edit_video(
-            stream_file=app.fs.get(project['storage_id']),
-            filename=project['filename'],
-            **changes
+        ext = os.path.splitext(project['filename'])[1]
+        duration = changes['trim']['end'] - changes['trim']['start'] if changes.get('trim') \
+            else project['metadata']['duration']
+        changes = {**changes, 'profile': _get_encoder_profile(project, changes, duration)}
+        media_index = get_media_index(project['_id'])
+        segments = video_editor.plan_segments(
+            media_index,
+            trim=changes.get('trim'),
+            crop=changes.get('crop'),
+            rotate=changes.get('rotate'),
+            scale=changes.get('scale')
         )
+        if segments:
+            # there is no result backend for a chord, the last encoded segment starts `concat_segments`,
+            # job id is passed to segment tasks, so all of them share state of the same edit
+            job_id = project.get('jobs', {}).get('video') or self.request.id
+            app.mongo.db.segments.replace_one(
+                {'_id': job_id},
+                {'_id': job_id, 'project_id': project['_id'], 'count': len(segments), 'parts': {}, 'concat': False},
+                upsert=True
+            )
+            group(
+                encode_segment.s(project, changes, job_id, index, start, end)
+                for index, (start, end) in enumerate(segments)
+            ).apply_async()
+            logger.info(f"Editing was split into {len(segments)} segments for project {project.get('_id')}.")
+            return
 
-        app.fs.replace(
-            edited_video_stream,
-            project['storage_id'],
-            None
-        )
+        # Use tool for editing video, ffmpeg reads a source and writes an output into a staging file directly
+        with app.fs.local_file(project['storage_id']) as path_input, app.fs.staging_path(suffix=ext) as path_output, \
+                video_editor.watch(timeout=_get_timeout(project['metadata']['duration']),
+                                   is_cancelled=_get_cancel_check(project, 'video')):
+            # thumbnails are captured from edited frames, so an edited video is not decoded again
+            metadata, timeline_thumbnails, preview_thumbnail = video_editor.edit_video_with_thumbnails_from_path(
+                path_input=path_input,
+                path_output=path_output,
+                thumbnails_amount=thumbnails.get('timeline'),
+                preview_position=thumbnails.get('preview'),
+                progress_callback=_get_progress_callback(project['_id'], 'video', duration),
+                media_index=media_index,
+                **{key: value for key, value in changes.items() if key != 'thumbnails'}
+            )
+            media_index = _index_edited_video(video_editor, project, path_output)
+            timeline_docs, preview_doc = _put_edit_thumbnails(
+                project, timeline_thumbnails, preview_thumbnail, thumbnails.get('preview')
+            )
+            # storage moves a staged file instead of copying it when it's possible
+            with open(path_output, 'rb') as edited_video:
+                app.fs.replace(
+                    edited_video,
+                    project['storage_id'],
+                    project.get('mime_type')
+                )
         logger.info(f"Replaced file {project['storage_id']} in {app.fs.__class__.__name__} "
                     f"in project {project.get('_id')}")
     except Exception as exc:
+        # delete just saved thumbnails, video was not replaced
+        _delete_edit_thumbnails(timeline_docs, preview_doc)
+        if isinstance(exc, ProcessCancelled):
+            # processing flag was reset by a cancel request, staged files are removed already
+            logger.info(f"Editing was cancelled for project {project.get('_id')}.")
+            return
         logger.exception(exc)
         try:
+            if isinstance(exc, ProcessTimeout):
+                # the same video will exceed a time limit again
+                raise MaxRetriesExceededError()
             self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
         except MaxRetriesExceededError:
-            app.mongo.db.projects.update_one(
-                {'_id': ObjectId(project.get('_id'))},
-                {"$set": {
-                    'processing.video': False,
-                }},
-                upsert=False
-            )
+            _reset_edit(project)
     else:
-        # delete old timeline thumbnails
-        old_timeline_thumbnails = project['thumbnails'].get('timeline', [])
-        for old_thumbnail in old_timeline_thumbnails:
-            app.fs.delete(old_thumbnail.get('storage_id'))
-        logger.info(f"Removed {len(old_timeline_thumbnails)} old thumbnails from {app.fs.__class__.__name__} "
-                    f"in project {project.get('_id')}")
+        _save_edit(project, metadata, media_index, timeline_docs, preview_doc)
 
-        # update project record
-        app.mongo.db.projects.find_one_and_update(
-            {'_id': project['_id']},
-            {'$set': {
-                'processing.video': False,
-                'metadata': metadata,
-                'thumbnails.timeline': [],
-                'version': project['version'] + 1
-            }},
-            return_document=ReturnDocument.BEFORE
+
+@celery.task(bind=True, default_retry_delay=10)
+def encode_segment(self, project, changes, job_id, index, start, end):
+    """
+    Encode a segment of a segmented edit and save it into a storage, the last encoded segment starts
+    `concat_segments`. State of an edit is kept in `segments` collection by a job id.
+    :param project: project doc
+    :param changes: changes apply to the video
+    :param job_id: id of a segmented edit
+    :param index: segment number
+    :param start: segment start in seconds
+    :param end: segment end in seconds
+    """
+
+    video_editor = get_video_editor()
+    storage_id = None
+
+    try:
+        doc = app.mongo.db.segments.find_one({'_id': job_id})
+        if not doc:
+            raise ProcessCancelled('Edit was cancelled or failed.')
+        # segment which was delivered again is saved already
+        if str(index) not in doc['parts']:
+            ext = os.path.splitext(project['filename'])[1]
+            # storage which doesn't keep files locally provides a url, so a segment doesn't download an entire source
+            with app.fs.media_input(project['storage_id']) as path_input, \
+                    app.fs.staging_path(suffix=ext) as path_output, \
+                    video_editor.watch(timeout=_get_timeout(end - start),
+                                       is_cancelled=_get_cancel_check(project, 'video')):
+                video_editor.encode_segment_from_path(
+                    path_input=path_input,
+                    path_output=path_output,
+                    start=start,
+                    end=end,
+                    crop=changes.get('crop'),
+                    rotate=changes.get('rotate'),
+                    scale=changes.get('scale'),
+                    profile=changes.get('profile'),
+                    media_index=get_media_index(project['_id'])
+                )
+                with open(path_output, 'rb') as segment:
+                    storage_id = app.fs.put(
+                        content=segment,
+                        filename=f'{job_id}_{index}{ext}',
+                        project_id=None,
+                        asset_type='segments',
+                        storage_id=project['storage_id'],
+                        content_type=project.get('mime_type')
+                    )
+            doc = app.mongo.db.segments.find_one_and_update(
+                {'_id': job_id},
+                {'$set': {f'parts.{index}': storage_id}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not doc:
+                raise ProcessCancelled('Edit was cancelled or failed.')
+    except Exception as e:
+        if storage_id:
+            app.fs.delete(storage_id)
+        if isinstance(e, ProcessCancelled):
+            # processing flag was reset by a cancel request or another segment failed
+            logger.info(f"Encoding segment {index} was stopped for project {project.get('_id')}.")
+            return
+        logger.exception(e)
+        try:
+            if isinstance(e, ProcessTimeout):
+                # the same segment will exceed a time limit again
+                raise MaxRetriesExceededError()
+            self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
+        except MaxRetriesExceededError:
+            # other segments stop when they find out that edit is gone
+            _reset_edit(project)
+            delete_segments(job_id)
+    else:
+        logger.info(f"Encoded segment {index} of {doc['count']} for project {project.get('_id')}.")
+        # progress of a cancelled edit is not saved
+        app.mongo.db.projects.update_one(
+            {'_id': ObjectId(project['_id']), 'jobs.video': project.get('jobs', {}).get('video')},
+            {'$set': {'progress.video': {
+                'percent': round(len(doc['parts']) / doc['count'] * 100, 1),
+                'fps': None,
+                'speed': None,
+                'eta': None,
+                'updated': datetime.utcnow(),
+            }}},
+            upsert=False
         )
-        logger.info(f"Finished editing for project {project.get('_id')}.")
+        # the last part starts concat once, a segment which was delivered again doesn't start it twice
+        if len(doc['parts']) == doc['count'] and app.mongo.db.segments.find_one_and_update(
+                {'_id': job_id, 'concat': {'$ne': True}},
+                {'$set': {'concat': True}}
+        ):
+            concat_segments.delay(project, changes, job_id)
 
 
 @celery.task(bind=True, default_retry_delay=10)
-def generate_timeline_thumbnails(self, project, amount):
-    timeline_thumbnails = []
+def concat_segments(self, project, changes, job_id):
+    """
+    Join encoded segments of a segmented edit with stream copy and replace a project's video
+    :param project: project doc
+    :param changes: changes apply to the video
+    :param job_id: id of a segmented edit
+    """
+
     video_editor = get_video_editor()
+    thumbnails = changes.get('thumbnails') or {}
+    timeline_docs, preview_doc = [], None
 
     try:
-        thumbnails_generator = video_editor.capture_timeline_thumbnails(
-            stream_file=app.fs.get(project['storage_id']),
-            filename=project['filename'],
-            duration=project['metadata']['duration'],
-            thumbnails_amount=amount)
-
-        for count, (stream, meta) in enumerate(thumbnails_generator, 1):
-            ext = app.config.get('CODEC_EXTENSION_MAP')[meta.get('codec_name')]
-            filename = f"{project['filename'].rsplit('.', 1)[0]}_timeline_{count}-{amount}.{ext}"
-            # save to storage
+        doc = app.mongo.db.segments.find_one({'_id': job_id})
+        if not doc:
+            raise ProcessCancelled('Edit was cancelled or failed.')
+        ext = os.path.splitext(project['filename'])[1]
+        with ExitStack() as stack:
+            paths_segments = [
+                stack.enter_context(app.fs.local_file(doc['parts'][str(index)])) for index in range(doc['count'])
+            ]
+            path_input = stack.enter_context(app.fs.local_file(project['storage_id']))
+            path_output = stack.enter_context(app.fs.staging_path(suffix=ext))
+            stack.enter_context(video_editor.watch(timeout=_get_timeout(project['metadata']['duration']),
+                                                   is_cancelled=_get_cancel_check(project, 'video')))
+            metadata = video_editor.concat_segments_from_path(
+                paths_segments=paths_segments,
+                path_input=path_input,
+                path_output=path_output,
+                trim=changes.get('trim')
+            )
+            if project['metadata'].get('codec_name') in app.config.get('FFMPEG_ENCODER_PROFILES'):
+                metadata['encoder_profile'] = changes.get('profile') or app.config.get('FFMPEG_ENCODER_PROFILE')
+            media_index = _index_edited_video(video_editor, project, path_output)
+            # segments were encoded by different tasks, so thumbnails are captured from a joined video
+            timeline_thumbnails, preview_thumbnail = [], None
+            if thumbnails.get('timeline'):
+                timeline_thumbnails = list(video_editor.capture_timeline_thumbnails_from_path(
+                    path_output, metadata['duration'], thumbnails['timeline'], media_index=media_index
+                ))
+            if thumbnails.get('preview') is not None:
+                preview_thumbnail = video_editor.capture_thumbnail_from_path(
+                    path_output, metadata['duration'], thumbnails['preview']
+                )
+            timeline_docs, preview_doc = _put_edit_thumbnails(
+                project, timeline_thumbnails, preview_thumbnail, thumbnails.get('preview')
+            )
+            with open(path_output, 'rb') as edited_video:
+                app.fs.replace(
+                    edited_video,
+                    project['storage_id'],
+                    project.get('mime_type')
+                )
+        logger.info(f"Replaced file {project['storage_id']} in {app.fs.__class__.__name__} "
+                    f"in project {project.get('_id')}")
+    except ProcessCancelled:
+        logger.info(f"Editing was cancelled for project {project.get('_id')}.")
+        _delete_edit_thumbnails(timeline_docs, preview_doc)
+        delete_segments(job_id)
+    except Exception as exc:
+        logger.exception(exc)
+        _delete_edit_thumbnails(timeline_docs, preview_doc)
+        try:
+            self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
+        except MaxRetriesExceededError:
+            _reset_edit(project)
+            delete_segments(job_id)
+    else:
+        delete_segments(job_id)
+        _save_edit(project, metadata, media_index, timeline_docs, preview_doc)
+
+
+def _render_edit(video_editor, project, key, source, edit, load=None):
+    """
+    Render one edit of an edit list and save it into `renders` collection
+    :param video_editor: video editor
+    :type video_editor: VideoEditorInterface
+    :param project: project doc passed to a task
+    :type project: dict
+    :param key: render key, see `get_render_key`
+    :type key: str
+    :param source: render of previous edits or a project's video, with `storage_id`, `metadata` and `media_index_id`
+    :type source: dict
+    :param edit: edit to apply
+    :type edit: dict
+    :param load: load of workers, see `_get_processing_load`
+    :type load: float
+    :return: render doc
+    :rtype: dict
+    """
+
+    ext = os.path.splitext(project['filename'])[1]
+    metadata = source['metadata']
+    duration = edit['trim']['end'] - edit['trim']['start'] if edit.get('trim') else metadata['duration']
+    edit = {**edit, 'profile': _get_encoder_profile({**project, 'metadata': metadata}, edit, duration, load)}
+    with app.fs.local_file(source['storage_id']) as path_input, app.fs.staging_path(suffix=ext) as path_output, \
+            video_editor.watch(timeout=_get_timeout(metadata['duration']),
+                               is_cancelled=_get_cancel_check(project, 'video')):
+        metadata = video_editor.edit_video_from_path(
+            path_input=path_input,
+            path_output=path_output,
+            progress_callback=_get_progress_callback(project['_id'], 'video', duration),
+            media_index=get_media_index(source['media_index_id']),
+            **edit
+        )
+        media_index = _index_edited_video(video_editor, project, path_output)
+        with open(path_output, 'rb') as rendered_video:
+            # a render of the same key could be left by a failed task, timestamp keeps a filename unique
             storage_id = app.fs.put(
-                content=stream,
-                filename=filename,
+                content=rendered_video,
+                filename=f'{key}_{round(time() * 1000)}{ext}',
                 project_id=None,
-                asset_type='thumbnails',
+                asset_type='renders',
                 storage_id=project['storage_id'],
-                content_type=meta.get('mimetype')
+                content_type=project.get('mime_type')
+            )
+
+    render = {
+        '_id': key,
+        'project_id': project['_id'],
+        'storage_id': storage_id,
+        'metadata': metadata,
+        'create_time': datetime.utcnow(),
+        **app.fs.get_validators(storage_id)
+    }
+    app.mongo.db.renders.replace_one({'_id': key}, render, upsert=True)
+    save_media_index(key, media_index)
+    logger.info(f"Rendered edit list {key} for project {project.get('_id')}.")
+    return render
+
+
+@celery.task(bind=True, default_retry_delay=10)
+def render_edits(self, project):
+    """
+    Render applied edits of a project's edit list, a source video is not changed.
+    Every prefix of an edit list is rendered from a render of a shorter prefix and cached, so undo, redo and edit
+    lists which were rendered before by any project with the same source don't need rendering.
+    :param project: project doc
+    """
+
+    video_editor = get_video_editor()
+    edits = project['edits']['list'][:project['edits']['position']]
+
+    try:
+        source_sha256 = project['edits'].get('source_sha256')
+        if not source_sha256:
+            # source is not changed while a project has edits, so its digest is calculated once
+            with app.fs.local_file(project['storage_id']) as path_video:
+                source_sha256 = get_file_sha256(path_video)
+            app.mongo.db.projects.update_one(
+                {'_id': ObjectId(project['_id'])},
+                {'$set': {'edits.source_sha256': source_sha256}},
+                upsert=False
             )
-            timeline_thumbnails.append(
-                {
-                    'filename': filename,
-                    'storage_id': storage_id,
-                    'mimetype': meta.get('mimetype'),
-                    'width': meta.get('width'),
-                    'height': meta.get('height'),
-                    'size': meta.get('size')
-                }
+
+        source = {
+            'storage_id': project['storage_id'],
+            'metadata': project['metadata'],
+            'media_index_id': project['_id'],
+        }
+        # all renders of a task are encoded under the same load
+        load = None
+        for count in range(1, len(edits) + 1):
+            key = get_render_key(source_sha256, edits[:count])
+            render = app.mongo.db.renders.find_one({'_id': key})
+            if not render:
+                if load is None:
+                    load = _get_processing_load()
+                render = _render_edit(video_editor, project, key, source, edits[count - 1], load)
+            source = {**render, 'media_index_id': key}
+    except ProcessCancelled:
+        # processing flag was reset by a cancel request, renders of finished edits are kept
+        logger.info(f"Rendering was cancelled for project {project.get('_id')}.")
+    except Exception as exc:
+        logger.exception(exc)
+        try:
+            if isinstance(exc, ProcessTimeout):
+                # the same video will exceed a time limit again
+                raise MaxRetriesExceededError()
+            self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
+        except MaxRetriesExceededError:
+            _reset_edit(project)
+    else:
+        _reset_edit(project)
+        logger.info(f"Finished rendering of {len(edits)} edits for project {project.get('_id')}.")
+
+
+def _remux_faststart(video_editor, project, path_video, path_output):
+    """
+    Remux an uploaded mp4 or mov video which has `moov` atom after media data, so playback can start
+    without fetching a file tail. Remux is an optimization, indexing doesn't fail if video can't be remuxed.
+    :param video_editor: video editor
+    :type video_editor: VideoEditorInterface
+    :param project: project doc passed to a task
+    :type project: dict
+    :param path_video: uploaded video file path
+    :type path_video: str
+    :param path_output: path to write remuxed video to
+    :type path_output: str
+    :return: metadata of remuxed video with `source_sha256` of uploaded content or `None` if video was not remuxed
+    :rtype: dict
+    """
+
+    try:
+        metadata = video_editor.remux_faststart_from_path(path_video, path_output)
+    except ProcessCancelled:
+        raise
+    except Exception as e:
+        logger.warning(f"Video of project {project.get('_id')} was not remuxed to faststart: {e}")
+        return None
+
+    # storage knows a remuxed video only, keep a digest of uploaded content to link it by digest later
+    metadata['source_sha256'] = get_file_sha256(path_video)
+    return metadata
+
+
+@celery.task(bind=True, default_retry_delay=10)
+def index_video(self, project):
+    """
+    Index an uploaded video, so tasks and seeks don't need to probe it again.
+    Video which is processing is remuxed to faststart first, see `ListUploadProject.post`.
+    Media index is pending until the task is done.
+    :param project: project doc
+    """
+
+    video_editor = get_video_editor()
+    remux = project['processing']['video']
+    metadata = None
+
+    try:
+        ext = os.path.splitext(project['filename'])[1]
+        with app.fs.local_file(project['storage_id']) as path_video, app.fs.staging_path(suffix=ext) as path_output, \
+                video_editor.watch(timeout=_get_timeout(project['metadata']['duration']),
+                                   is_cancelled=_get_cancel_check(project, 'video')):
+            if remux:
+                metadata = _remux_faststart(video_editor, project, path_video, path_output)
+            # staged file can be moved into storage, so it's indexed first
+            media_index = _index_edited_video(video_editor, project, path_output if metadata else path_video)
+            if metadata:
+                # content can be shared with other files, replace only this file with a remuxed one
+                with open(path_output, 'rb') as content:
+                    app.fs.replace(content, project['storage_id'], project.get('mime_type'))
+    except Exception as exc:
+        if isinstance(exc, ProcessCancelled):
+            # processing flag was reset by a cancel request, uploaded video is kept
+            logger.info(f"Indexing was cancelled for project {project.get('_id')}.")
+            return
+        logger.exception(exc)
+        try:
+            if isinstance(exc, ProcessTimeout):
+                # the same video will exceed a time limit again
+                raise MaxRetriesExceededError()
+            self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
+        except MaxRetriesExceededError:
+            if remux:
+                _reset_edit(project)
+    else:
+        if remux:
+            update = {'metadata': metadata, **app.fs.get_validators(project['storage_id'])} if metadata else {}
+            app.mongo.db.projects.update_one(
+                {'_id': ObjectId(project.get('_id'))},
+                {'$set': {
+                    'processing.video': False,
+                    'progress.video': None,
+                    'jobs.video': None,
+                    **update
+                }},
+                upsert=False
             )
+        # video could be edited or project deleted while it was indexed
+        if app.mongo.db.projects.count_documents(
+                {'_id': ObjectId(project.get('_id')), 'version': project['version']}, limit=1):
+            save_media_index(project['_id'], media_index)
+        logger.info(f"Finished indexing for project {project.get('_id')}.")
+
+
+@celery.task(bind=True, default_retry_delay=10)
+def generate_timeline_thumbnails(self, project, amount, mode='accurate'):
+    timeline_thumbnails = []
+    video_editor = get_video_editor()
+
+    try:
+        with app.fs.local_file(project['storage_id']) as path_video, \
+                video_editor.watch(timeout=_get_timeout(project['metadata']['duration']),
+                                   is_cancelled=_get_cancel_check(project, 'thumbnails_timeline')):
+            thumbnails_generator = video_editor.capture_timeline_thumbnails_from_path(
+                path_video=path_video,
+                duration=project['metadata']['duration'],
+                thumbnails_amount=amount,
+                mode=mode,
+                progress_callback=_get_progress_callback(
+                    project['_id'], 'thumbnails_timeline', project['metadata']['duration']
+                ),
+                media_index=get_media_index(project['_id']))
+
+            for count, (stream, meta) in enumerate(thumbnails_generator, 1):
+                ext = app.config.get('CODEC_EXTENSION_MAP')[meta.get('codec_name')]
+                filename = f"{project['filename'].rsplit('.', 1)[0]}_timeline_{count}-{amount}.{ext}"
+                # save to storage
+                storage_id = app.fs.put(
+                    content=stream,
+                    filename=filename,
+                    project_id=None,
+                    asset_type='thumbnails',
+                    storage_id=project['storage_id'],
+                    content_type=meta.get('mimetype')
+                )
+                timeline_thumbnails.append(
+                    {
+                        'filename': filename,
+                        'storage_id': storage_id,
+                        'mimetype': meta.get('mimetype'),
+                        'width': meta.get('width'),
+                        'height': meta.get('height'),
+                        'size': meta.get('size'),
+                        'mode': mode,
+                        **app.fs.get_validators(storage_id)
+                    }
+                )
         logger.info(f"Created and saved {len(timeline_thumbnails)} thumbnails to {app.fs.__class__.__name__} "
                     f"in project {project.get('_id')}.")
     except Exception as e:
@@ -113,15 +823,24 @@ def generate_timeline_thumbnails(self, project, amount):
             app.fs.delete(thumbnail.get('storage_id'))
         logger.info(f"Due to exception, {len(timeline_thumbnails)} just created thumbnails were removed from "
                     f"{app.fs.__class__.__name__} in project {project.get('_id')}")
+        if isinstance(e, ProcessCancelled):
+            # processing flag was reset by a cancel request
+            logger.info(f"Capturing timeline thumbnails was cancelled for project {project.get('_id')}.")
+            return
         logger.exception(e)
 
         try:
+            if isinstance(e, ProcessTimeout):
+                # the same video will exceed a time limit again
+                raise MaxRetriesExceededError()
             raise self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
         except MaxRetriesExceededError:
             app.mongo.db.projects.update_one(
                 {'_id': ObjectId(project.get('_id'))},
                 {"$set": {
                     'processing.thumbnails_timeline': False,
+                    'progress.thumbnails_timeline': None,
+                    'jobs.thumbnails_timeline': None,
                 }},
                 upsert=False
             )
@@ -139,6 +858,8 @@ def generate_timeline_thumbnails(self, project, amount):
             {"$set": {
                 'thumbnails.timeline': timeline_thumbnails,
                 'processing.thumbnails_timeline': False,
+                'progress.thumbnails_timeline': None,
+                'jobs.thumbnails_timeline': None,
             }},
             upsert=False
         )
@@ -151,14 +872,16 @@ def generate_preview_thumbnail(self, project, position, crop, rotate):
     preview_thumbnail = None
 
     try:
-        stream, meta = video_editor.capture_thumbnail(
-            stream_file=app.fs.get(project['storage_id']),
-            filename=project['filename'],
-            duration=project['metadata']['duration'],
-            position=position,
-            crop=crop,
-            rotate=rotate,
-        )
+        with app.fs.local_file(project['storage_id']) as path_video, \
+                video_editor.watch(timeout=_get_timeout(0),
+                                   is_cancelled=_get_cancel_check(project, 'thumbnail_preview')):
+            stream, meta = video_editor.capture_thumbnail_from_path(
+                path_video=path_video,
+                duration=project['metadata']['duration'],
+                position=position,
+                crop=crop,
+                rotate=rotate,
+            )
         # Generate _id to ensure filename is unique, avoid fs.put raises error,
         # use of fs.replace will lead to lost original thumbnail if an error is occured
         _id = round(time() * 1000)
@@ -182,7 +905,8 @@ def generate_preview_thumbnail(self, project, position, crop, rotate):
             'width': meta.get('width'),
             'height': meta.get('height'),
             'size': meta.get('size'),
-            'position': position
+            'position': position,
+            **app.fs.get_validators(storage_id)
         }
     except Exception as e:
         # delete just saved file
@@ -190,15 +914,23 @@ def generate_preview_thumbnail(self, project, position, crop, rotate):
             app.fs.delete(preview_thumbnail.get('storage_id'))
             logger.info(f"Due to exception, just created preview thumbnail at position {position} was removed from "
                         f"{app.fs.__class__.__name__} in project {project.get('_id')}")
+        if isinstance(e, ProcessCancelled):
+            # processing flag was reset by a cancel request
+            logger.info(f"Capturing preview thumbnail was cancelled for project {project.get('_id')}.")
+            return
         logger.exception(e)
 
         try:
+            if isinstance(e, ProcessTimeout):
+                # the same video will exceed a time limit again
+                raise MaxRetriesExceededError()
             raise self.retry(max_retries=app.config.get('MAX_RETRIES', 3))
         except MaxRetriesExceededError:
             app.mongo.db.projects.update_one(
                 {'_id': ObjectId(project.get('_id'))},
                 {"$set": {
                     'processing.thumbnail_preview': False,
+                    'jobs.thumbnail_preview': None,
                 }},
                 upsert=False
             )
@@ -215,6 +947,7 @@ def generate_preview_thumbnail(self, project, position, crop, rotate):
             {"$set": {
                 'thumbnails.preview': preview_thumbnail,
                 'processing.thumbnail_preview': False,
+                'jobs.thumbnail_preview': None,
             }},
             upsert=False
         )
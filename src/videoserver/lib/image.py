@@ -0,0 +1,123 @@
+import io
+import os
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SOI = b'\xff\xd8'
+BMP_SIGNATURE = b'BM'
+
+#: JPEG start of frame markers, they hold image dimensions
+# https://www.w3.org/Graphics/JPEG/itu-t81.pdf, table B.1
+JPEG_SOF_MARKERS = {0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+#: JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xd0, 0xd9)}
+
+#: codec names are the same as ffprobe reports
+MIMETYPES = {
+    'png': 'image/png',
+    'mjpeg': 'image/jpeg',
+    'bmp': 'image/bmp',
+}
+
+
+def get_image_meta(image):
+    """
+    Get metadata of png, jpeg or bmp image by parsing its header, the rest of image is not read.
+    :param image: image content or file-like object opened in binary mode
+    :type image: bytes or file-like object
+    :return: metadata with `codec_name`, `width`, `height`, `size` and `mimetype` keys,
+             `None` if image format is not recognized or header is broken
+    :rtype: dict
+    """
+
+    fp = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+    fp.seek(0)
+    signature = fp.read(8)
+
+    try:
+        if signature == PNG_SIGNATURE:
+            codec_name = 'png'
+            width, height = _read_png_size(fp)
+        elif signature[:2] == JPEG_SOI:
+            codec_name = 'mjpeg'
+            width, height = _read_jpeg_size(fp)
+        elif signature[:2] == BMP_SIGNATURE:
+            codec_name = 'bmp'
+            width, height = _read_bmp_size(fp)
+        else:
+            return None
+    except (struct.error, ValueError):
+        return None
+
+    return {
+        'codec_name': codec_name,
+        'width': width,
+        'height': height,
+        'size': fp.seek(0, os.SEEK_END),
+        'mimetype': MIMETYPES[codec_name],
+    }
+
+
+def _read_png_size(fp):
+    """
+    Read dimensions from IHDR chunk, it must be the first chunk.
+    :param fp: image file positioned after a signature
+    :return: width, height
+    :rtype: tuple
+    """
+
+    length, chunk_type, width, height = struct.unpack('>I4sII', fp.read(16))
+    if chunk_type != b'IHDR' or length != 13:
+        raise ValueError('IHDR chunk was not found.')
+    return width, height
+
+
+def _read_jpeg_size(fp):
+    """
+    Walk JPEG segments until a start of frame segment, other segments are skipped without reading them.
+    :param fp: image file
+    :return: width, height
+    :rtype: tuple
+    """
+
+    fp.seek(2)
+    while True:
+        byte = fp.read(1)
+        if not byte:
+            raise ValueError('Start of frame segment was not found.')
+        if byte != b'\xff':
+            raise ValueError('Segment marker was expected.')
+        marker = fp.read(1)
+        # markers can be padded with any number of 0xff
+        while marker == b'\xff':
+            marker = fp.read(1)
+        if not marker:
+            raise ValueError('Start of frame segment was not found.')
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+
+        length, = struct.unpack('>H', fp.read(2))
+        if marker in JPEG_SOF_MARKERS:
+            _precision, height, width = struct.unpack('>BHH', fp.read(5))
+            return width, height
+        fp.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_bmp_size(fp):
+    """
+    Read dimensions from DIB header.
+    :param fp: image file positioned after a signature
+    :return: width, height
+    :rtype: tuple
+    """
+
+    fp.seek(14)
+    header_size, = struct.unpack('<I', fp.read(4))
+    if header_size == 12:
+        # BITMAPCOREHEADER
+        width, height = struct.unpack('<HH', fp.read(4))
+    else:
+        # BITMAPINFOHEADER and later versions, height is negative for top-down images
+        width, height = struct.unpack('<ii', fp.read(8))
+    return abs(width), abs(height)
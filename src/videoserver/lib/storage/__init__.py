@@ -1,3 +1,4 @@
+from .amazon_s3_storage import AmazonS3Storage
 from .file_system_storage import FileSystemStorage
 
 
@@ -8,5 +9,5 @@ def get_media_storage(name):
     if str.lower(name) == 'filesystem':
         return FileSystemStorage()
     if str.lower(name) == 'amazon':
-        return None
+        return AmazonS3Storage()
     return None
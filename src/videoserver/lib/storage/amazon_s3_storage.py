@@ -0,0 +1,470 @@
+import io
+import logging
+import os
+import tempfile
+import uuid
+from contextlib import closing, contextmanager
+from datetime import timezone
+
+from flask import current_app as app
+
+from .interface import MediaStorageInterface
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+
+class AmazonS3Storage(MediaStorageInterface):
+    """
+    Amazon S3 storage.
+    Use Amazon S3 or any S3 compatible object storage (MinIO, Ceph, etc) to store files.
+
+    Storage ids are used as object keys, so the layout is the same as in `FileSystemStorage`.
+    Requires `boto3`, install it with `pip install videoserver[amazon]`.
+    """
+
+    #: max number of keys which can be deleted by a single `DeleteObjects` request
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(self):
+        if boto3 is None:
+            raise RuntimeError("'boto3' is required for 'amazon' media storage, "
+                               "install it with 'pip install videoserver[amazon]'.")
+        self._client = None
+
+    @property
+    def client(self):
+        """
+        S3 client, created once per storage instance.
+        Client keeps a pool of http connections, pool size is `AMAZON_S3_MAX_POOL_CONNECTIONS`.
+        """
+
+        if self._client is None:
+            self._client = boto3.client(
+                's3',
+                aws_access_key_id=app.config.get('AMAZON_ACCESS_KEY_ID') or None,
+                aws_secret_access_key=app.config.get('AMAZON_SECRET_ACCESS_KEY') or None,
+                region_name=app.config.get('AMAZON_REGION') or None,
+                endpoint_url=app.config.get('AMAZON_ENDPOINT_URL') or None,
+                config=Config(
+                    max_pool_connections=app.config.get('AMAZON_S3_MAX_POOL_CONNECTIONS'),
+                    retries={'max_attempts': app.config.get('MAX_RETRIES')}
+                )
+            )
+        return self._client
+
+    @property
+    def bucket(self):
+        return app.config.get('AMAZON_CONTAINER_NAME')
+
+    @staticmethod
+    def _transfer_config():
+        """
+        Upload config, files bigger than `AMAZON_S3_MULTIPART_THRESHOLD` are uploaded by parallel multipart upload.
+        """
+
+        return TransferConfig(
+            multipart_threshold=app.config.get('AMAZON_S3_MULTIPART_THRESHOLD'),
+            multipart_chunksize=app.config.get('AMAZON_S3_MULTIPART_CHUNKSIZE'),
+            max_concurrency=app.config.get('AMAZON_S3_MAX_CONCURRENCY'),
+        )
+
+    @staticmethod
+    def _is_not_found(error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def _get_object(self, storage_id, start=0, length=None):
+        """
+        Request an object or its byte range.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :param start: start file's position to read
+        :type start: int
+        :param length: the number of bytes to be read from the file, read until the end if `None`
+        :type length: int
+        :return: `GetObject` response
+        :rtype: dict
+        :raise: `FileNotFoundError` if object doesn't exist
+        """
+
+        kwargs = {'Bucket': self.bucket, 'Key': storage_id}
+        if start or length is not None:
+            end = '' if length is None else start + length - 1
+            kwargs['Range'] = f'bytes={start}-{end}'
+
+        try:
+            return self.client.get_object(**kwargs)
+        except ClientError as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(f"Object '{storage_id}' was not found in bucket '{self.bucket}'.")
+            raise e
+
+    def _exists(self, storage_id):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=storage_id)
+        except ClientError as e:
+            if self._is_not_found(e):
+                return False
+            raise e
+        return True
+
+    def _upload(self, content, storage_id, content_type=None):
+        """
+        Upload `content` using multipart upload if it's big enough.
+        :param content: file to save
+        :type content: bytes or file-like object
+        :param storage_id: unique starage id of file
+        :type storage_id: str
+        :param content_type: content type of file
+        :type content_type: str
+        """
+
+        if isinstance(content, (bytes, bytearray)):
+            fileobj = io.BytesIO(content)
+        else:
+            fileobj = content
+            fileobj.seek(0)
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket,
+            storage_id,
+            ExtraArgs=extra_args,
+            Config=self._transfer_config()
+        )
+
+    def get(self, storage_id):
+        """
+        Read and return a file based on `storage_id`
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file
+        :rtype: bytes
+        """
+
+        try:
+            with closing(self._get_object(storage_id)['Body']) as body:
+                return body.read()
+        except Exception as e:
+            logger.error(f'AmazonS3Storage:get:{storage_id}: {e}')
+            raise e
+
+    def get_range(self, storage_id, start, length):
+        """
+        Read and return a file's chunks based on `storage_id`, uses native S3 ranged GET
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :param start: start file's position to read
+        :param length: the number of bytes to be read from the file
+        :return: file
+        :rtype: bytes
+        """
+
+        if length <= 0:
+            return b''
+
+        try:
+            with closing(self._get_object(storage_id, start, length)['Body']) as body:
+                return body.read()
+        except ClientError as e:
+            # start is outside of the file, behave like a regular file
+            if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+                return b''
+            logger.error(f'AmazonS3Storage:get_range:{storage_id}: {e}')
+            raise e
+        except Exception as e:
+            logger.error(f'AmazonS3Storage:get_range:{storage_id}: {e}')
+            raise e
+
+    def get_stream(self, storage_id, start=0, length=None, chunk_size=None):
+        """
+        Request a file based on `storage_id` and return an iterator over its chunks.
+        The object is requested eagerly, so a missing file raises before a response is started.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :param start: start file's position to read
+        :type start: int
+        :param length: the number of bytes to be read from the file, read until the end if `None`
+        :type length: int
+        :param chunk_size: max size of a single chunk, `STREAM_CHUNK_SIZE` is used if `None`
+        :type chunk_size: int
+        :return: file chunks
+        :rtype: generator
+        """
+
+        if not chunk_size:
+            chunk_size = app.config.get('STREAM_CHUNK_SIZE')
+
+        try:
+            body = self._get_object(storage_id, start, length)['Body']
+        except Exception as e:
+            logger.error(f'AmazonS3Storage:get_stream:{storage_id}: {e}')
+            raise e
+
+        return self._iter_body(body, chunk_size)
+
+    @staticmethod
+    def _iter_body(body, chunk_size):
+        """
+        Read `body` by chunks and close it when finished, connection is returned to the pool.
+        Doesn't use an app context, so it's safe to consume it after a request was handled.
+        :param body: body of `GetObject` response
+        :type body: botocore.response.StreamingBody
+        :param chunk_size: max size of a single chunk
+        :type chunk_size: int
+        :return: file chunks
+        :rtype: generator
+        """
+
+        with closing(body):
+            yield from body.iter_chunks(chunk_size)
+
+    def get_local_path(self, storage_id):
+        """
+        Objects are not accessible via local file system.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: `None`
+        """
+
+        return None
+
+    @contextmanager
+    def local_file(self, storage_id):
+        """
+        Download an object into a temporary file, using parallel ranged GETs for big objects.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path
+        :rtype: str
+        :raise: `FileNotFoundError` if object doesn't exist
+        """
+
+        with self.staging_path(suffix=os.path.splitext(storage_id)[1]) as file_path:
+            try:
+                self.client.download_file(self.bucket, storage_id, file_path, Config=self._transfer_config())
+            except ClientError as e:
+                logger.error(f'AmazonS3Storage:local_file:{storage_id}: {e}')
+                if self._is_not_found(e):
+                    raise FileNotFoundError(f"Object '{storage_id}' was not found in bucket '{self.bucket}'.")
+                raise e
+            yield file_path
+
+    @contextmanager
+    def media_input(self, storage_id):
+        """
+        Provide a presigned URL of an object, media tools request only byte ranges they read.
+        Object is downloaded into a temporary file if `AMAZON_S3_PRESIGNED_URL_EXPIRES` is 0.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: URL or file path
+        :rtype: str
+        :raise: `FileNotFoundError` if object doesn't exist
+        """
+
+        expires = app.config.get('AMAZON_S3_PRESIGNED_URL_EXPIRES')
+        if not expires:
+            with self.local_file(storage_id) as file_path:
+                yield file_path
+            return
+
+        if not self._exists(storage_id):
+            raise FileNotFoundError(f"Object '{storage_id}' was not found in bucket '{self.bucket}'.")
+        yield self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': storage_id},
+            ExpiresIn=expires
+        )
+
+    @contextmanager
+    def staging_path(self, suffix=''):
+        """
+        Provide a path of a temporary file in `UPLOAD_TMP_DIR`, it's uploaded from there.
+        :param suffix: the file name will end with that suffix
+        :type suffix: str
+        :return: file path, file doesn't exist
+        :rtype: str
+        """
+
+        tmp_dir = app.config.get('UPLOAD_TMP_DIR') or tempfile.gettempdir()
+        file_path = os.path.join(tmp_dir, f'{uuid.uuid4().hex}{suffix}')
+        try:
+            yield file_path
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def get_validators(self, storage_id):
+        """
+        Return http cache validators of a file, S3 ETag and LastModified of the object are used.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: dict with `etag` (str) and `last_modified` (datetime in UTC) keys
+        :rtype: dict
+        """
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=storage_id)
+        except Exception as e:
+            logger.error(f'AmazonS3Storage:get_validators:{storage_id}: {e}')
+            raise e
+
+        return {
+            'etag': head['ETag'].strip('"'),
+            'last_modified': head['LastModified'].astimezone(timezone.utc).replace(tzinfo=None, microsecond=0),
+        }
+
+    def put(self, content, filename, project_id=None, asset_type='project', storage_id=None, content_type=None):
+        """
+        Save file into a S3 bucket.
+        See `MediaStorageInterface._make_storage_id` for a storage id layout.
+
+        :param content: file to save
+        :type content: bytes or file-like object
+        :param filename: name which will be used when store a file
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of file
+        :type storage_id: str
+        :param content_type: content type of file
+        :type content_type: str
+        :return: storage id of just saved file
+        :rtype: str
+        """
+
+        storage_id = self._make_storage_id(filename, project_id, asset_type, storage_id)
+        if self._exists(storage_id):
+            raise Exception(f'Object {storage_id} already exists, use "replace" method instead.')
+
+        try:
+            self._upload(content, storage_id, content_type)
+        except Exception as e:
+            logger.error(f'AmazonS3Storage:put:{storage_id}: {e}')
+            raise e
+
+        logger.info(f"Saved file '{storage_id}' to s3 storage")
+        return storage_id
+
+    def replace(self, content, storage_id, content_type=None):
+        """
+        Replace a file in the storage
+        :param content: file to replace with
+        :type content: bytes or file-like object
+        :param storage_id: starage id of file for replacement
+        :type storage_id: str
+        :param content_type: content type of file
+        :type content_type: str
+        """
+
+        try:
+            self._upload(content, storage_id, content_type)
+        except Exception as e:
+            logger.error(f'AmazonS3Storage:replace:{storage_id}: {e}')
+            raise e
+        else:
+            logger.info(f'Replaced file "{storage_id}" in s3 storage')
+
+    def copy(self, src_storage_id, filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Copy an object on the S3 side, content is not transferred through the server.
+        Objects bigger than `AMAZON_S3_MULTIPART_THRESHOLD` are copied by parallel multipart copy.
+        :param src_storage_id: starage id of file to copy
+        :type src_storage_id: str
+        :param filename: name which will be used when store a copy
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: storage id of a copy
+        :rtype: str
+        """
+
+        storage_id = self._make_storage_id(filename, project_id, asset_type, storage_id)
+        if self._exists(storage_id):
+            raise Exception(f'Object {storage_id} already exists, use "replace" method instead.')
+
+        try:
+            self.client.copy(
+                {'Bucket': self.bucket, 'Key': src_storage_id},
+                self.bucket,
+                storage_id,
+                Config=self._transfer_config()
+            )
+        except ClientError as e:
+            logger.error(f'AmazonS3Storage:copy:{src_storage_id}: {e}')
+            if self._is_not_found(e):
+                raise FileNotFoundError(f"Object '{src_storage_id}' was not found in bucket '{self.bucket}'.")
+            raise e
+
+        logger.info(f"Copied object '{src_storage_id}' to '{storage_id}' in s3 storage")
+        return storage_id
+
+    def put_by_digest(self, digest, filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Objects are not content addressed, content must be uploaded.
+        :param digest: sha256 hex digest of file content
+        :type digest: str
+        :param filename: name which will be used when store a file
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: `None`
+        """
+
+        return None
+
+    def delete(self, storage_id):
+        """
+        Delete a file from the storage
+        :param storage_id: starage id of file to remove
+        :type storage_id: str
+        """
+
+        self.client.delete_object(Bucket=self.bucket, Key=storage_id)
+        logger.info(f"Removed '{storage_id}' from s3 storage")
+
+    def delete_dir(self, storage_id):
+        """
+        Delete all objects which share a key prefix with a `storage_id`, using batch deletes
+        :param storage_id: unique storage
+        :type storage_id: str
+        """
+
+        prefix = f'{os.path.dirname(storage_id)}/'
+        paginator = self.client.get_paginator('list_objects_v2')
+        deleted = 0
+
+        for page in paginator.paginate(
+                Bucket=self.bucket,
+                Prefix=prefix,
+                PaginationConfig={'PageSize': self.DELETE_BATCH_SIZE}
+        ):
+            keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if not keys:
+                continue
+            resp = self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys, 'Quiet': True})
+            for error in resp.get('Errors', []):
+                logger.error(f"AmazonS3Storage:delete_dir:{error.get('Key')}: {error.get('Message')}")
+            deleted += len(keys) - len(resp.get('Errors', []))
+
+        if deleted:
+            logger.info(f"Removed {deleted} objects with prefix '{prefix}' from s3 storage")
+        else:
+            logger.warning(f"Objects with prefix '{prefix}' were not found in s3 storage.")
@@ -1,6 +1,10 @@
+import hashlib
 import os
 import shutil
+import string
 import logging
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 
 from flask import current_app as app
@@ -14,8 +18,14 @@ class FileSystemStorage(MediaStorageInterface):
     """
     File system storage.
     Use file system to store files.
+
+    Content is kept in content addressed blobs, files of the storage are hard links to them, so identical files
+    and copies share a blob. Blob is removed when the last file linked to it is removed.
     """
 
+    #: directory in a storage root where blobs are kept
+    BLOBS_DIR = '.blobs'
+
     @staticmethod
     def _get_file_path(storage_id):
         """
@@ -67,6 +77,319 @@ class FileSystemStorage(MediaStorageInterface):
 
         return media_file
 
+    def get_stream(self, storage_id, start=0, length=None, chunk_size=None):
+        """
+        Open a file based on `storage_id` and return an iterator over its chunks.
+        The file is opened eagerly, so a missing file raises before a response is started.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :param start: start file's position to read
+        :type start: int
+        :param length: the number of bytes to be read from the file, read until the end if `None`
+        :type length: int
+        :param chunk_size: max size of a single chunk, `STREAM_CHUNK_SIZE` is used if `None`
+        :type chunk_size: int
+        :return: file chunks
+        :rtype: generator
+        """
+
+        if not chunk_size:
+            chunk_size = app.config.get('STREAM_CHUNK_SIZE')
+
+        try:
+            rb = open(self._get_file_path(storage_id), 'rb')
+            if start:
+                rb.seek(start)
+        except Exception as e:
+            logger.error(f'FileSystemStorage:get_stream:{storage_id}: {e}')
+            raise e
+
+        return self._iter_file(rb, length, chunk_size)
+
+    @staticmethod
+    def _iter_file(rb, length, chunk_size):
+        """
+        Read opened file `rb` by chunks and close it when finished.
+        Doesn't use an app context, so it's safe to consume it after a request was handled.
+        :param rb: opened file
+        :type rb: io.BufferedReader
+        :param length: the number of bytes to be read from the file, read until the end if `None`
+        :type length: int
+        :param chunk_size: max size of a single chunk
+        :type chunk_size: int
+        :return: file chunks
+        :rtype: generator
+        """
+
+        with rb:
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = rb.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def get_local_path(self, storage_id):
+        """
+        Return a path of a file in a local file system.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path or `None` if file doesn't exist
+        :rtype: str
+        """
+
+        file_path = self._get_file_path(storage_id)
+        if not os.path.isfile(file_path):
+            return None
+        return file_path
+
+    @contextmanager
+    def local_file(self, storage_id):
+        """
+        Provide a path of a file, file is read in place.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path
+        :rtype: str
+        :raise: `FileNotFoundError` if file doesn't exist
+        """
+
+        file_path = self.get_local_path(storage_id)
+        if file_path is None:
+            raise FileNotFoundError(f"File '{storage_id}' was not found in fs storage.")
+        yield file_path
+
+    @contextmanager
+    def media_input(self, storage_id):
+        """
+        Provide a path of a file, file is read in place.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path
+        :rtype: str
+        :raise: `FileNotFoundError` if file doesn't exist
+        """
+
+        with self.local_file(storage_id) as file_path:
+            yield file_path
+
+    @contextmanager
+    def staging_path(self, suffix=''):
+        """
+        Provide a path inside a storage root, so a file written there is linked into the storage without copying.
+        :param suffix: the file name will end with that suffix
+        :type suffix: str
+        :return: file path, file doesn't exist
+        :rtype: str
+        """
+
+        tmp_dir = self._get_blobs_path('tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        file_path = os.path.join(tmp_dir, f'{uuid.uuid4().hex}{suffix}')
+        try:
+            yield file_path
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def get_validators(self, storage_id):
+        """
+        Return http cache validators of a file.
+        ETag is built from inode, modification time and size, so it's changed whenever a file is written.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: dict with `etag` (str) and `last_modified` (datetime in UTC) keys
+        :rtype: dict
+        """
+
+        try:
+            stat = os.stat(self._get_file_path(storage_id))
+        except Exception as e:
+            logger.error(f'FileSystemStorage:get_validators:{storage_id}: {e}')
+            raise e
+
+        return {
+            'etag': f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}',
+            'last_modified': datetime.utcfromtimestamp(int(stat.st_mtime)),
+        }
+
+    @staticmethod
+    def _get_blobs_path(*paths):
+        """
+        Build and return a path inside a blobs directory.
+        :return: path
+        :rtype: str
+        """
+
+        return os.path.join(app.config.get('FS_MEDIA_STORAGE_PATH'), FileSystemStorage.BLOBS_DIR, *paths)
+
+    def _get_blob_path(self, digest):
+        """
+        Build and return a path of a content addressed blob, blobs are sharded by the first 2 chars of digest.
+        :param digest: sha256 hex digest of content
+        :type digest: str
+        :return: blob path
+        :rtype: str
+        """
+
+        return self._get_blobs_path(digest[:2], digest)
+
+    def _get_inode_path(self, stat):
+        """
+        Build and return a path of a symlink which maps inode of a blob to the blob.
+        :param stat: stat of a blob or any storage file linked to it
+        :type stat: os.stat_result
+        :return: symlink path
+        :rtype: str
+        """
+
+        return self._get_blobs_path('inodes', f'{stat.st_dev:x}-{stat.st_ino:x}')
+
+    def _hash_content(self, content):
+        """
+        Calculate sha256 of `content` and find a file which can be hard linked to create a new blob.
+        Bytes and file-like objects which are not a named file are spooled into a temporary file, while hashing.
+        :param content: file content
+        :type content: bytes or file-like object
+        :return: hex digest, path of a file with content and path of a temporary file which must be removed
+        :rtype: tuple
+        """
+
+        chunk_size = app.config.get('STREAM_CHUNK_SIZE')
+        sha256 = hashlib.sha256()
+
+        if not isinstance(content, (bytes, bytearray)):
+            source_path = getattr(content, 'name', None)
+            if isinstance(source_path, str) and os.path.isfile(source_path):
+                content.flush()
+                with open(source_path, 'rb') as rb:
+                    for chunk in iter(lambda: rb.read(chunk_size), b''):
+                        sha256.update(chunk)
+                return sha256.hexdigest(), source_path, None
+
+        tmp_dir = self._get_blobs_path('tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            if isinstance(content, (bytes, bytearray)):
+                sha256.update(content)
+                f.write(content)
+            else:
+                content.seek(0)
+                for chunk in iter(lambda: content.read(chunk_size), b''):
+                    sha256.update(chunk)
+                    f.write(chunk)
+
+        return sha256.hexdigest(), tmp_path, tmp_path
+
+    def _create_blob(self, digest, source_path):
+        """
+        Create a blob with `digest` by hard linking `source_path`, content is copied if it can't be linked.
+        Does nothing if blob was created by a concurrent writer.
+        :param digest: sha256 hex digest of content
+        :type digest: str
+        :param source_path: path of a file with content
+        :type source_path: str
+        """
+
+        blob_path = self._get_blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.link(source_path, blob_path)
+        except FileExistsError:
+            return
+        except OSError:
+            # different file systems or hard links are not supported
+            tmp_path = self._get_blobs_path('tmp', uuid.uuid4().hex)
+            os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+            shutil.copyfile(source_path, tmp_path)
+            try:
+                os.link(tmp_path, blob_path)
+            except FileExistsError:
+                return
+            finally:
+                os.remove(tmp_path)
+        os.chmod(blob_path, 0o644)
+
+        # map inode to the blob, so it can be removed when the last storage file linked to it is removed
+        inode_path = self._get_inode_path(os.stat(blob_path))
+        os.makedirs(os.path.dirname(inode_path), exist_ok=True)
+        link_path = f'{inode_path}.{uuid.uuid4().hex}.tmp'
+        os.symlink(os.path.relpath(blob_path, os.path.dirname(inode_path)), link_path)
+        os.replace(link_path, inode_path)
+
+    def _link_blob(self, digest, file_path, source_path=None):
+        """
+        Hard link a blob with `digest` to `file_path`, existing file is replaced atomically.
+        :param digest: sha256 hex digest of content
+        :type digest: str
+        :param file_path: destination file path
+        :type file_path: str
+        :param source_path: path of a file with content, used to create a blob if it doesn't exist
+        :type source_path: str
+        :return: `True` if blob was linked, `False` if blob doesn't exist and `source_path` is not set
+        :rtype: bool
+        """
+
+        blob_path = self._get_blob_path(digest)
+        link_path = f'{file_path}.{uuid.uuid4().hex}.tmp'
+        # blob can be removed by a concurrent delete between create and link, so try twice
+        for _ in range(2):
+            try:
+                os.link(blob_path, link_path)
+            except FileNotFoundError:
+                if source_path is None:
+                    return False
+                self._create_blob(digest, source_path)
+            else:
+                os.replace(link_path, file_path)
+                return True
+
+        raise FileNotFoundError(f'Blob {digest} was removed while being linked to {file_path}.')
+
+    def _release_blob(self, stat):
+        """
+        Remove a blob when the last storage file which shared it was removed.
+        Files which are not linked to a blob are ignored.
+        :param stat: stat of a removed file
+        :type stat: os.stat_result
+        """
+
+        inode_path = self._get_inode_path(stat)
+        try:
+            blob_path = os.path.join(os.path.dirname(inode_path), os.readlink(inode_path))
+            blob_stat = os.stat(blob_path)
+        except OSError:
+            return
+
+        # inode numbers are reused, make sure symlink is not stale
+        if (blob_stat.st_dev, blob_stat.st_ino) != (stat.st_dev, stat.st_ino):
+            return
+        if blob_stat.st_nlink == 1:
+            os.remove(blob_path)
+            os.remove(inode_path)
+            logger.info(f"Removed unreferenced blob '{os.path.basename(blob_path)}' from fs storage")
+
+    def _write_file(self, file_path, content):
+        """
+        Write `content` into `file_path` as a hard link to a content addressed blob.
+        Identical files share a single blob, so storing the same content again costs no disk space.
+        Content is never loaded into memory entirely, a named file from the same file system is linked.
+        :param file_path: destination file path
+        :type file_path: str
+        :param content: file content
+        :type content: bytes or file-like object
+        """
+
+        digest, source_path, tmp_path = self._hash_content(content)
+        try:
+            self._link_blob(digest, file_path, source_path)
+        finally:
+            if tmp_path:
+                os.remove(tmp_path)
+
     def put(self, content, filename, project_id=None, asset_type='project', storage_id=None, content_type=None):
         """
         Save file into a fs storage.
@@ -79,8 +402,10 @@ class FileSystemStorage(MediaStorageInterface):
          - video file: 2019/6/11/5cff82a6fe985e1e3bddb326/3ada91761c6048bdb3dd42a2463d5df8.mp4
          - thumbnail:  2019/6/11/5cff82a6fe985e1e3bddb326/thumbnails/3ada91761c6048bdb3dd42a2463d5df8_timeline_00.png
 
+        File is a hard link to a blob <storage-path>/.blobs/<digest[:2]>/<digest>, where digest is sha256 of content.
+
         :param content: file to save
-        :type content: bytes
+        :type content: bytes or file-like object
         :param filename: name which will be used when store a file
         :type filename: str
         :param project_id: unique project id
@@ -95,17 +420,26 @@ class FileSystemStorage(MediaStorageInterface):
         :rtype: str
         """
 
-        if asset_type == 'project':
-            if not project_id:
-                raise ValueError("Argument 'project_id' is required when 'asset_type' is 'project'")
-            # generate storage_id for project
-            utcnow = datetime.utcnow()
-            storage_id = f'{utcnow.year}/{utcnow.month}/{utcnow.day}/{project_id}/{filename}'
-        else:
-            if not storage_id:
-                raise ValueError("Argument 'storage_id' is required when 'asset_type' is not 'project'")
-            # generate storage_id
-            storage_id = f'{os.path.dirname(storage_id)}/{asset_type}/{filename}'
+        storage_id = self._make_storage_id(filename, project_id, asset_type, storage_id)
+        file_path = self._prepare_file_path(storage_id)
+        # write stream to file
+        try:
+            self._write_file(file_path, content)
+        except Exception as e:
+            logger.error(f'FileSystemStorage:put:{storage_id}: {e}')
+            raise e
+
+        logger.info(f"Saved file '{storage_id}' to fs storage")
+        return storage_id
+
+    def _prepare_file_path(self, storage_id):
+        """
+        Return a file path for a new file, create its directory if needed.
+        :param storage_id: unique starage id of file
+        :type storage_id: str
+        :return: file path
+        :rtype: str
+        """
 
         file_path = self._get_file_path(storage_id)
         # check if file exists
@@ -113,25 +447,86 @@ class FileSystemStorage(MediaStorageInterface):
             raise Exception(f'File {file_path} already exists, use "replace" method instead.')
 
         # check if dir exists, if not create it
-        file_dir = os.path.dirname(file_path)
-        if not os.path.exists(file_dir):
-            os.makedirs(file_dir)
-        # write stream to file
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return file_path
+
+    def put_by_digest(self, digest, filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Save a file by linking an existing blob, content is not transferred.
+        :param digest: sha256 hex digest of file content
+        :type digest: str
+        :param filename: name which will be used when store a file
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: storage id of just saved file or `None` if blob with `digest` doesn't exist
+        :rtype: str
+        """
+
+        digest = digest.lower()
+        if len(digest) != 64 or set(digest) - set(string.hexdigits.lower()):
+            raise ValueError(f"Argument 'digest' must be sha256 hex digest, got '{digest}'")
+        if not os.path.isfile(self._get_blob_path(digest)):
+            return None
+
+        storage_id = self._make_storage_id(filename, project_id, asset_type, storage_id)
+        file_path = self._prepare_file_path(storage_id)
         try:
-            with open(file_path, "wb") as f:
-                f.write(content)
+            if not self._link_blob(digest, file_path):
+                return None
         except Exception as e:
-            logger.error(f'FileSystemStorage:put:{storage_id}: {e}')
+            logger.error(f'FileSystemStorage:put_by_digest:{storage_id}: {e}')
             raise e
 
-        logger.info(f"Saved file '{storage_id}' to fs storage")
+        logger.info(f"Saved file '{storage_id}' to fs storage from blob '{digest}'")
+        return storage_id
+
+    def copy(self, src_storage_id, filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Copy a file by hard linking it, a copy shares a blob with the source file.
+        :param src_storage_id: starage id of file to copy
+        :type src_storage_id: str
+        :param filename: name which will be used when store a copy
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: storage id of a copy
+        :rtype: str
+        """
+
+        src_path = self._get_file_path(src_storage_id)
+        storage_id = self._make_storage_id(filename, project_id, asset_type, storage_id)
+        file_path = self._prepare_file_path(storage_id)
+        try:
+            try:
+                os.link(src_path, file_path)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                # too many links or hard links are not supported
+                with open(src_path, 'rb') as rb:
+                    self._write_file(file_path, rb)
+        except Exception as e:
+            logger.error(f'FileSystemStorage:copy:{src_storage_id}: {e}')
+            raise e
+
+        logger.info(f"Copied file '{src_storage_id}' to '{storage_id}' in fs storage")
         return storage_id
 
     def replace(self, content, storage_id, content_type=None):
         """
-        Replace a file in the storage
+        Replace a file in the storage.
+        File is replaced by a link to another blob, so other files which share an old blob are not affected.
         :param content: file to replace with
-        :type content: bytes
+        :type content: bytes or file-like object
         :param storage_id: starage id of file for replacement
         :type storage_id: str
         :param content_type: content type of file
@@ -140,22 +535,26 @@ class FileSystemStorage(MediaStorageInterface):
 
         file_path = self._get_file_path(storage_id)
         # check if dir exists, if not create it
-        file_dir = os.path.dirname(file_path)
-        if not os.path.exists(file_dir):
-            os.makedirs(file_dir)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        try:
+            old_stat = os.stat(file_path)
+        except FileNotFoundError:
+            old_stat = None
         # write stream to file
         try:
-            with open(file_path, "wb") as f:
-                f.write(content)
+            self._write_file(file_path, content)
         except Exception as e:
             logger.error(f'FileSystemStorage:replace:{storage_id}: {e}')
             raise e
         else:
             logger.info(f'Replaced file "{storage_id}" in fs storage')
 
+        if old_stat:
+            self._release_blob(old_stat)
+
     def delete(self, storage_id):
         """
-        Delete a file from the storage
+        Delete a file from the storage, a blob is removed if no other file shares it
         :param storage_id: starage id of file to remove
         :type storage_id: str
         """
@@ -163,14 +562,16 @@ class FileSystemStorage(MediaStorageInterface):
         file_path = self._get_file_path(storage_id)
 
         if os.path.exists(file_path):
+            stat = os.stat(file_path)
             os.remove(file_path)
+            self._release_blob(stat)
             logger.info(f"Removed '{file_path}' from fs storage")
         else:
             logger.warning(f"File '{file_path}' was not found in fs storage.")
 
     def delete_dir(self, storage_id):
         """
-        Delete an entire folder where `storage_id` is located
+        Delete an entire folder where `storage_id` is located, blobs are removed if no other file shares them
         :param storage_id: unique storage
         :type storage_id: str
         """
@@ -178,7 +579,13 @@ class FileSystemStorage(MediaStorageInterface):
         dir_path = os.path.dirname(self._get_file_path(storage_id))
 
         if os.path.isdir(dir_path):
+            stats = [
+                os.stat(os.path.join(root, name))
+                for root, _, names in os.walk(dir_path) for name in names
+            ]
             shutil.rmtree(dir_path)
+            for stat in stats:
+                self._release_blob(stat)
             logger.info(f"Removed '{dir_path}' from fs storage")
         else:
-            logger.warning(f"Directory '{dir_path}' was not found in fs storage.")
\ No newline at end of file
+            logger.warning(f"Directory '{dir_path}' was not found in fs storage.")
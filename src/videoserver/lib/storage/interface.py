@@ -1,8 +1,41 @@
 import abc
+import os
+from datetime import datetime
 
 
 class MediaStorageInterface(metaclass=abc.ABCMeta):
 
+    @staticmethod
+    def _make_storage_id(filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Generate storage id for a new file.
+
+        Use <year>/<month>/<day>/<project-id>/<filename> if `asset_type` is 'project', `project_id` is required.
+        Use <year>/<month>/<day>/<project-id>/<asset_type>/<filename> if `asset_type` is not 'project', `storage_id`
+        is required.
+
+        :param filename: name which will be used when store a file
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: storage id
+        :rtype: str
+        """
+
+        if asset_type == 'project':
+            if not project_id:
+                raise ValueError("Argument 'project_id' is required when 'asset_type' is 'project'")
+            utcnow = datetime.utcnow()
+            return f'{utcnow.year}/{utcnow.month}/{utcnow.day}/{project_id}/{filename}'
+
+        if not storage_id:
+            raise ValueError("Argument 'storage_id' is required when 'asset_type' is not 'project'")
+        return f'{os.path.dirname(storage_id)}/{asset_type}/{filename}'
+
     @abc.abstractmethod
     def get(self, storage_id):
         """
@@ -19,7 +52,7 @@ class MediaStorageInterface(metaclass=abc.ABCMeta):
         """
         Save file into a storage.
         :param content: file to save
-        :type content: bytes
+        :type content: bytes or file-like object
         :param filename: name which will be used when store a file
         :type filename: str
         :param project_id: unique project id
@@ -40,7 +73,7 @@ class MediaStorageInterface(metaclass=abc.ABCMeta):
         """
         Replace a file in the storage
         :param content: file to replace with
-        :type content: bytes
+        :type content: bytes or file-like object
         :param storage_id: starage id of file for replacement
         :type storage_id: str
         :param content_type: content type of file
@@ -48,6 +81,45 @@ class MediaStorageInterface(metaclass=abc.ABCMeta):
         """
         pass
 
+    @abc.abstractmethod
+    def copy(self, src_storage_id, filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Copy a file inside the storage, content is shared or copied by a storage backend without reading it.
+        See `_make_storage_id` for a storage id layout.
+        :param src_storage_id: starage id of file to copy
+        :type src_storage_id: str
+        :param filename: name which will be used when store a copy
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: storage id of a copy
+        :rtype: str
+        """
+        pass
+
+    @abc.abstractmethod
+    def put_by_digest(self, digest, filename, project_id=None, asset_type='project', storage_id=None):
+        """
+        Save a file which content is already kept by the storage, without uploading it again.
+        :param digest: sha256 hex digest of file content
+        :type digest: str
+        :param filename: name which will be used when store a file
+        :type filename: str
+        :param project_id: unique project id
+        :type project_id: bson.objectid.ObjectId
+        :param asset_type: asset type
+        :type asset_type: str
+        :param storage_id: unique starage id of project's file
+        :type storage_id: str
+        :return: storage id of just saved file or `None` if content with `digest` is unknown
+        :rtype: str
+        """
+        pass
+
     @abc.abstractmethod
     def get_range(self, storage_id, start, length):
         """
@@ -61,6 +133,83 @@ class MediaStorageInterface(metaclass=abc.ABCMeta):
         """
         pass
 
+    @abc.abstractmethod
+    def get_stream(self, storage_id, start=0, length=None, chunk_size=None):
+        """
+        Open a file based on `storage_id` and return an iterator over its chunks.
+        The file is opened eagerly, so a missing file raises before a response is started.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :param start: start file's position to read
+        :type start: int
+        :param length: the number of bytes to be read from the file, read until the end if `None`
+        :type length: int
+        :param chunk_size: max size of a single chunk, `STREAM_CHUNK_SIZE` is used if `None`
+        :type chunk_size: int
+        :return: file chunks
+        :rtype: generator
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_local_path(self, storage_id):
+        """
+        Return a path of a file in a local file system, if storage keeps files locally.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path or `None` if file is not accessible via local file system
+        :rtype: str
+        """
+        pass
+
+    @abc.abstractmethod
+    def local_file(self, storage_id):
+        """
+        Context manager which provides a path of a file in a local file system for reading.
+        Storage which doesn't keep files locally downloads a file into a temporary file, removed on exit.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path
+        :rtype: str
+        """
+        pass
+
+    @abc.abstractmethod
+    def media_input(self, storage_id):
+        """
+        Context manager which provides a path or URL media tools can read a file from with random access.
+        Storage which doesn't keep files locally provides a URL, so a tool fetches only byte ranges it reads.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: file path or URL
+        :rtype: str
+        """
+        pass
+
+    @abc.abstractmethod
+    def staging_path(self, suffix=''):
+        """
+        Context manager which provides a path where a new file can be written before it's saved into the storage.
+        Path is chosen to make `put` or `replace` of a file opened from it as cheap as possible.
+        File is removed on exit.
+        :param suffix: the file name will end with that suffix
+        :type suffix: str
+        :return: file path, file doesn't exist
+        :rtype: str
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_validators(self, storage_id):
+        """
+        Return http cache validators of a file, they must change whenever the file changes.
+        :param storage_id: unique starage id
+        :type storage_id: str
+        :return: dict with `etag` (str) and `last_modified` (datetime in UTC) keys
+        :rtype: dict
+        """
+        pass
+
     @abc.abstractmethod
     def delete(self, storage_id):
         """
@@ -1,19 +1,28 @@
+import hashlib
 import json
+import os
+import struct
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from tempfile import mkstemp
+from urllib.parse import quote
 import logging
 
 import bson
-from flask import Response, make_response
+from flask import Response
 from flask import current_app as app
-from flask import url_for
-from werkzeug.exceptions import BadRequest
+from flask import request, stream_with_context, url_for
+from werkzeug.exceptions import BadRequest, RequestedRangeNotSatisfiable
+from werkzeug.http import http_date, is_resource_modified, parse_range_header
+from werkzeug.wsgi import wrap_file
 
 from .validator import Validator
 
 logger = logging.getLogger(__name__)
 
+#: keyframe pts in seconds and byte offset, little-endian double and unsigned long long
+KEYFRAME_OFFSET_STRUCT = struct.Struct('<dQ')
+
 
 def create_file_name(ext):
     """
@@ -125,6 +134,138 @@ def save_activity_log(action, project_id, payload=None):
     })
 
 
+def save_media_index(project_id, media_index):
+    """
+    Save media index of a project's video into `media_index` collection.
+    Index is kept apart from a project, a list of keyframes is too big for api responses.
+    :param project_id: project id
+    :type project_id: bson.objectid.ObjectId
+    :param media_index: media index, see `VideoEditorInterface.get_media_index_from_path`,
+                        index is removed if it's `None`
+    :type media_index: dict
+    """
+
+    if media_index is None:
+        app.mongo.db.media_index.delete_one({'_id': project_id})
+    else:
+        app.mongo.db.media_index.replace_one({'_id': project_id}, {**media_index, '_id': project_id}, upsert=True)
+
+
+def get_media_index(project_id, fields=None):
+    """
+    Get media index of a project's video
+    :param project_id: project id
+    :type project_id: bson.objectid.ObjectId
+    :param fields: dotted names of fields to read, an entire index is read if `None`
+    :type fields: list
+    :return: media index or `None` if video was not indexed
+    :rtype: dict
+    """
+
+    projection = {'_id': False, **{field: True for field in fields or ()}}
+    return app.mongo.db.media_index.find_one({'_id': project_id}, projection=projection)
+
+
+def delete_segments(job_id):
+    """
+    Delete segments of a segmented edit from a storage and its state from `segments` collection,
+    see `edit_video` task.
+    :param job_id: job id of an edit
+    :type job_id: str
+    :return: `True` if an edit had segments
+    :rtype: bool
+    """
+
+    doc = app.mongo.db.segments.find_one_and_delete({'_id': job_id})
+    if not doc:
+        return False
+    for storage_id in doc['parts'].values():
+        app.fs.delete(storage_id)
+    return True
+
+
+def get_file_sha256(file_path):
+    """
+    Get sha256 of a file, file is read by chunks
+    :param file_path: file path
+    :type file_path: str
+    :return: hex digest
+    :rtype: str
+    """
+
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_render_key(source_sha256, edits):
+    """
+    Get a key of a render of an edit list, renders are shared by all projects with the same source video,
+    so identical edit lists are rendered once.
+    :param source_sha256: sha256 hex digest of a source video
+    :type source_sha256: str
+    :param edits: normalized edits in order they are applied
+    :type edits: list
+    :return: sha256 hex digest
+    :rtype: str
+    """
+
+    payload = json.dumps({'source': source_sha256, 'edits': edits}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def delete_renders(project_id):
+    """
+    Delete renders which are stored in a project's storage dir from `renders` collection with their media indexes,
+    files are removed with a project's dir.
+    :param project_id: project id
+    :type project_id: bson.objectid.ObjectId
+    """
+
+    for render in app.mongo.db.renders.find({'project_id': project_id}, projection={'_id': True}):
+        save_media_index(render['_id'], None)
+    app.mongo.db.renders.delete_many({'project_id': project_id})
+
+
+def pack_keyframe_offsets(keyframes):
+    """
+    Pack keyframe timestamps and byte offsets into a compact binary array,
+    16 bytes per keyframe instead of a bson document per keyframe.
+    :param keyframes: (pts in seconds, byte offset) pairs sorted by pts
+    :type keyframes: iterable
+    :return: packed array
+    :rtype: bytes
+    """
+
+    return b''.join(KEYFRAME_OFFSET_STRUCT.pack(pts, pos) for pts, pos in keyframes)
+
+
+def find_keyframe_offset(keyframe_offsets, position):
+    """
+    Find the keyframe at or before a position in an array packed by `pack_keyframe_offsets`.
+    :param keyframe_offsets: packed array
+    :type keyframe_offsets: bytes
+    :param position: position in seconds
+    :type position: float
+    :return: (pts in seconds, byte offset) of keyframe or `None` if there is no keyframe before a position
+    :rtype: tuple
+    """
+
+    keyframe_offsets = keyframe_offsets or b''
+    size = KEYFRAME_OFFSET_STRUCT.size
+    # bisect right over the packed array, only visited keyframes are unpacked
+    low, high = 0, len(keyframe_offsets) // size
+    while low < high:
+        middle = (low + high) // 2
+        if position < KEYFRAME_OFFSET_STRUCT.unpack_from(keyframe_offsets, middle * size)[0]:
+            high = middle
+        else:
+            low = middle + 1
+    return KEYFRAME_OFFSET_STRUCT.unpack_from(keyframe_offsets, (low - 1) * size) if low else None
+
+
 def validate_document(document, schema, **kwargs):
     """
     Validate `document` against provided `schema`
@@ -167,10 +308,15 @@ def create_temp_file(file_stream, suffix=None):
     return path
 
 
-def storage2response(storage_id, headers=None, status=200, start=None, length=None):
+def storage2response(storage_id, headers=None, status=200, start=None, length=None, etag=None, last_modified=None,
+                     offload=True):
     """
-    Fetch binary using `storage_id` and return http response.
-    
+    Fetch binary using `storage_id` and return streamed http response.
+    Binary is read by chunks of `STREAM_CHUNK_SIZE` bytes, so a worker never holds an entire file in memory.
+    If storage keeps a file locally, delivery can be offloaded according to `MEDIA_DELIVERY_MODE`.
+    If validators are provided, conditional requests are answered with `304 Not Modified`.
+    `HEAD` requests are answered without touching a storage.
+
     :param storage_id: Unique storage id
     :type storage_id: str
     :param headers: header for response 
@@ -181,6 +327,13 @@ def storage2response(storage_id, headers=None, status=200, start=None, length=No
     :type start: int
     :param length: the number of bytes to be read from the file
     :type length: int
+    :param etag: ETag of a file
+    :type etag: str
+    :param last_modified: last modification time of a file in UTC
+    :type last_modified: datetime
+    :param offload: delivery can be handed to a front server, it applies only a `Range` header of a request,
+                    so it must be `False` when a served range was not requested by a client
+    :type offload: bool
     :return: response
     :rtype: flask.wrappers.Response
     """
@@ -188,11 +341,202 @@ def storage2response(storage_id, headers=None, status=200, start=None, length=No
     if not headers:
         headers = {}
 
-    if start is not None:
-        bytes = app.fs.get_range(storage_id, start, length)
-    else:
-        bytes = app.fs.get(storage_id)
+    if etag or last_modified:
+        headers = {**headers, **validators2headers(etag, last_modified)}
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            headers = {k: v for k, v in headers.items() if k.lower() not in ('content-length', 'content-range')}
+            return Response(headers=headers), 304
 
-    resp = make_response(bytes)
-    resp.headers = headers
+    if request.method == 'HEAD':
+        return Response(headers=headers), status
+
+    mode = app.config.get('MEDIA_DELIVERY_MODE')
+    file_path = app.fs.get_local_path(storage_id) if mode != 'stream' else None
+
+    if file_path and offload and mode in ('x-accel-redirect', 'x-sendfile'):
+        # front server reads the file and handles `Range` itself, keep only headers which describe the content
+        headers = {k: v for k, v in headers.items() if k.lower() not in ('content-length', 'content-range')}
+        if mode == 'x-accel-redirect':
+            headers['X-Accel-Redirect'] = '{}{}'.format(
+                app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX').rstrip('/') + '/', quote(storage_id)
+            )
+        else:
+            headers['X-Sendfile'] = file_path
+        return Response(headers=headers), 200
+
+    if file_path and mode == 'sendfile':
+        rb = open(file_path, 'rb')
+        file_size = os.fstat(rb.fileno()).st_size
+        start = start or 0
+        # `wsgi.file_wrapper` sends a file from the current position till the end,
+        # so it can be used only when requested bytes are the tail of the file
+        if length is None or start + length >= file_size:
+            rb.seek(start)
+            resp = Response(
+                wrap_file(request.environ, rb, buffer_size=app.config.get('STREAM_CHUNK_SIZE')),
+                headers=headers,
+                direct_passthrough=True
+            )
+            return resp, status
+        rb.close()
+
+    stream = app.fs.get_stream(storage_id, start=start or 0, length=length)
+
+    resp = Response(stream, headers=headers, direct_passthrough=True)
     return resp, status
+
+
+def validators2headers(etag=None, last_modified=None):
+    """
+    Build http caching headers from validators of a file.
+    :param etag: ETag of a file
+    :type etag: str
+    :param last_modified: last modification time of a file in UTC
+    :type last_modified: datetime
+    :return: headers
+    :rtype: dict
+    """
+
+    headers = {'Cache-Control': f"public, max-age={app.config.get('MEDIA_CACHE_MAX_AGE')}, must-revalidate"}
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.replace(tzinfo=timezone.utc))
+    return headers
+
+
+def is_range_fresh(etag=None, last_modified=None):
+    """
+    Check `If-Range` header, `Range` header must be ignored if it returns `False`.
+    :param etag: ETag of a file
+    :type etag: str
+    :param last_modified: last modification time of a file in UTC
+    :type last_modified: datetime
+    :return: `True` if there is no `If-Range` header or it matches a current file
+    :rtype: bool
+    """
+
+    if_range = request.if_range
+    if if_range.etag:
+        # weak etags are not allowed in `If-Range`, see rfc7233 section-3.2
+        return bool(etag) and if_range.etag == etag and not request.headers.get('If-Range', '').startswith('W/')
+    if if_range.date:
+        if_range_date = if_range.date
+        if if_range_date.tzinfo:
+            if_range_date = if_range_date.astimezone(timezone.utc).replace(tzinfo=None)
+        return bool(last_modified) and last_modified.replace(microsecond=0) <= if_range_date
+    return True
+
+
+def parse_byte_ranges(range_header, size, max_chunk_size=None):
+    """
+    Parse `Range` header and resolve it into absolute byte ranges of a file with `size` bytes.
+    Suffix ranges (`bytes=-N`) are resolved to the last N bytes, open-ended ranges (`bytes=N-`)
+    are capped by `max_chunk_size`, so clients pull a media incrementally.
+    :param range_header: value of `Range` header
+    :type range_header: str
+    :param size: file size
+    :type size: int
+    :param max_chunk_size: max length of open-ended range, not capped if `None` or 0
+    :type max_chunk_size: int
+    :return: list of (start, end) tuples where `end` is inclusive, `None` if header is missing or malformed
+    :rtype: list
+    :raise: `RequestedRangeNotSatisfiable` if none of requested ranges is satisfiable
+    """
+
+    if not range_header:
+        return None
+
+    parsed_range = parse_range_header(range_header)
+    # malformed or non `bytes` range must be ignored, see rfc7233 section-3.1
+    if not parsed_range or parsed_range.units != 'bytes':
+        return None
+
+    ranges = []
+    for start, stop in parsed_range.ranges:
+        if start < 0:
+            # suffix range
+            start = max(size + start, 0)
+            end = size - 1
+        elif stop is None:
+            # open-ended range
+            end = size - 1
+            if max_chunk_size:
+                end = min(end, start + max_chunk_size - 1)
+        else:
+            end = min(stop - 1, size - 1)
+
+        if start <= end:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise RequestedRangeNotSatisfiable(length=size)
+
+    # merge overlapping and adjacent ranges, suffix ranges may overlap with others after resolving
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    max_ranges = app.config.get('MAX_RANGES_PER_REQUEST')
+    if max_ranges and len(merged) > max_ranges:
+        raise RequestedRangeNotSatisfiable(length=size)
+
+    return merged
+
+
+def byteranges2response(storage_id, ranges, size, content_type, etag=None, last_modified=None):
+    """
+    Fetch several byte ranges of a binary using `storage_id` and return `multipart/byteranges` http response.
+    Each part is streamed from the storage, see `storage2response`.
+
+    :param storage_id: Unique storage id
+    :type storage_id: str
+    :param ranges: list of (start, end) tuples where `end` is inclusive, see `parse_byte_ranges`
+    :type ranges: list
+    :param size: file size
+    :type size: int
+    :param content_type: content type of a binary
+    :type content_type: str
+    :param etag: ETag of a file
+    :type etag: str
+    :param last_modified: last modification time of a file in UTC
+    :type last_modified: datetime
+    :return: response
+    :rtype: flask.wrappers.Response
+    """
+
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (f'--{boundary}\r\n'
+         f'Content-Type: {content_type}\r\n'
+         f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+        for start, end in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode()
+    content_length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(part_headers, ranges))
+    content_length += len(closing)
+
+    def generate():
+        for headers, (start, end) in zip(part_headers, ranges):
+            yield headers
+            yield from app.fs.get_stream(storage_id, start=start, length=end - start + 1)
+            yield b'\r\n'
+        yield closing
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Length': content_length,
+        'Content-Type': f'multipart/byteranges; boundary={boundary}',
+        **validators2headers(etag, last_modified),
+    }
+    if (etag or last_modified) and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(headers=validators2headers(etag, last_modified)), 304
+    if request.method == 'HEAD':
+        return Response(headers=headers), 206
+
+    resp = Response(stream_with_context(generate()), headers=headers, direct_passthrough=True)
+    return resp, 206
@@ -0,0 +1,16 @@
+class ProcessInterrupted(RuntimeError):
+    """
+    Media tool process was killed before it has finished
+    """
+
+
+class ProcessCancelled(ProcessInterrupted):
+    """
+    Media tool process was killed because its job was cancelled
+    """
+
+
+class ProcessTimeout(ProcessInterrupted):
+    """
+    Media tool process was killed because its job has exceeded a time limit
+    """
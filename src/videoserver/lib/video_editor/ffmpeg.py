@@ -1,12 +1,23 @@
 import json
 import logging
+import math
 import os
-import shlex
+import shutil
+import struct
 import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from fractions import Fraction
+from time import monotonic
 
 from flask import current_app as app
 
-from videoserver.lib.utils import create_temp_file
+from videoserver.lib.image import get_image_meta
+from videoserver.lib.utils import create_temp_file, pack_keyframe_offsets
+from .exceptions import ProcessCancelled, ProcessInterrupted, ProcessTimeout
+from .filters import compile_filters
+from .governor import get_cpu_governor
 from .interface import VideoEditorInterface
 
 logger = logging.getLogger(__name__)
@@ -28,6 +39,26 @@ class FFMPEGVideoEditor(VideoEditorInterface):
       https://trac.ffmpeg.org/wiki/Scaling
     """
 
+    #: output formats which support display matrix
+    DISPLAY_MATRIX_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.3gp', '.3g2')
+
+    #: output formats which can be written with `moov` atom before media data
+    FASTSTART_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.3gp', '.3g2')
+
+    #: timeline thumbnails are 50px high
+    TIMELINE_THUMBNAIL_FILTER = 'scale=-1:50'
+
+    #: ffprobe profile name -> libx264 profile
+    H264_PROFILES = {
+        'Constrained Baseline': 'baseline',
+        'Baseline': 'baseline',
+        'Main': 'main',
+        'High': 'high',
+        'High 10': 'high10',
+        'High 4:2:2': 'high422',
+        'High 4:4:4 Predictive': 'high444',
+    }
+
     def get_meta(self, filestream, extension='tmp'):
         """
         Use ffmpeg tool for getting metadata of file
@@ -39,13 +70,105 @@ class FFMPEGVideoEditor(VideoEditorInterface):
 
         file_temp_path = create_temp_file(filestream)
         try:
-            metadata = self._get_meta(file_temp_path)
+            metadata = self.get_meta_from_path(file_temp_path)
         finally:
             os.remove(file_temp_path)
 
         return metadata
 
-    def edit_video(self, stream_file, filename, trim=None, crop=None, rotate=None, scale=None):
+    def get_meta_from_path(self, file_path):
+        """
+        Use ffmpeg tool for getting metadata of file located in a local file system
+        :param file_path: path to a file to get meta from
+        :type file_path: str
+        :return: metadata
+        :rtype: dict
+        """
+
+        return self._get_meta(file_path)
+
+    def get_media_index_from_path(self, file_path):
+        """
+        Probe everything which is required to plan processing of a video located in a local file system.
+        Streams are read from a container header, keyframes are found by reading video packets without decoding.
+        :param file_path: path to a video file
+        :type file_path: str
+        :return: media index, see `VideoEditorInterface.get_media_index_from_path`
+        :rtype: dict
+        """
+
+        cmd = ('ffprobe', '-v', 'error', '-print_format', 'json',
+               '-show_entries', 'format=format_name,duration,size,bit_rate:'
+                                'stream=index,codec_type,codec_name,profile,pix_fmt,width,height,r_frame_rate,'
+                                'time_base,bit_rate,duration,sample_rate,channels,channel_layout:'
+                                'stream_side_data=rotation:stream_tags=rotate',
+               file_path)
+        data = json.loads(self._execute(cmd, stdout=True, timeout=app.config.get('FFPROBE_TIMEOUT')).decode('utf-8'))
+
+        def to_number(value, number_type=float):
+            try:
+                return number_type(value)
+            except (TypeError, ValueError):
+                return None
+
+        streams = data.get('streams', [])
+        video = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+        if not video:
+            raise Exception(f'codec_type "video" was not found in streams. Streams: {streams}. File: {file_path}')
+
+        # frames are numbered in presentation order, GOP is a number of frames from a keyframe to the next one
+        packets = self._get_video_packets(file_path)
+        keyframes = [(round(pts, 6), number) for number, (pts, key, _pos) in enumerate(packets) if key]
+        duration = to_number(video.get('duration')) or to_number(data['format'].get('duration'))
+        bounds = keyframes + [(duration or (packets[-1][0] if packets else 0), len(packets))]
+
+        rotation = self._get_rotation(video)
+        width, height = video.get('width'), video.get('height')
+        if rotation % 180 == 90:
+            width, height = height, width
+
+        return {
+            'format_name': data['format'].get('format_name'),
+            'duration': to_number(data['format'].get('duration')),
+            'size': to_number(data['format'].get('size'), int),
+            'bit_rate': to_number(data['format'].get('bit_rate'), int),
+            'video': {
+                'index': video['index'],
+                'codec_name': video.get('codec_name'),
+                'profile': video.get('profile'),
+                'pix_fmt': video.get('pix_fmt'),
+                'width': width,
+                'height': height,
+                'rotation': rotation,
+                'r_frame_rate': video.get('r_frame_rate'),
+                'time_base': video.get('time_base'),
+                'bit_rate': to_number(video.get('bit_rate'), int),
+                'duration': duration,
+                'nb_frames': len(packets),
+                'gop_size': max((b[1] - a[1] for a, b in zip(bounds, bounds[1:])), default=0),
+                'keyframe_interval': round(max((b[0] - a[0] for a, b in zip(bounds, bounds[1:])), default=0), 6),
+                'keyframes': [list(keyframe) for keyframe in keyframes],
+                'keyframe_offsets': pack_keyframe_offsets(
+                    (round(pts, 6), pos) for pts, key, pos in packets if key and pos is not None
+                ),
+            },
+            'audio': [
+                {
+                    'index': stream['index'],
+                    'codec_name': stream.get('codec_name'),
+                    'profile': stream.get('profile'),
+                    'sample_rate': to_number(stream.get('sample_rate'), int),
+                    'channels': stream.get('channels'),
+                    'channel_layout': stream.get('channel_layout'),
+                    'time_base': stream.get('time_base'),
+                    'bit_rate': to_number(stream.get('bit_rate'), int),
+                    'duration': to_number(stream.get('duration')),
+                }
+                for stream in streams if stream.get('codec_type') == 'audio'
+            ],
+        }
+
+    def edit_video(self, stream_file, filename, trim=None, crop=None, rotate=None, scale=None, profile=None):
         """
         Use ffmpeg tool for edit video
         :param stream_file: file to edit
@@ -60,73 +183,698 @@ class FFMPEGVideoEditor(VideoEditorInterface):
         :type video_rotate: int
         :param scale: width scale to
         :type scale: int
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
         :return:
         """
 
         # file extension is required by ffmpeg
         path_input = create_temp_file(stream_file, suffix=f".{filename.rsplit('.', 1)[-1]}")
         path_output = '{}_edit.{}'.format(*path_input.rsplit('.', 1))
+        try:
+            metadata_edit_file = self.edit_video_from_path(
+                path_input=path_input,
+                path_output=path_output,
+                trim=trim,
+                crop=crop,
+                rotate=rotate,
+                scale=scale,
+                profile=profile
+            )
+            with open(path_output, 'rb') as f:
+                content = f.read()
+        finally:
+            for path in (path_input, path_output):
+                if os.path.exists(path):
+                    os.remove(path)
+        return content, metadata_edit_file
+
+    def edit_video_from_path(self, path_input, path_output, trim=None, crop=None, rotate=None, scale=None,
+                             profile=None, progress_callback=None, media_index=None):
+        """
+        Use ffmpeg tool for edit video located in a local file system, edited video is written into `path_output`
+        :param path_input: path to a file to edit
+        :type path_input: str
+        :param path_output: path to write edited video to, its extension defines an output format
+        :type path_output: str
+        :param trim: trim editing rules
+        :type trim: dict
+        :param crop: crop editing rules
+        :type crop: dict
+        :param video_rotate: rotate degree
+        :type video_rotate: int
+        :param scale: width scale to
+        :type scale: int
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
+        :param progress_callback: called with a progress of encoding, see `_run_ffmpeg`
+        :type progress_callback: callable
+        :param media_index: media index of `path_input`, video is probed when it's required if `None`
+        :type media_index: dict
+        :return: metadata of edited video
+        :rtype: dict
+        """
+
+        return self._edit(path_input, path_output, trim=trim, crop=crop, rotate=rotate, scale=scale, profile=profile,
+                          progress_callback=progress_callback, media_index=media_index)[0]
+
+    def edit_video_with_thumbnails_from_path(self, path_input, path_output, thumbnails_amount=None,
+                                             preview_position=None, trim=None, crop=None, rotate=None, scale=None,
+                                             profile=None, progress_callback=None, media_index=None):
+        """
+        Edit video like `edit_video_from_path` does and capture timeline thumbnails and a preview thumbnail of
+        an edited video. When video is re-encoded, edited frames are split between an encoder and thumbnails,
+        so a video is decoded once. When streams are copied, thumbnails are captured from an edited video.
+        See `edit_video_from_path` for arguments which are not listed.
+        :param thumbnails_amount: number of timeline thumbnails, timeline is not captured if `None`
+        :type thumbnails_amount: int
+        :param preview_position: position of a preview thumbnail in an edited video, preview is not captured if `None`
+        :type preview_position: float
+        :return: metadata of edited video, list of (file stream, metadata) of timeline thumbnails,
+                 (file stream, metadata) of a preview thumbnail or `None`
+        :rtype: dict, list, tuple
+        """
+
+        if trim:
+            duration = trim['end'] - trim['start']
+        else:
+            duration = media_index['duration'] if media_index else self._get_meta(path_input)['duration']
+
+        output_dir = tempfile.mkdtemp()
+        timeline_pattern = os.path.join(output_dir, 'timeline_%d.png')
+        preview_path = os.path.join(output_dir, 'preview.png')
+        branches = []
+        if thumbnails_amount:
+            # the same positions as `capture_timeline_thumbnails_from_path` captures
+            interval = max(duration - 1, 0) / max(thumbnails_amount - 1, 1)
+            branches.append((
+                self._get_timeline_filter(interval),
+                ('-frames:v', str(thumbnails_amount), '-start_number', '0', timeline_pattern)
+            ))
+        if preview_position is not None:
+            # avoid the last frame, it is null
+            if int(duration) <= int(preview_position):
+                preview_position = duration - 0.1
+            # https://ffmpeg.org/ffmpeg-filters.html#trim
+            branches.append((f'trim=start={preview_position}', ('-frames:v', '1', preview_path)))
+
+        try:
+            metadata, encoded = self._edit(
+                path_input, path_output, trim=trim, crop=crop, rotate=rotate, scale=scale, profile=profile,
+                progress_callback=progress_callback, media_index=media_index, branches=branches
+            )
+            timeline_thumbnails = []
+            preview_thumbnail = None
+            if encoded:
+                if thumbnails_amount:
+                    timeline_thumbnails = list(self._read_timeline_thumbnails(timeline_pattern, thumbnails_amount))
+                if preview_position is not None:
+                    with open(preview_path, 'rb') as f:
+                        content = f.read()
+                    preview_thumbnail = content, get_image_meta(content)
+            else:
+                # streams were copied, there were no decoded frames to capture
+                if thumbnails_amount:
+                    timeline_thumbnails = list(self.capture_timeline_thumbnails_from_path(
+                        path_output, metadata['duration'], thumbnails_amount
+                    ))
+                if preview_position is not None:
+                    preview_thumbnail = self.capture_thumbnail_from_path(
+                        path_output, metadata['duration'], preview_position
+                    )
+        finally:
+            # delete temp thumbnail files
+            shutil.rmtree(output_dir)
+        return metadata, timeline_thumbnails, preview_thumbnail
+
+    def _edit(self, path_input, path_output, trim=None, crop=None, rotate=None, scale=None, profile=None,
+              progress_callback=None, media_index=None, branches=tuple()):
+        """
+        Edit video, see `edit_video_from_path` and `_encode` for arguments.
+        :return: metadata of edited video, `True` if video was re-encoded and `branches` were written
+        :rtype: dict, bool
+        """
+
+        if trim and not (crop or rotate or scale):
+            # trim only, try to avoid re-encoding of an entire video
+            if trim.get('snap'):
+                self._trim_copy(path_input, path_output, trim['start'], trim['end'])
+                return self._get_meta(path_output), False
+            if app.config.get('FFMPEG_SMART_TRIM') and self._trim_smart(
+                    path_input, path_output, trim['start'], trim['end'], media_index):
+                return self._get_meta(path_output), False
+
+        if rotate and not (trim or crop or scale) and app.config.get('FFMPEG_METADATA_ROTATION') \
+                and os.path.splitext(path_output)[1].lower() in self.DISPLAY_MATRIX_EXTENSIONS:
+            # rotate only, set rotation of display matrix and copy streams
+            if self._rotate_copy(path_input, path_output, rotate, media_index):
+                return self._get_meta(path_output), False
+
+        stream = self._encode(
+            path_input, path_output,
+            start=trim['start'] if trim else None,
+            end=trim['end'] if trim else None,
+            crop=crop, rotate=rotate, scale=scale, profile=profile,
+            progress_callback=progress_callback,
+            media_index=media_index,
+            branches=branches
+        )
+        if stream is None:
+            # nothing to edit
+            shutil.copyfile(path_input, path_output)
+            return self._get_meta(path_output), False
+
+        metadata = self._get_meta(path_output)
+        if stream.get('codec_name') in app.config.get('FFMPEG_ENCODER_PROFILES'):
+            metadata['encoder_profile'] = profile or app.config.get('FFMPEG_ENCODER_PROFILE')
+        return metadata, True
+
+    def plan_segments(self, media_index, trim=None, crop=None, rotate=None, scale=None):
+        """
+        Split an edit of a long video into segments which can be encoded in parallel, see `encode_segment_from_path`.
+        Segments are cut at keyframes, so every segment is decoded from its own keyframe and segments are not
+        overlapped. Edits which are shorter than `FFMPEG_SEGMENT_MIN_DURATION` or copy streams are not split.
+        :param media_index: media index of a video
+        :type media_index: dict
+        :param trim: trim editing rules
+        :type trim: dict
+        :param crop: crop editing rules
+        :type crop: dict
+        :param rotate: rotate degree
+        :type rotate: int
+        :param scale: width scale to
+        :type scale: int
+        :return: list of (start, end) in seconds or `None` if edit must be done by `edit_video_from_path`
+        :rtype: list
+        """
+
+        if not app.config.get('FFMPEG_SEGMENT_ENCODING') or not media_index:
+            return None
+        if not (crop or scale) and not (rotate and trim):
+            # trim-only and rotate-only edits copy streams
+            return None
+
+        video = media_index['video']
+        start, end = (trim['start'], trim['end']) if trim else (0, video['duration'] or media_index['duration'])
+        if not end or end - start < app.config.get('FFMPEG_SEGMENT_MIN_DURATION'):
+            return None
+
+        segment_duration = app.config.get('FFMPEG_SEGMENT_DURATION')
+        cuts = [start]
+        for pts, _number in video['keyframes']:
+            if pts - cuts[-1] >= segment_duration and end - pts >= segment_duration / 2:
+                cuts.append(pts)
+        cuts.append(end)
+        if len(cuts) < 3:
+            # keyframes are too far from each other
+            return None
+        return list(zip(cuts, cuts[1:]))
+
+    def encode_segment_from_path(self, path_input, path_output, start, end, crop=None, rotate=None, scale=None,
+                                 profile=None, progress_callback=None, media_index=None):
+        """
+        Encode video between `start` and `end` the same way as `edit_video_from_path` does, audio is not written.
+        Segments are joined by `concat_segments_from_path`.
+        :param path_input: video file path
+        :type path_input: str
+        :param path_output: output file path
+        :type path_output: str
+        :param start: start position in seconds
+        :type start: float
+        :param end: end position in seconds
+        :type end: float
+        :param crop: crop editing rules
+        :type crop: dict
+        :param rotate: rotate degree
+        :type rotate: int
+        :param scale: width scale to
+        :type scale: int
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
+        :param progress_callback: called with a progress of encoding, see `_run_ffmpeg`
+        :type progress_callback: callable
+        :param media_index: media index of `path_input`
+        :type media_index: dict
+        """
+
+        self._encode(path_input, path_output, start=start, end=end, crop=crop, rotate=rotate, scale=scale,
+                     profile=profile, progress_callback=progress_callback, media_index=media_index, segment=True)
+
+    def concat_segments_from_path(self, paths_segments, path_input, path_output, trim=None):
+        """
+        Join encoded segments with stream copy, audio is copied from a source video.
+        :param paths_segments: segment file paths in playback order
+        :type paths_segments: list
+        :param path_input: source video file path
+        :type path_input: str
+        :param path_output: output file path
+        :type path_output: str
+        :param trim: trim editing rules of an edit, audio is cut by them
+        :type trim: dict
+        :return: metadata of joined video
+        :rtype: dict
+        """
+
+        # https://trac.ffmpeg.org/wiki/Concatenate#demuxer
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as concat_file:
+            concat_file.writelines(
+                "file '{}'\n".format(os.path.abspath(path).replace("'", "'\\''")) for path in paths_segments
+            )
+            concat_file.flush()
+
+            audio_preoptions = ('-ss', str(trim['start']), '-t', str(trim['end'] - trim['start'])) if trim \
+                else tuple()
+            cmd = (
+                'ffmpeg', '-loglevel', 'error', '-y',
+                '-f', 'concat', '-safe', '0', '-i', concat_file.name,
+                *audio_preoptions, '-i', path_input,
+                '-map', '0:v', '-map', '1:a?',
+                '-c', 'copy',
+                *self._get_muxer_options(path_output),
+                path_output
+            )
+            self._execute(cmd)
+
+        return self._get_meta(path_output)
+
+    def _encode(self, path_input, path_output, start=None, end=None, crop=None, rotate=None, scale=None, profile=None,
+                progress_callback=None, media_index=None, segment=False, branches=tuple()):
+        """
+        Re-encode video with trim and filters applied in one ffmpeg run.
+        See `edit_video_from_path` for arguments which are not listed.
+        :param path_input: video file path
+        :type path_input: str
+        :param path_output: output file path
+        :type path_output: str
+        :param start: start position in seconds
+        :type start: float
+        :param end: end position in seconds
+        :type end: float
+        :param segment: write a segment which is joined by `concat_segments_from_path`, audio is not written
+        :type segment: bool
+        :param branches: (filter, options) of additional outputs, edited frames are split between an edited video
+                         and every branch, so a video is decoded and edited once, options end with an output path
+        :type branches: list
+        :return: properties of the source video stream, see `_get_video_stream`, `None` if there is nothing to edit
+        :rtype: dict
+        """
+
+        # get option for trim, input seeking is accurate when re-encoding and doesn't decode skipped part
+        trim_preoption = ('-ss', str(start)) if start is not None else tuple()
+        trim_option = ('-t', str(end - start)) if start is not None else tuple()
         filter_string = ''
+        if crop or scale or rotate:
+            # source size lets to skip steps which don't change a frame
+            size = None
+            if crop or scale:
+                video = media_index['video'] if media_index else self._get_meta(path_input)
+                size = (video['width'], video['height'])
+            filter_string = compile_filters(crop=crop, scale=scale, rotate=rotate, size=size)
+        # get option for filter
+        filter_option = ('-filter:v', filter_string) if filter_string else tuple()
+        if not (filter_option or trim_option):
+            return None
+
+        if segment:
+            # segments are intermediate files, audio and faststart are added when they are joined
+            audio_option = ('-an',)
+            muxer_options = tuple()
+        else:
+            # audio is not changed by video-only edits
+            audio_option = ('-c:a', 'copy') if start is None else tuple()
+            muxer_options = self._get_muxer_options(path_output)
+        outputs = tuple()
+        if branches:
+            # https://ffmpeg.org/ffmpeg-filters.html#split_002c-asplit
+            labels = [f'branch{i}' for i in range(len(branches))]
+            filter_string = ';'.join((
+                f"[0:v:0]{filter_string or 'null'},split={len(branches) + 1}[edit]{''.join(f'[{l}]' for l in labels)}",
+                *(f'[{label}]{branch_filter}[{label}_out]' for label, (branch_filter, _) in zip(labels, branches))
+            ))
+            filter_option = ('-filter_complex', filter_string, '-map', '[edit]', '-map', '0:a?')
+            outputs = tuple(
+                arg for label, (_filter, options) in zip(labels, branches)
+                for arg in ('-map', f'[{label}_out]', *options)
+            )
+            # input is limited instead of outputs, so branches don't read the rest of a source
+            # and filters are flushed at the end of trimmed video
+            trim_preoption, trim_option = (*trim_preoption, *trim_option), tuple()
+
+        stream = self._get_video_stream(path_input, media_index)
+        # combine trim and filter to run one time
+        self._run_ffmpeg(
+            path_input=path_input,
+            path_output=path_output,
+            preoptions=trim_preoption,
+            options=(
+                *trim_option,
+                *filter_option,
+                *self._get_encode_options(stream.get('codec_name'), profile),
+                *audio_option,
+                *muxer_options,
+            ),
+            progress_callback=progress_callback,
+            encode_pixels=self._get_frame_pixels(stream),
+            outputs=outputs
+        )
+        return stream
+
+    @staticmethod
+    def _get_encode_options(codec_name, profile=None):
+        """
+        Get encoder options to encode video with the same codec as a source.
+        :param codec_name: source video codec
+        :type codec_name: str
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
+        :return: ffmpeg output options
+        :rtype: tuple
+        """
+
+        profiles = app.config.get('FFMPEG_ENCODER_PROFILES').get(codec_name)
+        if not profiles:
+            # let ffmpeg pick an encoder for a container
+            return '-preset', app.config.get('FFMPEG_PRESET')
+
+        profile = profile or app.config.get('FFMPEG_ENCODER_PROFILE')
+        if profile not in profiles:
+            raise ValueError(f"Encoder profile '{profile}' is not defined for codec '{codec_name}'.")
+        return tuple(profiles[profile])
+
+    def _get_video_packets(self, path_input, start=None, end=None):
+        """
+        Read timestamps of video packets between `start` and `end`, packets are not decoded.
+        Reading starts from the keyframe at or before `start`, an entire video is read if range is not set.
+        :param path_input: video file path
+        :type path_input: str
+        :param start: start position in seconds
+        :type start: float
+        :param end: end position in seconds
+        :type end: float
+        :return: list of (pts in seconds, is keyframe, byte offset or `None`) sorted by pts
+        :rtype: list
+        """
+
+        read_intervals = ('-read_intervals', f'{start}%{end}') if start is not None and end is not None else tuple()
+        cmd = ('ffprobe', '-v', 'error', '-select_streams', 'v:0', *read_intervals,
+               '-show_entries', 'packet=pts_time,pos,flags', '-of', 'csv=p=0', path_input)
+        output = self._execute(cmd, stdout=True)
+
+        packets = []
+        for line in output.decode('utf-8').splitlines():
+            pts_time, pos, flags = (line.split(',', 2) + ['', ''])[:3]
+            if pts_time and pts_time != 'N/A':
+                packets.append((float(pts_time), 'K' in flags, int(pos) if pos.isdigit() else None))
+        return sorted(packets, key=lambda packet: packet[0])
+
+    def _trim_copy(self, path_input, path_output, start, end):
+        """
+        Trim video without re-encoding, `start` is snapped to the keyframe at or before it.
+        :param path_input: video file path
+        :type path_input: str
+        :param path_output: output file path
+        :type path_output: str
+        :param start: start position in seconds
+        :type start: float
+        :param end: end position in seconds
+        :type end: float
+        """
+
+        packets = self._get_video_packets(path_input, start, end)
+        start = max([pts for pts, key, _pos in packets if key and pts <= start] or [0])
+        frames = len([pts for pts, _key, _pos in packets if start <= pts < end])
+
+        self._run_ffmpeg(
+            path_input=path_input,
+            path_output=path_output,
+            preoptions=('-ss', str(start)),
+            options=(
+                '-t', str(end - start),
+                '-frames:v', str(frames),
+                '-map', '0',
+                '-c', 'copy',
+                '-avoid_negative_ts', 'make_zero',
+                *self._get_muxer_options(path_output),
+            )
+        )
+
+    def _trim_smart(self, path_input, path_output, start, end, media_index=None):
+        """
+        Trim h264 video frame accurately by re-encoding only partial GOPs at the boundaries.
+        Video between the first and the last keyframe inside the range is copied, audio is copied entirely.
+        :param path_input: video file path
+        :type path_input: str
+        :param path_output: output file path
+        :type path_output: str
+        :param start: start position in seconds
+        :type start: float
+        :param end: end position in seconds
+        :type end: float
+        :param media_index: media index of `path_input`
+        :type media_index: dict
+        :return: `True` if video was trimmed, `False` if smart trim is not applicable and video must be re-encoded
+        :rtype: bool
+        """
+
+        stream = self._get_video_stream(path_input, media_index)
+        if stream.get('codec_name') != 'h264':
+            return False
+
+        if media_index:
+            keyframes = media_index['video']['keyframes']
+        else:
+            packets = self._get_video_packets(path_input, start, end)
+            keyframes = [(pts, number) for number, (pts, key, _pos) in enumerate(packets) if key]
+        keyframes = [(pts, number) for pts, number in keyframes if start <= pts <= end]
+        if len(keyframes) < 2:
+            # there is no complete GOP to copy
+            return False
+        (copy_start, copy_start_number), (copy_end, copy_end_number) = keyframes[0], keyframes[-1]
+
+        # boundary parts must be decodable with the same decoder as a copied part
+        encode_options = (
+            '-an',
+            '-c:v', 'libx264',
+            '-pix_fmt', stream.get('pix_fmt') or 'yuv420p',
+            *(('-profile:v', self.H264_PROFILES[stream['profile']]) if stream.get('profile') in self.H264_PROFILES
+              else tuple()),
+            '-crf', str(app.config.get('FFMPEG_SMART_TRIM_CRF')),
+            '-preset', app.config.get('FFMPEG_PRESET'),
+            # level, references and entropy coding of x264 differ from a source, so every part carries its own
+            # SPS/PPS in-band, mp4 keeps only parameter sets of the first part in avcC
+            '-x264-params', 'repeat-headers=1',
+        )
+        parts_dir = tempfile.mkdtemp()
         try:
-            # get option for trim
-            trim_option = (
-                '-ss', str(trim['start']),
-                '-t', str(trim['end'] - trim['start']),
-                '-qscale', '0',
-            ) if trim else tuple()
-            # crop
-            # https://ffmpeg.org/ffmpeg-filters.html#crop
-            if crop:
-                filter_string += f'crop={crop["width"]}:{crop["height"]}:{crop["x"]}:{crop["y"]}'
-            # scale
-            # http://ffmpeg.org/ffmpeg-filters.html#scale
-            # https://trac.ffmpeg.org/wiki/Scaling
-            if scale:
-                filter_string += ',' if filter_string != '' else ''
-                filter_string += f"scale={scale}:-2"
-            # rotate
-            # https://ffmpeg.org/ffmpeg-all.html#transpose
-            # 0 = 90CounterCLockwise and Vertical Flip (default)
-            # 1 = 90Clockwise
-            # 2 = 90CounterClockwise
-            # 3 = 90Clockwise and Vertical Flip
-            if rotate:
-                rotate_string = ''
-                if rotate == 90:
-                    rotate_string = 'transpose=1'
-                elif rotate == -90:
-                    rotate_string = 'transpose=2'
-                elif rotate == 180:
-                    rotate_string = 'transpose=1,transpose=1'
-                elif rotate == -180:
-                    rotate_string = 'transpose=2,transpose=2'
-                elif rotate == 270:
-                    rotate_string = 'transpose=1,transpose=1,transpose=1'
-                elif rotate == -270:
-                    rotate_string = 'transpose=2,transpose=2,transpose=2'
-                filter_string += ',' if filter_string != '' else ''
-                filter_string += rotate_string
-            # get option for filter
-            filter_option = ('-filter:v', filter_string) if filter_string else tuple()
-            # run ffmpeg
-            if filter_option or trim_option:
-                # combine trim and filter to run one time
-                self._run_ffmpeg(
+            parts = []
+            if start < copy_start:
+                parts.append(self._run_ffmpeg(
                     path_input=path_input,
-                    path_output=path_output,
-                    options=(
-                        *trim_option,
-                        *filter_option,
-                        '-threads', str(app.config.get('FFMPEG_THREADS')),
-                        '-preset', app.config.get('FFMPEG_PRESET')
-                    )
+                    path_output=os.path.join(parts_dir, 'head.mp4'),
+                    preoptions=('-ss', str(start)),
+                    options=('-t', str(copy_start - start), *encode_options),
+                    encode_pixels=self._get_frame_pixels(stream)
+                ))
+            parts.append(self._run_ffmpeg(
+                path_input=path_input,
+                path_output=os.path.join(parts_dir, 'middle.mp4'),
+                preoptions=('-ss', str(copy_start)),
+                options=(
+                    # cut by a number of frames, cutting by time takes a few frames of the next GOP
+                    '-frames:v', str(copy_end_number - copy_start_number),
+                    '-an',
+                    '-c:v', 'copy',
+                    # move source SPS/PPS from avcC in front of keyframes
+                    # https://ffmpeg.org/ffmpeg-bitstream-filters.html#h264_005fmp4toannexb
+                    '-bsf:v', 'h264_mp4toannexb',
                 )
-            content = open(path_input, 'rb+').read()
-            metadata_edit_file = self._get_meta(path_input)
+            ))
+            if copy_end < end:
+                parts.append(self._run_ffmpeg(
+                    path_input=path_input,
+                    path_output=os.path.join(parts_dir, 'tail.mp4'),
+                    preoptions=('-ss', str(copy_end)),
+                    options=('-t', str(end - copy_end), *encode_options),
+                    encode_pixels=self._get_frame_pixels(stream)
+                ))
+
+            # https://trac.ffmpeg.org/wiki/Concatenate#demuxer
+            concat_path = os.path.join(parts_dir, 'concat.txt')
+            with open(concat_path, 'w') as f:
+                f.writelines(f"file '{os.path.basename(part)}'\n" for part in parts)
+
+            cmd = (
+                'ffmpeg', '-loglevel', 'error', '-y',
+                '-f', 'concat', '-safe', '0', '-i', concat_path,
+                '-ss', str(start), '-t', str(end - start), '-i', path_input,
+                '-map', '0:v', '-map', '1:a?',
+                '-c', 'copy',
+                *self._get_muxer_options(path_output),
+                path_output
+            )
+            self._execute(cmd)
+        except ProcessInterrupted:
+            raise
+        except Exception as e:
+            logger.warning(f'Smart trim has failed, video will be re-encoded: {e}')
+            return False
         finally:
-            if path_input:
-                os.remove(path_input)
-        return content, metadata_edit_file
+            shutil.rmtree(parts_dir)
+
+        return True
+
+    def _rotate_copy(self, path_input, path_output, rotate, media_index=None):
+        """
+        Rotate video without re-encoding by writing a display matrix, players rotate video when displaying it.
+        Rotation of the source display matrix is preserved.
+        :param path_input: video file path
+        :type path_input: str
+        :param path_output: output file path
+        :type path_output: str
+        :param rotate: degrees to rotate clockwise
+        :type rotate: int
+        :param media_index: media index of `path_input`
+        :type media_index: dict
+        :return: `True` if video was rotated, `False` if ffmpeg doesn't support `-display_rotation` (added in 6.0)
+            or it has failed and video must be re-encoded
+        :rtype: bool
+        """
+
+        # display matrix rotation is counter clockwise
+        rotation = self._get_rotation(self._get_video_stream(path_input, media_index)) - rotate
+        # normalize to (-180, 180]
+        rotation = -((180 - rotation) % 360 - 180)
+
+        try:
+            self._run_ffmpeg(
+                path_input=path_input,
+                path_output=path_output,
+                preoptions=('-display_rotation', str(rotation)),
+                options=(
+                    '-map', '0',
+                    '-c', 'copy',
+                    *self._get_muxer_options(path_output),
+                )
+            )
+        except ProcessInterrupted:
+            raise
+        except Exception as e:
+            logger.warning(f'Metadata rotation has failed, video will be re-encoded: {e}')
+            return False
+
+        return True
+
+    def remux_faststart_from_path(self, path_input, path_output):
+        """
+        Remux video with `moov` atom moved before media data, streams are copied.
+        ffmpeg writes media data first and then moves `moov` atom with a second pass over an output file.
+        :param path_input: video file path
+        :type path_input: str
+        :param path_output: output file path, must have mp4 or mov extension
+        :type path_output: str
+        :return: metadata of remuxed video
+        :rtype: dict
+        """
+
+        # https://ffmpeg.org/ffmpeg-formats.html#Options-9
+        self._run_ffmpeg(
+            path_input=path_input,
+            path_output=path_output,
+            options=(
+                '-map', '0',
+                '-c', 'copy',
+                '-movflags', '+faststart',
+            )
+        )
+        return self._get_meta(path_output)
+
+    def _get_muxer_options(self, path_output):
+        """
+        Get options of an output format.
+        :param path_output: output file path
+        :type path_output: str
+        :return: ffmpeg options
+        :rtype: tuple
+        """
+
+        if app.config.get('FFMPEG_FASTSTART') \
+                and os.path.splitext(path_output)[1].lower() in self.FASTSTART_EXTENSIONS:
+            # https://ffmpeg.org/ffmpeg-formats.html#Options-9
+            return '-movflags', '+faststart'
+        return tuple()
+
+    @staticmethod
+    def _is_faststart(file_path):
+        """
+        Check if `moov` atom of mp4 or mov file is before media data, only top-level box headers are read.
+        :param file_path: video file path
+        :type file_path: str
+        :return: `True` if `moov` is before `mdat`, `False` if it's after, `None` if file has no such boxes
+        :rtype: bool
+        """
+
+        # https://developer.apple.com/standards/qtff.pdf, atom header is a 32 bit size and a type,
+        # size 1 means 64 bit size follows the type, size 0 means atom lasts until the end of file
+        with open(file_path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = 0
+            while offset + 8 <= size:
+                f.seek(offset)
+                atom_size, atom_type = struct.unpack('>I4s', f.read(8))
+                if atom_type == b'moov':
+                    return True
+                if atom_type == b'mdat':
+                    return False
+                if atom_size == 1:
+                    atom_size, = struct.unpack('>Q', f.read(8))
+                elif atom_size == 0:
+                    break
+                if atom_size < 8:
+                    # broken atom
+                    break
+                offset += atom_size
+        return None
+
+    @staticmethod
+    def _get_rotation(stream):
+        """
+        Get counter clockwise rotation of a video stream from its display matrix or legacy `rotate` tag.
+        :param stream: ffprobe stream or video of a media index
+        :type stream: dict
+        :return: degrees
+        :rtype: int
+        """
+
+        if 'rotation' in stream:
+            return stream['rotation']
+        for side_data in stream.get('side_data_list', ()):
+            if 'rotation' in side_data:
+                return int(side_data['rotation'])
+        # `rotate` tag is clockwise
+        return -int(stream.get('tags', {}).get('rotate', 0))
+
+    def _get_video_stream(self, file_path, media_index=None):
+        """
+        Get properties of the first video stream, which are required to encode a compatible video
+        :param file_path: path to a video file
+        :type file_path: str
+        :param media_index: media index of a video, it's used instead of probing if it's set
+        :type media_index: dict
+        :return: stream properties
+        :rtype: dict
+        """
+
+        if media_index:
+            return media_index['video']
+
+        cmd = ('ffprobe', '-v', 'error', '-select_streams', 'v:0', '-print_format', 'json',
+               '-show_entries', 'stream=codec_name,profile,pix_fmt,width,height:stream_side_data=rotation:'
+                                'stream_tags=rotate',
+               file_path)
+        output = self._execute(cmd, stdout=True)
+
+        streams = json.loads(output.decode('utf-8')).get('streams')
+        return streams[0] if streams else {}
 
     def capture_thumbnail(self, stream_file, filename, duration, position, crop=None, rotate=0):
         """
@@ -149,48 +897,57 @@ class FFMPEGVideoEditor(VideoEditorInterface):
 
         path_video = create_temp_file(stream_file)
         try:
-            # avoid the last frame, it is null
-            if int(duration) <= int(position):
-                position = duration - 0.1
-            # create output file path
-            output_file = f"{path_video}_preview_thumbnail.png"
-
-            vfilter = ''
-            if crop:
-                vfilter = f'-vf crop={crop["width"]}:{crop["height"]}:{crop["x"]}:{crop["y"]}'
-            if rotate:
-                vfilter += ',' if vfilter else '-vf '
-                transpose = f'transpose=1' if rotate > 0 else f'transpose=2'
-                vfilter += ','.join([transpose] * (rotate // 90))
-
-            try:
-                # run ffmpeg command
-                self._run_ffmpeg(
-                    path_input=path_video,
-                    path_output=output_file,
-                    preoptions=('-y', '-accurate_seek'),
-                    options=(
-                        '-ss', str(position),
-                        '-vframes', '1',
-                        *shlex.split(vfilter),
-                    ),
-                    override=False,
-                )
-                # get metadata
-                thumbnail_metadata = self._get_meta(output_file)
-                thumbnail_metadata['mimetype'] = 'image/png'
-                # read binary
-                with open(output_file, "rb") as f:
-                    content = f.read()
-                return content, thumbnail_metadata
-            finally:
-                if os.path.exists(output_file):
-                    # delete temp thumbnail file
-                    os.remove(output_file)
+            return self.capture_thumbnail_from_path(path_video, duration, position, crop=crop, rotate=rotate)
         finally:
             os.remove(path_video)
 
-    def capture_timeline_thumbnails(self, stream_file, filename, duration, thumbnails_amount):
+    def capture_thumbnail_from_path(self, path_video, duration, position, crop=None, rotate=0):
+        """
+        Use ffmpeg tool to capture a frame at a position of a video located in a local file system.
+        :param path_video: path to a video file
+        :type path_video: str
+        :param duration: video's duration
+        :type duration: int
+        :param position: video position to capture a frame
+        :type position: int
+        :param crop: crop editing rules
+        :type crop: dict
+        :param rotate: rotate degree
+        :type rotate: int
+        :return: file stream, metadata
+        :rtype: bytes, dict
+        """
+
+        # avoid the last frame, it is null
+        if int(duration) <= int(position):
+            position = duration - 0.1
+        # create output file path
+        output_file = create_temp_file(b'', suffix='_preview_thumbnail.png')
+
+        vfilter = compile_filters(crop=crop, rotate=rotate)
+
+        try:
+            # run ffmpeg command
+            self._run_ffmpeg(
+                path_input=path_video,
+                path_output=output_file,
+                preoptions=('-accurate_seek',),
+                options=(
+                    '-ss', str(position),
+                    '-vframes', '1',
+                    *(('-vf', vfilter) if vfilter else tuple()),
+                ),
+            )
+            # read binary
+            with open(output_file, "rb") as f:
+                content = f.read()
+            # get metadata from png header, no need to probe it
+            return content, get_image_meta(content)
+        finally:
+            # delete temp thumbnail file
+            os.remove(output_file)
+
+    def capture_timeline_thumbnails(self, stream_file, filename, duration, thumbnails_amount, mode='accurate'):
         """
         Capture thumbnails for timeline.
         :param stream_file: video file
@@ -201,43 +958,173 @@ class FFMPEGVideoEditor(VideoEditorInterface):
         :type duration: int
         :param thumbnails_amount: total number of thumbnails to capture
         :type thumbnails_amount: int
+        :param mode: 'accurate' - capture frames exactly at positions, 'fast' - capture keyframes near positions
+        :type mode: str
         :return: file stream, metadata generator
         :return: bytes, generator
         """
 
         path_video = create_temp_file(stream_file)
         try:
-            # time period between two frames
-            if thumbnails_amount == 1:
-                frame_per_second = (duration - 1)
-            else:
-                frame_per_second = (duration - 1) / (thumbnails_amount - 1)
-
-            # capture list frame via script capture_list_frames.sh
-            path_script = os.path.dirname(__file__) + '/script/capture_list_frames.sh'
-            # create output file path
-            output_file = f"{path_video}_"
-            # subprocess bash -> ffmpeg in the loop
-            subprocess.run([path_script, path_video, output_file, str(frame_per_second), str(thumbnails_amount)])
-            for i in range(0, thumbnails_amount):
-                thumbnail_path = f'{output_file}{i}.png'
-                try:
-                    # get metadata
-                    thumbnail_metadata = self._get_meta(thumbnail_path)
-                    thumbnail_metadata['mimetype'] = 'image/png'
-                    # read binary
-                    with open(thumbnail_path, "rb") as f:
-                        content = f.read()
-                    yield content, thumbnail_metadata
-                finally:
-                    # delete temp thumbnail file
-                    os.remove(thumbnail_path)
+            yield from self.capture_timeline_thumbnails_from_path(path_video, duration, thumbnails_amount, mode)
         finally:
             os.remove(path_video)
 
-    def _run_ffmpeg(self, path_input, path_output, preoptions=tuple(), options=tuple(), override=True):
+    def capture_timeline_thumbnails_from_path(self, path_video, duration, thumbnails_amount, mode='accurate',
+                                              progress_callback=None, media_index=None):
+        """
+        Capture thumbnails for timeline of a video located in a local file system.
+        In 'fast' mode every position is snapped to the keyframe at or before it and only keyframes are decoded,
+        so a single frame is decoded per thumbnail regardless of GOP length.
+        :param path_video: path to a video file
+        :type path_video: str
+        :param duration: video's duration
+        :type duration: int
+        :param thumbnails_amount: total number of thumbnails to capture
+        :type thumbnails_amount: int
+        :param mode: 'accurate' - capture frames exactly at positions, 'fast' - capture keyframes near positions
+        :type mode: str
+        :param progress_callback: called with a position of the last captured frame, see `_run_ffmpeg`
+        :type progress_callback: callable
+        :param media_index: media index of a video, its GOP duration is used instead of `TIMELINE_SEEK_INTERVAL`
+        :type media_index: dict
+        :return: file stream, metadata generator
+        :return: bytes, generator
+        """
+
+        # time period between two frames, the last second is avoided
+        interval = max(duration - 1, 0) / max(thumbnails_amount - 1, 1)
+        positions = [i * interval for i in range(thumbnails_amount)]
+        # seeking decodes up to a GOP per frame, it's cheaper than decoding everything if frames are a GOP apart
+        seek_interval = app.config.get('TIMELINE_SEEK_INTERVAL')
+        if media_index and media_index['video'].get('keyframe_interval'):
+            seek_interval = media_index['video']['keyframe_interval']
+
+        output_dir = tempfile.mkdtemp()
+        output_pattern = os.path.join(output_dir, 'timeline_%d.png')
+        vfilter = self.TIMELINE_THUMBNAIL_FILTER
+        try:
+            if interval < seek_interval:
+                # frames are close, decode video once and pick frames at positions
+                self._run_ffmpeg(
+                    path_input=path_video,
+                    path_output=output_pattern,
+                    preoptions=('-skip_frame', 'nokey') if mode == 'fast' else tuple(),
+                    options=(
+                        '-map', '0:v:0',
+                        '-vf', self._get_timeline_filter(interval),
+                        '-frames:v', str(thumbnails_amount),
+                        '-start_number', '0',
+                    ),
+                    progress_callback=progress_callback
+                )
+            else:
+                # frames are far, seek to every position, a few positions per ffmpeg process
+                batch_size = app.config.get('TIMELINE_SEEK_BATCH_SIZE')
+                for start in range(0, thumbnails_amount, batch_size):
+                    self._run_ffmpeg_seek(
+                        path_input=path_video,
+                        positions=positions[start:start + batch_size],
+                        output_pattern=output_pattern,
+                        start_number=start,
+                        vfilter=vfilter,
+                        keyframes_only=mode == 'fast'
+                    )
+                    if progress_callback:
+                        progress_callback({'out_time': positions[min(start + batch_size, thumbnails_amount) - 1],
+                                           'fps': None, 'speed': None})
+
+            yield from self._read_timeline_thumbnails(output_pattern, thumbnails_amount, mode == 'fast')
+        finally:
+            # delete temp thumbnail files
+            shutil.rmtree(output_dir)
+
+    @classmethod
+    def _get_timeline_filter(cls, interval):
         """
-        Subprocess `ffmpeg` command.
+        Get a filter which picks frames `interval` seconds apart starting from the first one and scales them
+        to timeline thumbnails.
+        :param interval: seconds between frames
+        :type interval: float
+        :return: video filter
+        :rtype: str
+        """
+
+        # https://ffmpeg.org/ffmpeg-filters.html#fps
+        fps = Fraction(1 / interval).limit_denominator(1000) if interval else 1
+        return f'fps=fps={fps}:eof_action=pass,{cls.TIMELINE_THUMBNAIL_FILTER}'
+
+    @staticmethod
+    def _read_timeline_thumbnails(output_pattern, thumbnails_amount, repeat_last=False):
+        """
+        Read captured timeline thumbnails.
+        :param output_pattern: thumbnail file path pattern with `%d` placeholder for a thumbnail number
+        :type output_pattern: str
+        :param thumbnails_amount: number of thumbnails
+        :type thumbnails_amount: int
+        :param repeat_last: missing thumbnails at the end are replaced by the last captured one
+        :type repeat_last: bool
+        :return: file stream, metadata generator
+        :rtype: bytes, generator
+        """
+
+        content = None
+        for i in range(thumbnails_amount):
+            thumbnail_path = output_pattern % i
+            if repeat_last and content and not os.path.exists(thumbnail_path):
+                # positions after the last keyframe are snapped to it
+                yield content, get_image_meta(content)
+                continue
+            # read binary
+            with open(thumbnail_path, "rb") as f:
+                content = f.read()
+            # get metadata from png header, no need to probe it
+            yield content, get_image_meta(content)
+
+    def _run_ffmpeg_seek(self, path_input, positions, output_pattern, start_number=0, vfilter=None,
+                         keyframes_only=False):
+        """
+        Capture a frame at every position in one `ffmpeg` process.
+        Every position is an input with accurate input seeking, so only frames from the nearest keyframe are decoded.
+        If `keyframes_only` is set, input seeking is not accurate and non-key frames are skipped by a decoder,
+        so a keyframe at or before every position is captured.
+        :param path_input: input file path
+        :type path_input: str
+        :param positions: video positions in seconds to capture frames at
+        :type positions: list
+        :param output_pattern: output file path pattern with `%d` placeholder for a frame number
+        :type output_pattern: str
+        :param start_number: number of the first frame
+        :type start_number: int
+        :param vfilter: video filter applied to every frame
+        :type vfilter: str
+        :param keyframes_only: capture keyframes only
+        :type keyframes_only: bool
+        :raise: `RuntimeError` if ffmpeg has failed
+        """
+
+        # https://ffmpeg.org/ffmpeg-codecs.html#Codec-Options
+        seek_options = ('-skip_frame', 'nokey', '-noaccurate_seek') if keyframes_only else ('-accurate_seek',)
+        inputs = []
+        outputs = []
+        for i, position in enumerate(positions):
+            inputs += ['-threads', '1', *seek_options, '-ss', str(position), '-i', path_input]
+            outputs += ['-map', f'{i}:v:0', '-frames:v', '1']
+            if keyframes_only:
+                # keyframe before a position has a negative timestamp, don't let it to be dropped
+                outputs += ['-vsync', 'passthrough']
+            if vfilter:
+                outputs += ['-vf', vfilter]
+            outputs.append(output_pattern % (start_number + i))
+
+        cmd = ("ffmpeg", "-loglevel", "error", "-y", *inputs, *outputs)
+        with self._reserve_cpus() as cpus:
+            self._execute(cmd, cpus=cpus)
+
+    def _run_ffmpeg(self, path_input, path_output, preoptions=tuple(), options=tuple(), progress_callback=None,
+                    encode_pixels=None, outputs=tuple()):
+        """
+        Subprocess `ffmpeg` command, output is written directly into `path_output`, existing file is overwritten.
         :param path_input: input file path
         :type path_input: str
         :param path_output: outut file path
@@ -246,23 +1133,174 @@ class FFMPEGVideoEditor(VideoEditorInterface):
         :type preoptions: tuple
         :param options: options for ffmpeg cmd
         :type options: tuple
-        :param override: replace input file with output file
-        :type override: bool
+        :param progress_callback: called with a dict with `out_time` (seconds of output written), `fps` and `speed`
+                                  keys every time ffmpeg reports a progress, `fps` and `speed` can be `None`
+        :type progress_callback: callable
+        :param encode_pixels: number of pixels of a frame if video is encoded, it defines how many cores a job needs,
+                              a job which doesn't encode a video runs on a single core
+        :type encode_pixels: int
+        :param outputs: options and paths of additional outputs, they follow `path_output`
+        :type outputs: tuple
         :return: file path to edited file
         :rtype: str
+        :raise: `RuntimeError` if ffmpeg has failed
+        """
+
+        with self._reserve_cpus(encode_pixels) as cpus:
+            threads_option = tuple()
+            if encode_pixels:
+                threads_option = ('-threads', str(len(cpus) if cpus else app.config.get('FFMPEG_THREADS')))
+            if not progress_callback:
+                cmd = ("ffmpeg", "-loglevel", "error", "-y", *preoptions, "-i", path_input, *options,
+                       *threads_option, path_output, *outputs)
+            else:
+                # https://ffmpeg.org/ffmpeg.html#Advanced-options, progress is written as key=value lines
+                cmd = ("ffmpeg", "-loglevel", "error", "-nostats", "-progress", "pipe:1", "-y", *preoptions,
+                       "-i", path_input, *options, *threads_option, path_output, *outputs)
+            self._execute(cmd, progress_callback=progress_callback, cpus=cpus)
+        return path_output
+
+    @contextmanager
+    def _reserve_cpus(self, encode_pixels=None):
+        """
+        Context manager which holds CPU tokens of a node for an ffmpeg job, see `CPUGovernor`.
+        Encoding gets a token per `FFMPEG_GOVERNOR_PIXELS_PER_TOKEN` pixels of a frame, other jobs get one token.
+        Waiting for tokens is limited by `watch`.
+        :param encode_pixels: number of pixels of a frame if video is encoded
+        :type encode_pixels: int
+        :return: ids of CPU cores a job must run on, `None` if governor is disabled
+        :rtype: list
+        """
+
+        governor = get_cpu_governor(app.config)
+        if not governor:
+            yield None
+            return
+
+        wanted = 1
+        if encode_pixels:
+            wanted = math.ceil(encode_pixels / app.config.get('FFMPEG_GOVERNOR_PIXELS_PER_TOKEN'))
+        with governor.acquire(wanted, deadline=self.deadline, is_cancelled=self.is_cancelled) as cpus:
+            yield cpus
+
+    @staticmethod
+    def _get_frame_pixels(stream):
+        """
+        Get number of pixels of a video frame.
+        :param stream: ffprobe stream or video of a media index
+        :type stream: dict
+        :return: number of pixels or `None` if frame size is unknown
+        :rtype: int
+        """
+
+        if stream.get('width') and stream.get('height'):
+            return stream['width'] * stream['height']
+        return None
+
+    def _execute(self, cmd, stdout=False, progress_callback=None, timeout=None, cpus=None):
+        """
+        Run `ffmpeg` or `ffprobe` command, process is killed if limits set by `watch` or `timeout` are exceeded.
+        :param cmd: command
+        :type cmd: tuple
+        :param stdout: capture and return stdout
+        :type stdout: bool
+        :param progress_callback: callback for `_read_progress`, command must write a progress to stdout
+        :type progress_callback: callable
+        :param timeout: time limit in seconds for this process
+        :type timeout: float
+        :param cpus: ids of CPU cores to run a process on, all cores are used if `None`
+        :type cpus: list
+        :return: stdout if `stdout` is set
+        :rtype: bytes
+        :raise: `ProcessTimeout` or `ProcessCancelled` if process was killed, `RuntimeError` if it has failed
         """
+
+        deadline = self.deadline
+        if timeout:
+            deadline = min(deadline or float('inf'), monotonic() + timeout)
+
+        output = None
+        # stderr is spooled to a file, a pipe which is not read could block a process
+        with tempfile.TemporaryFile() as stderr_file:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE if stdout or progress_callback else subprocess.DEVNULL,
+                                  stderr=stderr_file) as proc:
+                if cpus and hasattr(os, 'sched_setaffinity'):
+                    self._set_affinity(proc.pid, cpus)
+                watchdog = None
+                if deadline or self.is_cancelled:
+                    watchdog = _Watchdog(proc, deadline, self.is_cancelled)
+                    watchdog.start()
+                try:
+                    if progress_callback:
+                        self._read_progress(proc.stdout, progress_callback)
+                    elif stdout:
+                        output = proc.stdout.read()
+                    proc.wait()
+                finally:
+                    if watchdog:
+                        watchdog.stop()
+
+            if watchdog and watchdog.reason == 'timeout':
+                raise ProcessTimeout(f"Subprocess with command: '{cmd}' has exceeded a time limit.")
+            elif watchdog and watchdog.reason == 'cancel':
+                raise ProcessCancelled(f"Subprocess with command: '{cmd}' was cancelled.")
+            elif proc.returncode != 0:
+                stderr_file.seek(0)
+                raise RuntimeError(f"Subprocess with command: '{cmd}' has failed: "
+                                   f"{stderr_file.read().decode('utf-8', errors='replace').strip()}")
+        return output
+
+    @staticmethod
+    def _set_affinity(pid, cpus):
+        """
+        Pin a started process to CPU cores. It's not done by `preexec_fn`, which can deadlock a child of
+        a multithreaded process. Threads started by a process later inherit affinity of its main thread.
+        :param pid: process id
+        :type pid: int
+        :param cpus: ids of CPU cores
+        :type cpus: list
+        """
+
         try:
-            # run ffmpeg with provided options
-            subprocess.run(["ffmpeg", "-loglevel", "error", *preoptions, "-i", path_input, *options, path_output])
-            if not override:
-                return path_output
-            # replace tmp origin
-            subprocess.run(["cp", "-r", path_output, path_input])
-            return path_input
-        finally:
-            if override:
-                # delete old tmp input file
-                os.remove(path_output)
+            os.sched_setaffinity(pid, cpus)
+            # threads which were started before the main thread was pinned
+            for tid in os.listdir(f'/proc/{pid}/task'):
+                os.sched_setaffinity(int(tid), cpus)
+        except OSError:
+            # process has exited already
+            pass
+
+    @staticmethod
+    def _read_progress(stream, progress_callback):
+        """
+        Parse `-progress` output of ffmpeg until it's closed, every block of values ends with `progress` key.
+        :param stream: stdout of ffmpeg
+        :type stream: file-like object
+        :param progress_callback: called with a parsed block
+        :type progress_callback: callable
+        """
+
+        def to_float(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+
+        values = {}
+        for line in stream:
+            key, _, value = line.decode('utf-8', errors='replace').strip().partition('=')
+            if key != 'progress':
+                values[key] = value
+                continue
+
+            out_time_us = to_float(values.get('out_time_us'))
+            if out_time_us is not None and out_time_us >= 0:
+                progress_callback({
+                    'out_time': out_time_us / 1000000,
+                    'fps': to_float(values.get('fps')),
+                    'speed': to_float(values.get('speed', '').rstrip('x')),
+                })
+            values = {}
 
     def _get_meta(self, file_path):
         """
@@ -274,10 +1312,7 @@ class FFMPEGVideoEditor(VideoEditorInterface):
         """
 
         cmd = ('ffprobe', '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format', file_path)
-        with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
-            (output, _) = proc.communicate()
-            if proc.returncode != 0:
-                raise RuntimeError(f"Subprocess with command: '{cmd}' has failed.")
+        output = self._execute(cmd, stdout=True, timeout=app.config.get('FFPROBE_TIMEOUT'))
 
         video_data = json.loads(output.decode("utf-8"))
 
@@ -294,8 +1329,13 @@ class FFMPEGVideoEditor(VideoEditorInterface):
                            'nb_frames', 'duration')
 
         metadata = {key: data.get(key) for key in video_meta_keys}
+        # report dimensions of a displayed video
+        if self._get_rotation(data) % 180 == 90 and metadata['width'] and metadata['height']:
+            metadata['width'], metadata['height'] = metadata['height'], metadata['width']
         metadata['format_name'] = video_data['format']['format_name']
         metadata['size'] = video_data['format']['size']
+        if 'mov' in metadata['format_name'].split(','):
+            metadata['faststart'] = self._is_faststart(file_path)
 
         # some videos don't have duration in video stream
         if not metadata['duration']:
@@ -313,3 +1353,48 @@ class FFMPEGVideoEditor(VideoEditorInterface):
                 metadata[value] = format_type[value](metadata[value])
 
         return metadata
+
+
+class _Watchdog(threading.Thread):
+    """
+    Kill a process when a deadline is reached or a job is cancelled
+    """
+
+    def __init__(self, proc, deadline=None, is_cancelled=None):
+        super().__init__(daemon=True)
+        self.proc = proc
+        self.deadline = deadline
+        self.is_cancelled = is_cancelled
+        self.reason = None
+        self._stopped = threading.Event()
+        # read it in a caller's thread, app context is not available in a watchdog thread
+        self._interval = app.config.get('FFMPEG_WATCHDOG_INTERVAL')
+
+    def run(self):
+        while True:
+            wait = self._interval
+            if self.deadline:
+                wait = min(wait, max(self.deadline - monotonic(), 0))
+            if self._stopped.wait(wait):
+                return
+
+            if self.deadline and monotonic() >= self.deadline:
+                self.reason = 'timeout'
+            elif self.is_cancelled:
+                try:
+                    if self.is_cancelled():
+                        self.reason = 'cancel'
+                except Exception as e:
+                    logger.warning(f'Cancellation check has failed: {e}')
+
+            if self.reason:
+                self.proc.kill()
+                return
+
+    def stop(self):
+        """
+        Stop watching, process has finished
+        """
+
+        self._stopped.set()
+        self.join()
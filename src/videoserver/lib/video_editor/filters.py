@@ -0,0 +1,68 @@
+from functools import lru_cache
+
+#: filters which rotate a frame clockwise by a number of degrees
+# https://ffmpeg.org/ffmpeg-filters.html#transpose
+# https://ffmpeg.org/ffmpeg-filters.html#hflip
+# https://ffmpeg.org/ffmpeg-filters.html#vflip
+ROTATE_FILTERS = {
+    0: (),
+    90: ('transpose=clock',),
+    180: ('hflip', 'vflip'),
+    270: ('transpose=cclock',),
+}
+
+
+def compile_filters(crop=None, scale=None, rotate=None, size=None):
+    """
+    Compile edit operations into a video filter graph.
+    Operations are applied in the order crop, scale, rotate, so `crop` is in source pixels and `scale` is a width
+    before rotation. Rotations are folded into a single step, operations which don't change a frame are skipped and
+    upscaling is done after rotation to rotate less pixels.
+    :param crop: crop editing rules with `width`, `height`, `x` and `y` keys
+    :type crop: dict
+    :param scale: width to scale to, height is scaled proportionally
+    :type scale: int
+    :param rotate: degrees to rotate clockwise, negative values rotate counter clockwise
+    :type rotate: int
+    :param size: width and height of a source frame, no-op steps can't be detected if `None`
+    :type size: tuple
+    :return: filter graph for `-filter:v` option, empty string if there is nothing to do
+    :rtype: str
+    """
+
+    if crop:
+        crop = (crop['width'], crop['height'], crop['x'], crop['y'])
+    return _compile_filters(crop, scale, (rotate or 0) % 360, tuple(size) if size else None)
+
+
+@lru_cache(maxsize=256)
+def _compile_filters(crop, scale, rotate, size):
+    if rotate not in ROTATE_FILTERS:
+        raise ValueError(f'Rotation must be a multiple of 90 degrees, got {rotate}.')
+
+    filters = []
+    width, height = size or (None, None)
+
+    # crop first, every next step works with less pixels
+    # https://ffmpeg.org/ffmpeg-filters.html#crop
+    if crop:
+        crop_width, crop_height, x, y = crop
+        if (crop_width, crop_height) != (width, height):
+            filters.append(f'crop={crop_width}:{crop_height}:{x}:{y}')
+        width, height = crop_width, crop_height
+
+    rotate_filters = ROTATE_FILTERS[rotate]
+    # http://ffmpeg.org/ffmpeg-filters.html#scale
+    # https://trac.ffmpeg.org/wiki/Scaling
+    # -2 keeps aspect ratio and an even height, which is required by most encoders
+    if scale and not (scale == width and height % 2 == 0):
+        if width and scale > width and rotate_filters:
+            # rotate before upscaling, width before rotation is a height after it
+            filters.extend(rotate_filters)
+            filters.append(f'scale=-2:{scale}' if rotate % 180 else f'scale={scale}:-2')
+            rotate_filters = ()
+        else:
+            filters.append(f'scale={scale}:-2')
+    filters.extend(rotate_filters)
+
+    return ','.join(filters)
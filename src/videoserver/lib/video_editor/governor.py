@@ -0,0 +1,113 @@
+import logging
+import os
+from contextlib import contextmanager
+from time import monotonic, sleep
+
+from .exceptions import ProcessCancelled, ProcessTimeout
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CPUGovernor:
+    """
+    Node-level budget of CPU tokens shared by ffmpeg jobs of all workers, one token per core.
+    Every token is a lock file in `lock_dir`, a token is held while its file is locked by `flock`, so tokens are
+    released by the kernel even if a worker is killed. A job runs with as many threads as tokens it holds and is
+    pinned to cores of its tokens, so concurrent jobs don't oversubscribe cores.
+    """
+
+    def __init__(self, lock_dir, tokens=0, poll_interval=0.5):
+        """
+        :param lock_dir: directory for lock files, it must be shared by all workers of a node
+        :type lock_dir: str
+        :param tokens: size of budget, one token per core available to a process if 0
+        :type tokens: int
+        :param poll_interval: seconds between attempts to get tokens when budget is exhausted
+        :type poll_interval: float
+        """
+
+        self.lock_dir = lock_dir
+        self.cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else \
+            list(range(os.cpu_count() or 1))
+        self.tokens = tokens or len(self.cpus)
+        self.poll_interval = poll_interval
+
+    @contextmanager
+    def acquire(self, wanted, deadline=None, is_cancelled=None):
+        """
+        Context manager which holds up to `wanted` free tokens, it waits until at least one token is free.
+        :param wanted: number of tokens a job can use
+        :type wanted: int
+        :param deadline: monotonic time when waiting is stopped with `ProcessTimeout`
+        :type deadline: float
+        :param is_cancelled: callable, waiting is stopped with `ProcessCancelled` when it returns `True`
+        :type is_cancelled: callable
+        :return: id of CPU core of every held token, cores repeat if budget is bigger than a number of cores
+        :rtype: list
+        """
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        wanted = max(1, min(wanted, self.tokens))
+        fds = {}
+        try:
+            while True:
+                for token in range(self.tokens):
+                    if len(fds) == wanted:
+                        break
+                    fd = self._try_lock(token)
+                    if fd is not None:
+                        fds[token] = fd
+                if fds:
+                    break
+                if deadline and monotonic() >= deadline:
+                    raise ProcessTimeout('Time limit was exceeded while waiting for CPU tokens.')
+                if is_cancelled and is_cancelled():
+                    raise ProcessCancelled('Job was cancelled while waiting for CPU tokens.')
+                sleep(self.poll_interval)
+
+            if len(fds) < wanted:
+                logger.debug(f'Job got {len(fds)} of {wanted} CPU tokens.')
+            yield [self.cpus[token % len(self.cpus)] for token in sorted(fds)]
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+
+    def _try_lock(self, token):
+        """
+        Lock a token file without waiting.
+        :param token: token number
+        :type token: int
+        :return: file descriptor of a locked file or `None` if token is held by another job
+        :rtype: int
+        """
+
+        fd = os.open(os.path.join(self.lock_dir, f'cpu-{token}.lock'), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+
+def get_cpu_governor(config):
+    """
+    Get a governor configured by `FFMPEG_GOVERNOR_*` settings.
+    :param config: app config
+    :type config: dict
+    :return: governor or `None` if it's disabled or not supported by a platform
+    :rtype: CPUGovernor
+    """
+
+    if not config.get('FFMPEG_GOVERNOR') or fcntl is None:
+        return None
+    return CPUGovernor(
+        lock_dir=config.get('FFMPEG_GOVERNOR_DIR'),
+        tokens=config.get('FFMPEG_GOVERNOR_TOKENS'),
+        poll_interval=config.get('FFMPEG_GOVERNOR_POLL_INTERVAL')
+    )
@@ -1,8 +1,36 @@
 import abc
+from contextlib import contextmanager
+from time import monotonic
 
 
 class VideoEditorInterface(metaclass=abc.ABCMeta):
 
+    #: monotonic time when running processes are killed, see `watch`
+    deadline = None
+    #: callable which tells if running processes must be killed, see `watch`
+    is_cancelled = None
+
+    @contextmanager
+    def watch(self, timeout=None, is_cancelled=None):
+        """
+        Context manager which limits media tool processes run by the editor inside it.
+        A running process is killed and `ProcessTimeout` is raised when `timeout` is exceeded,
+        `ProcessCancelled` is raised when `is_cancelled` returns `True`.
+        :param timeout: time limit in seconds for all processes together
+        :type timeout: float
+        :param is_cancelled: callable without arguments, it's called periodically from another thread
+        :type is_cancelled: callable
+        :return: editor
+        """
+
+        self.deadline = monotonic() + timeout if timeout else None
+        self.is_cancelled = is_cancelled
+        try:
+            yield self
+        finally:
+            self.deadline = None
+            self.is_cancelled = None
+
     @abc.abstractmethod
     def get_meta(self, filestream):
         """
@@ -15,7 +43,35 @@ class VideoEditorInterface(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def edit_video(self, stream_file, filename, trim=None, crop=None, rotate=None, scale=None):
+    def get_meta_from_path(self, file_path):
+        """
+        Get metadata of file located in a local file system
+        :param file_path: path to a file to get meta from
+        :type file_path: str
+        :return: metadata
+        :rtype: dict
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_media_index_from_path(self, file_path):
+        """
+        Probe everything which is required to plan processing of a video located in a local file system.
+        Index is a dict with `format_name`, `duration`, `size`, `bit_rate`, `video` and `audio` keys.
+        `video` holds the first video stream: `codec_name`, `profile`, `pix_fmt`, `width` and `height` (as displayed),
+        `rotation`, `r_frame_rate`, `time_base`, `bit_rate`, `duration`, `nb_frames`, `gop_size` (max number of frames
+        between keyframes), `keyframe_interval` (max seconds between keyframes), `keyframes` - a list of
+        [pts in seconds, frame number] pairs and `keyframe_offsets` - keyframe byte offsets packed by
+        `videoserver.lib.utils.pack_keyframe_offsets`. `audio` is a list of audio streams.
+        :param file_path: path to a video file
+        :type file_path: str
+        :return: media index
+        :rtype: dict
+        """
+        pass
+
+    @abc.abstractmethod
+    def edit_video(self, stream_file, filename, trim=None, crop=None, rotate=None, scale=None, profile=None):
         """
         Edit video.
         :param stream_file: file to edit
@@ -30,10 +86,137 @@ class VideoEditorInterface(metaclass=abc.ABCMeta):
         :type video_rotate: int
         :param scale: width scale to
         :type scale: int
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
         :return:
         """
         pass
 
+    @abc.abstractmethod
+    def edit_video_from_path(self, path_input, path_output, trim=None, crop=None, rotate=None, scale=None,
+                             profile=None, progress_callback=None, media_index=None):
+        """
+        Edit video located in a local file system, edited video is written into `path_output`.
+        :param path_input: path to a file to edit
+        :type path_input: str
+        :param path_output: path to write edited video to, its extension defines an output format,
+                            mp4 and mov videos are written with faststart if `FFMPEG_FASTSTART` is set
+        :type path_output: str
+        :param trim: trim editing rules
+        :type trim: dict
+        :param crop: crop editing rules
+        :type crop: dict
+        :param video_rotate: rotate degree
+        :type video_rotate: int
+        :param scale: width scale to
+        :type scale: int
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
+        :param progress_callback: called with a dict with `out_time`, `fps` and `speed` keys while video is encoded
+        :type progress_callback: callable
+        :param media_index: media index of `path_input`, see `get_media_index_from_path`
+        :type media_index: dict
+        :return: metadata of edited video, with `encoder_profile` if video was re-encoded using a profile
+        :rtype: dict
+        """
+        pass
+
+    @abc.abstractmethod
+    def edit_video_with_thumbnails_from_path(self, path_input, path_output, thumbnails_amount=None,
+                                             preview_position=None, trim=None, crop=None, rotate=None, scale=None,
+                                             profile=None, progress_callback=None, media_index=None):
+        """
+        Edit video like `edit_video_from_path` does and capture timeline thumbnails and a preview thumbnail of
+        an edited video, video is decoded once when it's possible.
+        See `edit_video_from_path` for arguments which are not listed.
+        :param thumbnails_amount: number of timeline thumbnails, timeline is not captured if `None`
+        :type thumbnails_amount: int
+        :param preview_position: position of a preview thumbnail in an edited video, preview is not captured if `None`
+        :type preview_position: float
+        :return: metadata of edited video, list of (file stream, metadata) of timeline thumbnails,
+                 (file stream, metadata) of a preview thumbnail or `None`
+        :rtype: dict, list, tuple
+        """
+        pass
+
+    @abc.abstractmethod
+    def plan_segments(self, media_index, trim=None, crop=None, rotate=None, scale=None):
+        """
+        Split an edit of a long video into segments which can be encoded in parallel.
+        :param media_index: media index of a video, see `get_media_index_from_path`
+        :type media_index: dict
+        :param trim: trim editing rules
+        :type trim: dict
+        :param crop: crop editing rules
+        :type crop: dict
+        :param rotate: rotate degree
+        :type rotate: int
+        :param scale: width scale to
+        :type scale: int
+        :return: list of (start, end) in seconds or `None` if edit must be done by `edit_video_from_path`
+        :rtype: list
+        """
+        pass
+
+    @abc.abstractmethod
+    def encode_segment_from_path(self, path_input, path_output, start, end, crop=None, rotate=None, scale=None,
+                                 profile=None, progress_callback=None, media_index=None):
+        """
+        Encode a segment of an edit planned by `plan_segments`, audio is not written.
+        :param path_input: path to a file to edit
+        :type path_input: str
+        :param path_output: path to write a segment to
+        :type path_output: str
+        :param start: start position in seconds
+        :type start: float
+        :param end: end position in seconds
+        :type end: float
+        :param crop: crop editing rules
+        :type crop: dict
+        :param rotate: rotate degree
+        :type rotate: int
+        :param scale: width scale to
+        :type scale: int
+        :param profile: name of encoder profile, `FFMPEG_ENCODER_PROFILE` is used if `None`
+        :type profile: str
+        :param progress_callback: called with a dict with `out_time`, `fps` and `speed` keys while video is encoded
+        :type progress_callback: callable
+        :param media_index: media index of `path_input`, see `get_media_index_from_path`
+        :type media_index: dict
+        """
+        pass
+
+    @abc.abstractmethod
+    def concat_segments_from_path(self, paths_segments, path_input, path_output, trim=None):
+        """
+        Join segments encoded by `encode_segment_from_path` without re-encoding, audio is taken from a source video.
+        :param paths_segments: segment file paths in playback order
+        :type paths_segments: list
+        :param path_input: path to a source video
+        :type path_input: str
+        :param path_output: path to write edited video to
+        :type path_output: str
+        :param trim: trim editing rules of an edit
+        :type trim: dict
+        :return: metadata of edited video
+        :rtype: dict
+        """
+        pass
+
+    @abc.abstractmethod
+    def remux_faststart_from_path(self, path_input, path_output):
+        """
+        Remux mp4 or mov video located in a local file system with `moov` atom moved before media data,
+        streams are copied without re-encoding.
+        :param path_input: path to a video file
+        :type path_input: str
+        :param path_output: path to write remuxed video to
+        :type path_output: str
+        :return: metadata of remuxed video
+        :rtype: dict
+        """
+        pass
+
     @abc.abstractmethod
     def capture_thumbnail(self, stream_file, filename, duration, position, crop, rotate):
         """
@@ -56,7 +239,26 @@ class VideoEditorInterface(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def capture_timeline_thumbnails(self, stream_file, filename, duration, thumbnails_amount):
+    def capture_thumbnail_from_path(self, path_video, duration, position, crop=None, rotate=0):
+        """
+        Capture frame at a position of a video located in a local file system.
+        :param path_video: path to a video file
+        :type path_video: str
+        :param duration: video's duration
+        :type duration: int
+        :param position: video position to capture a frame
+        :type position: int
+        :param crop: crop editing rules
+        :type crop: dict
+        :param rotate: rotate degree
+        :type rotate: int
+        :return: file stream, metadata
+        :rtype: bytes, dict
+        """
+        pass
+
+    @abc.abstractmethod
+    def capture_timeline_thumbnails(self, stream_file, filename, duration, thumbnails_amount, mode='accurate'):
         """
         Capture thumbnails for timeline.
         :param stream_file: video file
@@ -67,6 +269,30 @@ class VideoEditorInterface(metaclass=abc.ABCMeta):
         :type duration: int
         :param thumbnails_amount: total number of thumbnails to capture
         :type thumbnails_amount: int
+        :param mode: 'accurate' - capture frames exactly at positions, 'fast' - capture keyframes near positions
+        :type mode: str
+        :return: file stream, metadata generator
+        :return: bytes, generator
+        """
+        pass
+
+    @abc.abstractmethod
+    def capture_timeline_thumbnails_from_path(self, path_video, duration, thumbnails_amount, mode='accurate',
+                                              progress_callback=None, media_index=None):
+        """
+        Capture thumbnails for timeline of a video located in a local file system.
+        :param path_video: path to a video file
+        :type path_video: str
+        :param duration: video's duration
+        :type duration: int
+        :param thumbnails_amount: total number of thumbnails to capture
+        :type thumbnails_amount: int
+        :param mode: 'accurate' - capture frames exactly at positions, 'fast' - capture keyframes near positions
+        :type mode: str
+        :param progress_callback: called with a dict with `out_time`, `fps` and `speed` keys while frames are captured
+        :type progress_callback: callable
+        :param media_index: media index of a video, see `get_media_index_from_path`
+        :type media_index: dict
         :return: file stream, metadata generator
         :return: bytes, generator
         """
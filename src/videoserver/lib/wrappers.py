@@ -0,0 +1,24 @@
+from tempfile import NamedTemporaryFile
+
+from flask import Request as FlaskRequest
+from flask import current_app as app
+
+
+class Request(FlaskRequest):
+    """
+    Enhance default flask Request
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        """
+        Spool every uploaded file into a named temporary file in `UPLOAD_TMP_DIR`.
+        Werkzeug keeps small files in memory and big ones in unnamed temporary files, named file lets
+        a video editor probe an upload by path and a storage move it without reading it into memory.
+        Temporary file is removed when request is closed.
+        """
+
+        suffix = None
+        if filename and '.' in filename:
+            suffix = f".{filename.rsplit('.', 1)[-1].lower()}"
+
+        return NamedTemporaryFile('wb+', suffix=suffix, dir=app.config.get('UPLOAD_TMP_DIR') or None)
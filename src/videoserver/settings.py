@@ -1,4 +1,5 @@
 import os
+import tempfile
 from distutils.util import strtobool as _strtobool
 
 
@@ -85,6 +86,43 @@ CODEC_MIMETYPE_MAP = {
 MEDIA_STORAGE = env('MEDIA_STORAGE', 'filesystem')
 DEFAULT_PATH = os.path.join(BASE_PATH, 'media', 'projects')
 FS_MEDIA_STORAGE_PATH = env('FS_MEDIA_STORAGE_PATH', DEFAULT_PATH)
+#: amazon s3 or any s3 compatible storage (MinIO, Ceph, etc), used when `MEDIA_STORAGE` is 'amazon'
+AMAZON_ACCESS_KEY_ID = env('AMAZON_ACCESS_KEY_ID', '')
+AMAZON_SECRET_ACCESS_KEY = env('AMAZON_SECRET_ACCESS_KEY', '')
+AMAZON_REGION = env('AMAZON_REGION', 'us-east-1')
+AMAZON_CONTAINER_NAME = env('AMAZON_CONTAINER_NAME', '')
+# custom endpoint for s3 compatible storages, e.g. http://localhost:9000 for MinIO
+AMAZON_ENDPOINT_URL = env('AMAZON_ENDPOINT_URL', '')
+# size of http connections pool
+AMAZON_S3_MAX_POOL_CONNECTIONS = int(env('AMAZON_S3_MAX_POOL_CONNECTIONS', 20))
+# files bigger than threshold are uploaded by parts of `AMAZON_S3_MULTIPART_CHUNKSIZE` bytes in parallel
+AMAZON_S3_MULTIPART_THRESHOLD = int(env('AMAZON_S3_MULTIPART_THRESHOLD', 64 * 1024 * 1024))
+AMAZON_S3_MULTIPART_CHUNKSIZE = int(env('AMAZON_S3_MULTIPART_CHUNKSIZE', 16 * 1024 * 1024))
+AMAZON_S3_MAX_CONCURRENCY = int(env('AMAZON_S3_MAX_CONCURRENCY', 8))
+# segments of a segmented edit are encoded from a presigned url, so ffmpeg requests only byte ranges it reads,
+# ffmpeg must be built with https support, set to 0 to download an entire source for every segment instead
+AMAZON_S3_PRESIGNED_URL_EXPIRES = int(env('AMAZON_S3_PRESIGNED_URL_EXPIRES', 6 * 60 * 60))
+#: max size of a chunk in bytes when media file is streamed from a storage
+STREAM_CHUNK_SIZE = int(env('STREAM_CHUNK_SIZE', 64 * 1024))
+#: `max-age` in seconds of `Cache-Control` header for raw media files, clients revalidate them using ETag afterwards
+MEDIA_CACHE_MAX_AGE = int(env('MEDIA_CACHE_MAX_AGE', 0))
+#: max length in bytes of a response for an open-ended range request (`bytes=N-`), 0 - not limited
+MAX_RANGE_CHUNK_SIZE = int(env('MAX_RANGE_CHUNK_SIZE', 2 * 1024 * 1024))
+#: max number of ranges in a `multipart/byteranges` response
+MAX_RANGES_PER_REQUEST = int(env('MAX_RANGES_PER_REQUEST', 16))
+#: how raw media files are delivered to a client:
+# 'stream' - read by chunks and stream via python worker
+# 'sendfile' - hand an opened file to `wsgi.file_wrapper`, so wsgi server can use `os.sendfile`
+# 'x-accel-redirect' - respond with `X-Accel-Redirect` header, nginx serves a file itself
+# 'x-sendfile' - respond with `X-Sendfile` header, apache/lighttpd serves a file itself
+# all modes except 'stream' work only with storages which keep files in a local file system
+MEDIA_DELIVERY_MODE = env('MEDIA_DELIVERY_MODE', 'stream')
+#: nginx `internal` location which is an alias for `FS_MEDIA_STORAGE_PATH`, used by 'x-accel-redirect' mode
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+#: directory for temporary files of uploads, system default if empty
+# keep it on the same file system as `FS_MEDIA_STORAGE_PATH`, then uploads are moved into a storage without copying
+UPLOAD_TMP_DIR = env('UPLOAD_TMP_DIR', '')
 
 #: media tool
 DEFAULT_MEDIA_TOOL = env('DEFAULT_MEDIA_TOOL', 'ffmpeg')
@@ -106,7 +144,7 @@ MIN_VIDEO_HEIGHT = env('MIN_VIDEO_HEIGHT', 180)
 MAX_VIDEO_HEIGHT = env('MAX_VIDEO_HEIGHT', 2160)
 
 #: ffmpeg command line defaults
-# the default is the number of available CPUs (0)
+# the default is the number of available CPUs (0), it's used only when `FFMPEG_GOVERNOR` is disabled
 FFMPEG_THREADS = env('FFMPEG_THREADS', '0')
 # The default is medium.
 # The preset determines how fast the encoding process will be – at the expense of compression efficiency.
@@ -114,3 +152,118 @@ FFMPEG_THREADS = env('FFMPEG_THREADS', '0')
 # but the file size will be larger when compared to medium. The visual quality will be the same.
 # Valid presets are ultrafast, superfast, veryfast, faster, fast, medium, slow, slower, veryslow and placebo.
 FFMPEG_PRESET = env('FFMPEG_PRESET', 'medium')
+
+#: time limits of media processing
+# a processing job is killed after `FFMPEG_TIMEOUT_BASE` + `FFMPEG_TIMEOUT_FACTOR` * video duration seconds
+FFMPEG_TIMEOUT_BASE = float(env('FFMPEG_TIMEOUT_BASE', 300))
+FFMPEG_TIMEOUT_FACTOR = float(env('FFMPEG_TIMEOUT_FACTOR', 10))
+# time limit in seconds of probing a single file
+FFPROBE_TIMEOUT = float(env('FFPROBE_TIMEOUT', 120))
+# interval in seconds of checking time limits and cancellation of a running process
+FFMPEG_WATCHDOG_INTERVAL = float(env('FFMPEG_WATCHDOG_INTERVAL', 2))
+
+#: min interval in seconds between updates of `progress` of a processing project in db
+PROGRESS_UPDATE_INTERVAL = float(env('PROGRESS_UPDATE_INTERVAL', 2))
+
+#: encoder profiles, edited video is encoded with the same codec as a source using options of a selected profile
+# profile can be selected per edit request, `FFMPEG_ENCODER_PROFILE` is used by default
+# videos with codecs which are not listed here are encoded by ffmpeg defaults for a container with `FFMPEG_PRESET`
+FFMPEG_ENCODER_PROFILE = env('FFMPEG_ENCODER_PROFILE', 'balanced')
+FFMPEG_ENCODER_PROFILES = {
+    # https://trac.ffmpeg.org/wiki/Encode/H.264
+    'h264': {
+        'fast': ('-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23'),
+        'balanced': ('-c:v', 'libx264', '-preset', FFMPEG_PRESET, '-crf', '23'),
+        'quality': ('-c:v', 'libx264', '-preset', 'slow', '-crf', '18'),
+    },
+    # https://trac.ffmpeg.org/wiki/Encode/VP8
+    'vp8': {
+        'fast': ('-c:v', 'libvpx', '-deadline', 'realtime', '-cpu-used', '8', '-crf', '10', '-b:v', '2M'),
+        'balanced': ('-c:v', 'libvpx', '-deadline', 'good', '-cpu-used', '4', '-crf', '10', '-b:v', '2M'),
+        'quality': ('-c:v', 'libvpx', '-deadline', 'good', '-cpu-used', '1', '-crf', '6', '-b:v', '4M'),
+    },
+    # https://trac.ffmpeg.org/wiki/Encode/VP9
+    # https://developers.google.com/media/vp9/settings/vod
+    'vp9': {
+        'fast': ('-c:v', 'libvpx-vp9', '-row-mt', '1', '-deadline', 'realtime', '-cpu-used', '8',
+                 '-crf', '33', '-b:v', '0'),
+        'balanced': ('-c:v', 'libvpx-vp9', '-row-mt', '1', '-deadline', 'good', '-cpu-used', '4',
+                     '-crf', '33', '-b:v', '0'),
+        'quality': ('-c:v', 'libvpx-vp9', '-row-mt', '1', '-deadline', 'good', '-cpu-used', '1',
+                    '-crf', '31', '-b:v', '0'),
+    },
+    # https://trac.ffmpeg.org/wiki/Encode/AV1
+    # builds with SVT-AV1 can use ('-c:v', 'libsvtav1', '-preset', '10', '-crf', '35') and similar
+    'av1': {
+        'fast': ('-c:v', 'libaom-av1', '-row-mt', '1', '-usage', 'realtime', '-cpu-used', '8', '-crf', '35',
+                 '-b:v', '0'),
+        'balanced': ('-c:v', 'libaom-av1', '-row-mt', '1', '-cpu-used', '6', '-crf', '32', '-b:v', '0'),
+        'quality': ('-c:v', 'libaom-av1', '-row-mt', '1', '-cpu-used', '4', '-crf', '30', '-b:v', '0'),
+    },
+    # https://trac.ffmpeg.org/wiki/TheoraVorbisEncodingGuide
+    'theora': {
+        'fast': ('-c:v', 'libtheora', '-q:v', '5'),
+        'balanced': ('-c:v', 'libtheora', '-q:v', '7'),
+        'quality': ('-c:v', 'libtheora', '-q:v', '9'),
+    },
+}
+
+#: adaptive encoder profile
+# edit requests without `profile` get the slowest profile which is expected to finish an edit within
+# `FFMPEG_TARGET_TURNAROUND` seconds, so short clips keep high quality and long videos don't block workers
+FFMPEG_ADAPTIVE_PROFILE = strtobool(env('FFMPEG_ADAPTIVE_PROFILE', 'True'))
+FFMPEG_TARGET_TURNAROUND = float(env('FFMPEG_TARGET_TURNAROUND', 300))
+# number of edits which can be processed at the same time, more edits in processing make expected time longer
+FFMPEG_ADAPTIVE_WORKERS = int(env('FFMPEG_ADAPTIVE_WORKERS', 2))
+# profiles from the slowest to the fastest and their expected speed in megapixel-seconds of video
+# encoded per second by a worker, e.g. 1.0 is 720p video encoded at a realtime speed
+FFMPEG_ADAPTIVE_PROFILE_SPEEDS = (
+    ('quality', 2.0),
+    ('balanced', 5.0),
+    ('fast', 15.0),
+)
+
+#: segment encoding
+# edits which re-encode more than `FFMPEG_SEGMENT_MIN_DURATION` seconds of video are split at keyframes into segments
+# of about `FFMPEG_SEGMENT_DURATION` seconds, segments are encoded by parallel tasks on all workers and joined
+FFMPEG_SEGMENT_ENCODING = strtobool(env('FFMPEG_SEGMENT_ENCODING', 'True'))
+FFMPEG_SEGMENT_MIN_DURATION = float(env('FFMPEG_SEGMENT_MIN_DURATION', 600))
+FFMPEG_SEGMENT_DURATION = float(env('FFMPEG_SEGMENT_DURATION', 120))
+
+#: timeline thumbnails
+# thumbnails which are closer to each other than `TIMELINE_SEEK_INTERVAL` seconds are captured in a single decode pass,
+# otherwise each thumbnail is captured by an input seek, which decodes only frames from the nearest keyframe.
+# Keep it around a GOP duration of usual sources.
+TIMELINE_SEEK_INTERVAL = float(env('TIMELINE_SEEK_INTERVAL', 10))
+# max number of thumbnails captured by a single ffmpeg process when seeking
+TIMELINE_SEEK_BATCH_SIZE = int(env('TIMELINE_SEEK_BATCH_SIZE', 10))
+
+#: trim
+# trim-only edits re-encode only partial GOPs at the boundaries and copy the rest of h264 video
+FFMPEG_SMART_TRIM = strtobool(env('FFMPEG_SMART_TRIM', 'True'))
+# quality of re-encoded boundaries, should be close to a source to make a seam invisible
+FFMPEG_SMART_TRIM_CRF = int(env('FFMPEG_SMART_TRIM_CRF', 18))
+
+#: rotate
+# rotate-only edits of mp4 and mov videos set a display matrix and copy streams, players apply rotation on display
+# requires ffmpeg 6.0+ (`-display_rotation` input option), videos are re-encoded with older ffmpeg builds
+FFMPEG_METADATA_ROTATION = strtobool(env('FFMPEG_METADATA_ROTATION', 'True'))
+
+#: faststart
+# mp4 and mov videos are written with `moov` atom before media data, so playback starts without fetching a file tail,
+# uploads which are not faststart are remuxed with stream copy
+FFMPEG_FASTSTART = strtobool(env('FFMPEG_FASTSTART', 'True'))
+
+#: cpu governor
+# ffmpeg jobs of all workers on a node share a budget of cpu tokens, one token per core. A job runs with as many
+# threads as tokens it got and is pinned to cores of its tokens, so concurrent jobs don't thrash each other.
+# `FFMPEG_THREADS` is used only when governor is disabled.
+FFMPEG_GOVERNOR = strtobool(env('FFMPEG_GOVERNOR', 'True'))
+# lock files of tokens, directory must be shared by all workers of a node
+FFMPEG_GOVERNOR_DIR = env('FFMPEG_GOVERNOR_DIR', os.path.join(tempfile.gettempdir(), 'videoserver-cpu'))
+# size of budget, all cores available to a worker if 0
+FFMPEG_GOVERNOR_TOKENS = int(env('FFMPEG_GOVERNOR_TOKENS', 0))
+# encoding gets a token per that number of pixels of a frame, 4 tokens for 720p and 9 tokens for 1080p
+FFMPEG_GOVERNOR_PIXELS_PER_TOKEN = int(env('FFMPEG_GOVERNOR_PIXELS_PER_TOKEN', 640 * 360))
+# seconds between attempts to get tokens when all tokens are held
+FFMPEG_GOVERNOR_POLL_INTERVAL = float(env('FFMPEG_GOVERNOR_POLL_INTERVAL', 0.5))
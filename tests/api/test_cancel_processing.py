@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from bson import ObjectId
+from flask import url_for
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_cancel_processing_success(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        # imitate a running task
+        test_app.mongo.db.projects.update_one(
+            {'_id': ObjectId(project['_id'])},
+            {'$set': {'processing.video': True, 'jobs.video': 'job-id'}}
+        )
+
+        url = url_for('projects.cancel_processing', project_id=project['_id'], kind='video')
+        resp = client.delete(url)
+        assert resp.status == '204 NO CONTENT'
+
+        resp = client.get(url_for('projects.retrieve_edit_destroy_project', project_id=project['_id']))
+        resp_data = json.loads(resp.data)
+        assert resp_data['processing']['video'] is False
+        assert resp_data['progress']['video'] is None
+        assert resp_data['jobs']['video'] is None
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_cancel_processing_fails(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        # task is not running
+        url = url_for('projects.cancel_processing', project_id=project['_id'], kind='thumbnails_timeline')
+        resp = client.delete(url)
+        assert resp.status == '404 NOT FOUND'
+
+        # unknown task
+        url = url_for('projects.cancel_processing', project_id=project['_id'], kind='unknown')
+        resp = client.delete(url)
+        assert resp.status == '404 NOT FOUND'
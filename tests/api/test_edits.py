@@ -0,0 +1,152 @@
+import json
+from unittest import mock
+
+import pytest
+from bson import ObjectId
+from flask import url_for
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_edits_apply_undo_redo(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.retrieve_apply_clear_edits', project_id=project['_id'])
+        resp = client.get(url)
+        assert resp.status == '200 OK'
+        assert json.loads(resp.data) == {'list': [], 'position': 0}
+
+        # version 1 is not changed by an edit list
+        resp = client.post(url, data=json.dumps({"trim": {"start": 2, "end": 12}}), content_type='application/json')
+        assert resp.status == '201 CREATED'
+        assert json.loads(resp.data) == {'list': [{'trim': {'start': 2.0, 'end': 12.0}}], 'position': 1}
+
+        # edits are validated against a result of previous edits
+        resp = client.post(url, data=json.dumps({"trim": {"start": 1, "end": 11}}), content_type='application/json')
+        assert resp.status == '400 BAD REQUEST'
+        assert json.loads(resp.data) == {'trim': [{'end': ["outside of initial video's length"]}]}
+        resp = client.post(url, data=json.dumps({"profile": "fast"}), content_type='application/json')
+        assert resp.status == '400 BAD REQUEST'
+
+        resp = client.post(url, data=json.dumps({"scale": 640, "rotate": -90}), content_type='application/json')
+        assert resp.status == '201 CREATED'
+        assert json.loads(resp.data)['list'][1] == {'scale': 640, 'rotate': 270}
+
+        url_undo = url_for('projects.undo_redo_edit', project_id=project['_id'], action='undo')
+        url_redo = url_for('projects.undo_redo_edit', project_id=project['_id'], action='redo')
+        resp = client.post(url_undo)
+        assert resp.status == '200 OK'
+        assert json.loads(resp.data)['position'] == 1
+        resp = client.post(url_redo)
+        assert json.loads(resp.data)['position'] == 2
+        resp = client.post(url_redo)
+        assert resp.status == '400 BAD REQUEST'
+        assert json.loads(resp.data) == {'edits': ['There is nothing to redo.']}
+        resp = client.post(url_for('projects.undo_redo_edit', project_id=project['_id'], action='fork'))
+        assert resp.status == '404 NOT FOUND'
+
+        # undone edit is dropped by a new edit
+        client.post(url_undo)
+        resp = client.post(url, data=json.dumps({"crop": {"width": 640, "height": 480, "x": 0, "y": 0}}),
+                           content_type='application/json')
+        assert json.loads(resp.data) == {
+            'list': [{'trim': {'start': 2.0, 'end': 12.0}}, {'crop': {'width': 640, 'height': 480, 'x': 0, 'y': 0}}],
+            'position': 2
+        }
+
+        resp = client.delete(url)
+        assert resp.status == '204 NO CONTENT'
+        assert json.loads(client.get(url).data) == {'list': [], 'position': 0}
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': True},)], indirect=True)
+def test_edits_409_response(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.retrieve_apply_clear_edits', project_id=project['_id'])
+        client.post(url, data=json.dumps({"scale": 640}), content_type='application/json')
+
+        # finished destructive edit would drop an edit list, so it's not changed while a video is processing
+        test_app.mongo.db.projects.find_one_and_update(
+            {'_id': ObjectId(project['_id'])},
+            {'$set': {'processing.video': True}}
+        )
+        resp = client.post(url, data=json.dumps({"rotate": 90}), content_type='application/json')
+        assert resp.status == '409 CONFLICT'
+        assert json.loads(resp.data) == {"processing": ["Task edit video is still processing"]}
+        resp = client.post(url_for('projects.undo_redo_edit', project_id=project['_id'], action='undo'))
+        assert resp.status == '409 CONFLICT'
+        resp = client.delete(url)
+        assert resp.status == '409 CONFLICT'
+        assert json.loads(client.get(url).data) == {'list': [{'scale': 640}], 'position': 1}
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': True},)], indirect=True)
+def test_edits_render(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.retrieve_apply_clear_edits', project_id=project['_id'])
+        url_video = url_for('projects.get_raw_video', project_id=project['_id'])
+        client.post(url, data=json.dumps({"trim": {"start": 2, "end": 12}}), content_type='application/json')
+        client.post(url, data=json.dumps({"scale": 640}), content_type='application/json')
+
+        # edits are not rendered yet
+        resp = client.get(url_for('projects.retrieve_edit_destroy_project', project_id=project['_id']))
+        assert json.loads(resp.data)['edits']['render'] is None
+
+        # rendering is started once when a concurrent request started it after this request read a project
+        project_doc = test_app.mongo.db.projects.find_one({'_id': ObjectId(project['_id'])})
+        test_app.mongo.db.projects.update_one({'_id': project_doc['_id']}, {'$set': {'processing.video': True}})
+        with mock.patch('videoserver.apps.projects.routes.GetRawVideo._get_project_or_404', return_value=project_doc), \
+                mock.patch('videoserver.apps.projects.routes.render_edits.apply_async') as apply_async:
+            resp = client.get(url_video)
+            assert resp.status == '202 ACCEPTED'
+            assert not apply_async.called
+        test_app.mongo.db.projects.update_one({'_id': project_doc['_id']}, {'$set': {'processing.video': False}})
+
+        # the first request renders edits, load of workers is queried once for all of them
+        with mock.patch('videoserver.apps.projects.tasks._get_processing_load', return_value=1.0) as get_load:
+            resp = client.get(url_video)
+            assert get_load.call_count == 1
+        assert resp.status == '202 ACCEPTED'
+        assert json.loads(resp.data) == {"processing": True}
+        resp = client.get(url_video)
+        assert resp.status == '200 OK'
+        edited_length = resp.content_length
+        assert edited_length < project['metadata']['size']
+
+        # source video is not changed
+        resp = client.get(url_for('projects.retrieve_edit_destroy_project', project_id=project['_id']))
+        resp_data = json.loads(resp.data)
+        assert resp_data['metadata'] == project['metadata']
+        assert resp_data['version'] == project['version']
+        assert len(resp_data['edits']['source_sha256']) == 64
+        # raw video is described by a render
+        assert resp_data['edits']['render']['metadata']['width'] == 640
+        assert resp_data['edits']['render']['metadata']['duration'] == 10.0
+        assert resp_data['edits']['render']['metadata']['size'] == edited_length
+
+        # destructive edit would change a source of an edit list
+        resp = client.put(
+            url_for('projects.retrieve_edit_destroy_project', project_id=project['_id']),
+            data=json.dumps({"scale": 320}),
+            content_type='application/json'
+        )
+        assert resp.status == '400 BAD REQUEST'
+
+        # undo and branches use cached renders
+        with mock.patch('videoserver.apps.projects.tasks._render_edit', side_effect=AssertionError):
+            client.post(url_for('projects.undo_redo_edit', project_id=project['_id'], action='undo'))
+            resp = client.get(url_video)
+            assert resp.status == '200 OK'
+            assert resp.content_length > edited_length
+            client.post(url_for('projects.undo_redo_edit', project_id=project['_id'], action='redo'))
+
+            resp = client.post(url_for('projects.duplicate_project', project_id=project['_id']))
+            branch = json.loads(resp.data)
+            assert branch['edits']['list'] == [{'trim': {'start': 2.0, 'end': 12.0}}, {'scale': 640}]
+            resp = client.get(url_for('projects.get_raw_video', project_id=branch['_id']))
+            assert resp.status == '200 OK'
+            assert resp.content_length == edited_length
@@ -32,7 +32,112 @@ def test_get_raw_video_range(test_app, client, projects):
         assert resp.status == '206 PARTIAL CONTENT'
         assert resp.mimetype == 'video/mp4'
         assert resp.is_streamed
-        # TODO check resp.content_length
+        # open-ended range is limited by MAX_RANGE_CHUNK_SIZE
+        chunk_size = test_app.config['MAX_RANGE_CHUNK_SIZE']
+        assert resp.content_length == chunk_size
+        assert resp.headers['Content-Range'] == f"bytes 200-{200 + chunk_size - 1}/{project['metadata']['size']}"
+        assert len(resp.data) == chunk_size
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_range_end(test_app, client, projects):
+    project = projects[0]
+    size = project['metadata']['size']
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        resp = client.get(
+            url,
+            headers={"Range": "bytes=100-1099"}
+        )
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.content_length == 1000
+        assert resp.headers['Content-Range'] == f'bytes 100-1099/{size}'
+        assert len(resp.data) == 1000
+
+        # suffix range
+        resp = client.get(
+            url,
+            headers={"Range": "bytes=-500"}
+        )
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.content_length == 500
+        assert resp.headers['Content-Range'] == f'bytes {size - 500}-{size - 1}/{size}'
+
+        # end is outside of the file
+        resp = client.get(
+            url,
+            headers={"Range": f"bytes={size - 10}-{size + 100}"}
+        )
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.content_length == 10
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_multiple_ranges(test_app, client, projects):
+    project = projects[0]
+    size = project['metadata']['size']
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        resp = client.get(
+            url,
+            headers={"Range": "bytes=0-99,200-299"}
+        )
+        full_resp = client.get(url)
+
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.mimetype == 'multipart/byteranges'
+        assert resp.content_length == len(resp.data)
+        assert f'Content-Range: bytes 0-99/{size}'.encode() in resp.data
+        assert f'Content-Range: bytes 200-299/{size}'.encode() in resp.data
+        assert full_resp.data[200:300] in resp.data
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_range_not_satisfiable(test_app, client, projects):
+    project = projects[0]
+    size = project['metadata']['size']
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        resp = client.get(
+            url,
+            headers={"Range": f"bytes={size}-"}
+        )
+
+        assert resp.status == '416 REQUESTED RANGE NOT SATISFIABLE'
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_seek(test_app, client, projects):
+    project = projects[0]
+    size = project['metadata']['size']
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        full_resp = client.get(url)
+
+        # keyframes are at 0, 8.4 and 12.96 seconds, `moov` atom is before them after faststart remux
+        resp = client.get(url, query_string={'t': 10}, headers={"Range": "bytes=0-99"})
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.headers['X-Keyframe-Time'] == '8.4'
+        start = int(resp.headers['Content-Range'].split()[1].split('-')[0])
+        assert resp.headers['Content-Range'] == f'bytes {start}-{size - 1}/{size}'
+        assert resp.data == full_resp.data[start:]
+
+        resp = client.get(url, query_string={'t': 1})
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.headers['X-Keyframe-Time'] == '0.0'
+        first_start = int(resp.headers['Content-Range'].split()[1].split('-')[0])
+        chunk_size = test_app.config['MAX_RANGE_CHUNK_SIZE']
+        assert resp.headers['Content-Range'] == f'bytes {first_start}-{first_start + chunk_size - 1}/{size}'
+        # the first keyframe follows `moov` atom, the next one is 8.4 seconds of media data later
+        assert full_resp.data.find(b'moov') < first_start < start - 1900000
+
+        resp = client.get(url, query_string={'t': 'abc'})
+        assert resp.status == '400 BAD REQUEST'
+        assert resp.json == {'t': ['must be a non-negative number']}
 
 
 @pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
@@ -52,3 +157,68 @@ def test_get_raw_video_409_resp(test_app, client, projects):
         resp = client.get(url)
 
         assert resp.status == '409 CONFLICT'
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_x_accel_redirect(test_app, client, projects):
+    project = projects[0]
+    test_app.config['MEDIA_DELIVERY_MODE'] = 'x-accel-redirect'
+    test_app.config['MEDIA_ACCEL_REDIRECT_PREFIX'] = '/protected-media/'
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        resp = client.get(
+            url,
+            headers={"Range": "bytes=200-"}
+        )
+
+        assert resp.status == '200 OK'
+        assert resp.mimetype == 'video/mp4'
+        assert resp.headers['X-Accel-Redirect'] == f"/protected-media/{project['storage_id']}"
+        assert resp.data == b''
+
+        # front server doesn't know a range of a seek, so it's served by the app
+        resp = client.get(url, query_string={'t': 10})
+        assert resp.status == '206 PARTIAL CONTENT'
+        assert resp.headers['X-Keyframe-Time'] == '8.4'
+        assert 'X-Accel-Redirect' not in resp.headers
+        start, end = map(int, resp.headers['Content-Range'].split()[1].split('/')[0].split('-'))
+        assert start > 0
+        assert len(resp.data) == end - start + 1
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_conditional(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        resp = client.get(url)
+        assert resp.status == '200 OK'
+        assert resp.headers['ETag'] == f'"{project["etag"]}"'
+        assert 'Last-Modified' in resp.headers
+        assert 'Cache-Control' in resp.headers
+
+        resp = client.get(url, headers={'If-None-Match': resp.headers['ETag']})
+        assert resp.status == '304 NOT MODIFIED'
+        assert resp.data == b''
+
+        # range is ignored if `If-Range` doesn't match
+        resp = client.get(url, headers={'Range': 'bytes=0-99', 'If-Range': '"outdated"'})
+        assert resp.status == '200 OK'
+        resp = client.get(url, headers={'Range': 'bytes=0-99', 'If-Range': f'"{project["etag"]}"'})
+        assert resp.status == '206 PARTIAL CONTENT'
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_get_raw_video_head(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.get_raw_video', project_id=project['_id'])
+        resp = client.head(url)
+
+        assert resp.status == '200 OK'
+        assert resp.content_length == project['metadata']['size']
+        assert resp.headers['ETag'] == f'"{project["etag"]}"'
+        assert resp.data == b''
@@ -1,8 +1,10 @@
+import hashlib
 import json
 from io import BytesIO
 from unittest import mock
 
 import pytest
+from bson import ObjectId
 from flask import url_for
 from pymongo.errors import ServerSelectionTimeoutError
 
@@ -36,6 +38,51 @@ def test_upload_project_success(test_app, client, filestreams):
         assert resp_data['processing'] == {'video': False, 'thumbnail_preview': False, 'thumbnails_timeline': False}
         assert resp_data['thumbnails'] == {'timeline': [], 'preview': None}
         assert resp_data['url'] == url_for('projects.get_raw_video', project_id=resp_data["_id"], _external=True)
+        # `moov` atom of uploaded video is at the end
+        assert resp_data['metadata']['faststart'] is True
+        assert resp_data['metadata']['source_sha256'] == hashlib.sha256(mp4_stream).hexdigest()
+        # media index is kept apart from a project
+        assert 'media_index' not in resp_data
+        media_index = test_app.mongo.db.media_index.find_one({'_id': ObjectId(resp_data['_id'])})
+        assert media_index['video']['keyframes'] == [[0.0, 0], [8.4, 210], [12.96, 324]]
+        assert media_index['video']['gop_size'] == 210
+        assert media_index['audio'][0]['codec_name'] == 'aac'
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_upload_project_index_pending(test_app, client, filestreams):
+    from videoserver.apps.projects.tasks import index_video
+
+    mp4_stream = filestreams[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.list_upload_project')
+        with mock.patch('videoserver.apps.projects.routes.index_video.apply_async') as apply_async:
+            resp = client.post(
+                url,
+                data={
+                    'file': (BytesIO(mp4_stream), 'sample_0.mp4')
+                },
+                content_type='multipart/form-data'
+            )
+        resp_data = json.loads(resp.data)
+        assert resp.status == '201 CREATED'
+        # uploaded video is stored as is, it's processing until the task remuxes it
+        assert resp_data['processing']['video'] is True
+        assert resp_data['metadata']['faststart'] is False
+        assert 'source_sha256' not in resp_data['metadata']
+        assert test_app.fs.get(resp_data['storage_id']) == mp4_stream
+        assert test_app.mongo.db.media_index.find_one({'_id': ObjectId(resp_data['_id'])}) is None
+
+        project = test_app.mongo.db.projects.find_one({'_id': ObjectId(resp_data['_id'])})
+        assert apply_async.call_args.kwargs['task_id'] == project['jobs']['video']
+        index_video.run(project)
+        project = test_app.mongo.db.projects.find_one({'_id': ObjectId(resp_data['_id'])})
+        assert project['processing']['video'] is False
+        assert project['metadata']['faststart'] is True
+        assert project['metadata']['source_sha256'] == hashlib.sha256(mp4_stream).hexdigest()
+        assert project['etag'] != resp_data['etag']
+        assert test_app.mongo.db.media_index.find_one({'_id': project['_id']})
 
 
 @pytest.mark.parametrize('filestreams', [('sample_0.jpg',)], indirect=True)
@@ -58,6 +105,86 @@ def test_upload_project_wrong_codec(test_app, client, filestreams):
         assert resp_data['file'] == ["Codec: 'mjpeg' is not supported."]
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_upload_project_by_digest(test_app, client, filestreams):
+    mp4_stream = filestreams[0]
+    digest = hashlib.sha256(mp4_stream).hexdigest()
+
+    with test_app.test_request_context():
+        url = url_for('projects.list_upload_project')
+        # content is unknown
+        resp = client.post(url, data={'sha256': digest, 'filename': 'sample_0.mp4'})
+        assert resp.status == '404 NOT FOUND'
+
+        resp = client.post(
+            url,
+            data={
+                'file': (BytesIO(mp4_stream), 'sample_0.mp4')
+            },
+            content_type='multipart/form-data'
+        )
+        assert resp.status == '201 CREATED'
+        first_project = json.loads(resp.data)
+
+        # content is linked instead of uploading it again
+        resp = client.post(url, data={'sha256': digest, 'filename': 'sample_0.mp4'})
+        resp_data = json.loads(resp.data)
+        assert resp.status == '201 CREATED'
+        assert resp_data['storage_id'] != first_project['storage_id']
+        assert resp_data['mime_type'] == 'video/mp4'
+        assert resp_data['original_filename'] == 'sample_0.mp4'
+        assert resp_data['metadata'] == first_project['metadata']
+        # upload was remuxed to faststart, remuxed content is linked
+        assert first_project['metadata']['source_sha256'] == digest
+        assert test_app.fs.get(resp_data['storage_id']) == test_app.fs.get(first_project['storage_id'])
+
+        resp = client.post(url, data={'sha256': 'abc', 'filename': 'sample_0.mp4'})
+        assert resp.status == '400 BAD REQUEST'
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_upload_project_by_digest_s3(test_app, client, filestreams):
+    pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    from videoserver.apps.projects.tasks import index_video
+    from videoserver.lib.storage.amazon_s3_storage import AmazonS3Storage
+
+    mp4_stream = filestreams[0]
+    digest = hashlib.sha256(mp4_stream).hexdigest()
+    test_app.config['AMAZON_CONTAINER_NAME'] = 'videoserver-test'
+    test_app.config['AMAZON_ACCESS_KEY_ID'] = 'testing'
+    test_app.config['AMAZON_SECRET_ACCESS_KEY'] = 'testing'
+    test_app.config['AMAZON_REGION'] = 'us-east-1'
+    test_app.config['AMAZON_ENDPOINT_URL'] = ''
+
+    # moto>=5 has a single `mock_aws` decorator
+    with (getattr(moto, 'mock_aws', None) or getattr(moto, 'mock_s3'))(), test_app.test_request_context():
+        storage = AmazonS3Storage()
+        storage.client.create_bucket(Bucket=test_app.config['AMAZON_CONTAINER_NAME'])
+        # eager tasks run in a context of the app which initialized celery, so the task runs in this app instead
+        with mock.patch.object(test_app, 'fs', storage), \
+                mock.patch('videoserver.apps.projects.routes.index_video.apply_async',
+                           side_effect=lambda args, task_id: index_video.run(*args)):
+            url = url_for('projects.list_upload_project')
+            resp = client.post(
+                url,
+                data={
+                    'file': (BytesIO(mp4_stream), 'sample_0.mp4')
+                },
+                content_type='multipart/form-data'
+            )
+            assert resp.status == '201 CREATED'
+            first_project = json.loads(resp.data)
+
+            # s3 has no content index, remuxed content of a project with the same source is copied
+            resp = client.post(url, data={'sha256': digest, 'filename': 'sample_0.mp4'})
+            resp_data = json.loads(resp.data)
+            assert resp.status == '201 CREATED'
+            assert resp_data['metadata'] == first_project['metadata']
+            assert storage.get(resp_data['storage_id']) == storage.get(first_project['storage_id'])
+            assert test_app.mongo.db.media_index.find_one({'_id': ObjectId(resp_data['_id'])})
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
 def test_upload_project_bad_request(test_app, client, filestreams):
     mp4_stream = filestreams[0]
@@ -57,6 +57,36 @@ def test_capture_timeline_thumbnails_remove_old(test_app, client, projects):
             assert test_app.fs.get(thumbnail_data['storage_id']).__class__ is bytes
 
 
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
+def test_capture_timeline_thumbnails_fast_mode(test_app, client, projects):
+    project = projects[0]
+    amount = 3
+
+    with test_app.test_request_context():
+        url = url_for(
+            'projects.retrieve_or_create_thumbnails', project_id=project['_id']
+        ) + f'?type=timeline&amount={amount}'
+        resp = client.get(url + '&mode=fast')
+        assert resp.status == '202 ACCEPTED'
+
+        resp = client.get(url + '&mode=fast')
+        resp_data = json.loads(resp.data)
+        assert resp.status == '200 OK'
+        assert len(resp_data) == amount
+        assert all(thumbnail_data['mode'] == 'fast' for thumbnail_data in resp_data)
+
+        # fast thumbnails are not good enough for accurate mode
+        resp = client.get(url)
+        assert resp.status == '202 ACCEPTED'
+        resp = client.get(url + '&mode=fast')
+        resp_data = json.loads(resp.data)
+        assert resp.status == '200 OK'
+        assert all(thumbnail_data['mode'] == 'accurate' for thumbnail_data in resp_data)
+
+        resp = client.get(url + '&mode=random')
+        assert resp.status == '400 BAD REQUEST'
+
+
 @pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
 def test_capture_timeline_thumbnails_409_resp(test_app, client, projects):
     project = projects[0]
@@ -1,9 +1,14 @@
 import json
+from unittest import mock
+
 from bson import ObjectId
 
 import pytest
 from flask import url_for
 
+from videoserver.apps.projects.tasks import edit_video, encode_segment
+from videoserver.lib.utils import delete_segments
+
 
 @pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
 def test_retrieve_project_success(test_app, client, projects):
@@ -26,6 +31,7 @@ def test_retrieve_project_success(test_app, client, projects):
         assert resp_data['version'] == 1
         assert resp_data['parent'] is None
         assert resp_data['processing'] == {'video': False, 'thumbnail_preview': False, 'thumbnails_timeline': False}
+        assert resp_data['progress'] == {'video': None, 'thumbnails_timeline': None}
         assert resp_data['thumbnails'] == {'timeline': [], 'preview': None}
         assert resp_data['url'] == url_for('projects.get_raw_video', project_id=resp_data["_id"], _external=True)
         assert resp_data['metadata']['codec_name'] == 'h264'
@@ -122,6 +128,176 @@ def test_edit_project_no_edit_rules_provided(test_app, client, projects):
         assert resp.status == '400 BAD REQUEST'
 
 
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': True},)], indirect=True)
+def test_edit_project_profile(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.retrieve_edit_destroy_project', project_id=project['_id'])
+        # profile is not an edit rule
+        resp = client.put(
+            url,
+            data=json.dumps({"profile": "fast"}),
+            content_type='application/json'
+        )
+        assert resp.status == '400 BAD REQUEST'
+        # unknown profile
+        resp = client.put(
+            url,
+            data=json.dumps({"scale": 640, "profile": "unknown"}),
+            content_type='application/json'
+        )
+        assert resp.status == '400 BAD REQUEST'
+        # edit request
+        resp = client.put(
+            url,
+            data=json.dumps({"scale": 640, "profile": "fast"}),
+            content_type='application/json'
+        )
+        assert resp.status == '202 ACCEPTED'
+        resp = client.get(url)
+        resp_data = json.loads(resp.data)
+        assert resp_data['metadata']['width'] == 640
+        assert resp_data['metadata']['encoder_profile'] == 'fast'
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': True},)], indirect=True)
+def test_edit_project_adaptive_profile(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.retrieve_edit_destroy_project', project_id=project['_id'])
+        # short clip is encoded with the best quality
+        resp = client.put(
+            url,
+            data=json.dumps({"scale": 640}),
+            content_type='application/json'
+        )
+        assert resp.status == '202 ACCEPTED'
+        resp = client.get(url)
+        assert json.loads(resp.data)['metadata']['encoder_profile'] == 'quality'
+
+        # the fastest profile is used when target turnaround can't be met
+        test_app.config['FFMPEG_TARGET_TURNAROUND'] = 0.1
+        try:
+            resp = client.put(
+                url,
+                data=json.dumps({"scale": 480}),
+                content_type='application/json'
+            )
+            assert resp.status == '202 ACCEPTED'
+        finally:
+            test_app.config['FFMPEG_TARGET_TURNAROUND'] = 300
+        resp = client.get(url)
+        assert json.loads(resp.data)['metadata']['encoder_profile'] == 'fast'
+
+        # default profile is used when there are no profile speeds
+        profile_speeds = test_app.config['FFMPEG_ADAPTIVE_PROFILE_SPEEDS']
+        test_app.config['FFMPEG_ADAPTIVE_PROFILE_SPEEDS'] = ()
+        try:
+            resp = client.put(
+                url,
+                data=json.dumps({"scale": 320}),
+                content_type='application/json'
+            )
+            assert resp.status == '202 ACCEPTED'
+        finally:
+            test_app.config['FFMPEG_ADAPTIVE_PROFILE_SPEEDS'] = profile_speeds
+        resp = client.get(url)
+        assert json.loads(resp.data)['metadata']['encoder_profile'] == 'balanced'
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': True},)], indirect=True)
+def test_edit_project_segments(test_app, client, projects):
+    project = projects[0]
+
+    test_app.config['FFMPEG_SEGMENT_MIN_DURATION'] = 5
+    test_app.config['FFMPEG_SEGMENT_DURATION'] = 4
+    try:
+        with test_app.test_request_context():
+            url = url_for('projects.retrieve_edit_destroy_project', project_id=project['_id'])
+            resp = client.put(
+                url,
+                data=json.dumps({"trim": {"start": 2.0, "end": 14.0}, "scale": 640}),
+                content_type='application/json'
+            )
+            assert resp.status == '202 ACCEPTED'
+            resp_data = json.loads(client.get(url).data)
+            assert not resp_data['processing']['video']
+            assert resp_data['metadata']['duration'] == 12.0
+            assert resp_data['metadata']['width'] == 640
+            assert not test_app.mongo.db.segments.count_documents({})
+
+            # task which was queued without a job id, segment tasks share its own id
+            doc = test_app.mongo.db.projects.find_one({'_id': ObjectId(project['_id'])})
+            doc.pop('jobs', None)
+            test_app.mongo.db.projects.update_one({'_id': doc['_id']}, {'$set': {'processing.video': True}})
+            edit_video.apply(args=(doc,), kwargs={'changes': {'trim': {'start': 0.0, 'end': 10.0}, 'scale': 320}})
+            resp_data = json.loads(client.get(url).data)
+            assert not resp_data['processing']['video']
+            assert resp_data['metadata']['duration'] == 10.0
+            assert resp_data['metadata']['width'] == 320
+            assert not test_app.mongo.db.segments.count_documents({})
+
+            # segment which was delivered again doesn't start concat twice
+            test_app.mongo.db.segments.insert_one(
+                {'_id': 'job', 'project_id': doc['_id'], 'count': 1, 'parts': {}, 'concat': False}
+            )
+            with mock.patch('videoserver.apps.projects.tasks.concat_segments.delay') as delay:
+                for _ in range(2):
+                    encode_segment.apply(args=(doc, {'scale': 320}, 'job', 0, 0.0, 4.0))
+            assert delay.call_count == 1
+            assert test_app.mongo.db.segments.find_one({'_id': 'job'})['concat'] is True
+            delete_segments('job')
+    finally:
+        test_app.config['FFMPEG_SEGMENT_MIN_DURATION'] = 600
+        test_app.config['FFMPEG_SEGMENT_DURATION'] = 120
+
+
+@pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': True},)], indirect=True)
+def test_edit_project_thumbnails(test_app, client, projects):
+    project = projects[0]
+
+    with test_app.test_request_context():
+        url = url_for('projects.retrieve_edit_destroy_project', project_id=project['_id'])
+        # preview is outside of trimmed video
+        resp = client.put(
+            url,
+            data=json.dumps({"trim": {"start": 2.0, "end": 6.0}, "thumbnails": {"preview": 5.0}}),
+            content_type='application/json'
+        )
+        assert resp.status == '400 BAD REQUEST'
+        assert json.loads(resp.data) == {"thumbnails": [{"preview": ["outside of edited video's length"]}]}
+
+        # thumbnails only is not an edit
+        resp = client.put(
+            url,
+            data=json.dumps({"thumbnails": {"timeline": 5}}),
+            content_type='application/json'
+        )
+        assert resp.status == '400 BAD REQUEST'
+
+        resp = client.put(
+            url,
+            data=json.dumps({"scale": 640, "thumbnails": {"timeline": 5, "preview": 2.5}}),
+            content_type='application/json'
+        )
+        assert resp.status == '202 ACCEPTED'
+        resp = client.get(url)
+        resp_data = json.loads(resp.data)
+        assert resp_data['metadata']['width'] == 640
+        assert len(resp_data['thumbnails']['timeline']) == 5
+        assert resp_data['thumbnails']['timeline'][0]['height'] == 50
+        assert resp_data['thumbnails']['preview']['position'] == 2.5
+        assert resp_data['thumbnails']['preview']['width'] == 640
+
+        # thumbnails are stored
+        resp = client.get(resp_data['thumbnails']['timeline'][4]['url'])
+        assert resp.status == '200 OK'
+        resp = client.get(resp_data['thumbnails']['preview']['url'])
+        assert resp.status == '200 OK'
+
+
 @pytest.mark.parametrize('projects', [({'file': 'sample_0.mp4', 'duplicate': False},)], indirect=True)
 def test_edit_project_version_1(test_app, client, projects):
     project = projects[0]
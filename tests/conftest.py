@@ -34,8 +34,9 @@ def test_app(request):
         """
         Remove test folder and drop test db
         """
-        # drop test db
+        # drop test db, renders are shared by projects with the same video
         test_app.mongo.db.projects.drop()
+        test_app.mongo.db.renders.drop()
         # drop test media folder
         if os.path.exists(test_app.config['FS_MEDIA_STORAGE_PATH']):
             shutil.rmtree(os.path.dirname(test_app.config.get('FS_MEDIA_STORAGE_PATH')))
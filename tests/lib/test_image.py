@@ -0,0 +1,57 @@
+import struct
+from io import BytesIO
+
+import pytest
+
+from videoserver.lib.image import get_image_meta
+
+
+def _png(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + b'\x00' * 4
+
+
+def _bmp(width, height):
+    dib = struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, 0, 0, 0, 0, 0)
+    return b'BM' + struct.pack('<IHHI', 54 + len(dib), 0, 0, 54) + dib
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.jpg', 'sample_1.jpg')], indirect=True)
+def test_get_image_meta_jpeg(test_app, filestreams):
+    for jpg_stream in filestreams:
+        meta = get_image_meta(jpg_stream)
+        assert meta['codec_name'] == 'mjpeg'
+        assert meta['mimetype'] == 'image/jpeg'
+        assert meta['size'] == len(jpg_stream)
+        assert meta['width'] > 0
+        assert meta['height'] > 0
+        # file-like object gives the same result
+        assert get_image_meta(BytesIO(jpg_stream)) == meta
+
+
+def test_get_image_meta_png_bmp():
+    assert get_image_meta(_png(89, 50)) == {
+        'codec_name': 'png',
+        'width': 89,
+        'height': 50,
+        'size': 33,
+        'mimetype': 'image/png',
+    }
+    # top-down bitmap has a negative height
+    assert get_image_meta(_bmp(640, -360)) == {
+        'codec_name': 'bmp',
+        'width': 640,
+        'height': 360,
+        'size': 54,
+        'mimetype': 'image/bmp',
+    }
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
+def test_get_image_meta_not_image(test_app, filestreams):
+    mp4_stream, jpg_stream = filestreams
+
+    assert get_image_meta(mp4_stream) is None
+    assert get_image_meta(b'') is None
+    # truncated before a start of frame segment
+    assert get_image_meta(jpg_stream[:20]) is None
@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+from videoserver.lib.storage.amazon_s3_storage import AmazonS3Storage
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+# moto>=5 has a single `mock_aws` decorator
+mock_s3 = getattr(moto, 'mock_aws', None) or getattr(moto, 'mock_s3')
+
+
+@pytest.fixture(scope='function')
+def s3_storage(test_app):
+    test_app.config['AMAZON_CONTAINER_NAME'] = 'videoserver-test'
+    test_app.config['AMAZON_ACCESS_KEY_ID'] = 'testing'
+    test_app.config['AMAZON_SECRET_ACCESS_KEY'] = 'testing'
+    test_app.config['AMAZON_REGION'] = 'us-east-1'
+    test_app.config['AMAZON_ENDPOINT_URL'] = ''
+    # force multipart upload for a sample video
+    test_app.config['AMAZON_S3_MULTIPART_THRESHOLD'] = 5 * 1024 * 1024
+    test_app.config['AMAZON_S3_MULTIPART_CHUNKSIZE'] = 5 * 1024 * 1024
+
+    with mock_s3():
+        with test_app.app_context():
+            storage = AmazonS3Storage()
+            storage.client.create_bucket(Bucket=test_app.config['AMAZON_CONTAINER_NAME'])
+            yield storage
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
+def test_s3_storage_put_get(s3_storage, filestreams):
+    mp4_stream, jpg_stream_0 = filestreams
+
+    storage_id = s3_storage.put(
+        content=mp4_stream,
+        filename='sample_video.mp4',
+        project_id='project_one',
+        asset_type='project',
+        content_type='video/mp4'
+    )
+    thumbn_storage_id = s3_storage.put(
+        content=jpg_stream_0,
+        filename='sample_image.jpg',
+        storage_id=storage_id,
+        asset_type='thumbnail'
+    )
+    assert s3_storage.get(storage_id) == mp4_stream
+    assert s3_storage.get(thumbn_storage_id) == jpg_stream_0
+    assert s3_storage.get_local_path(storage_id) is None
+
+    with pytest.raises(Exception):
+        s3_storage.put(
+            content=jpg_stream_0,
+            filename='sample_image.jpg',
+            storage_id=storage_id,
+            asset_type='thumbnail'
+        )
+    with pytest.raises(FileNotFoundError):
+        s3_storage.get(storage_id + '.random.png')
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_s3_storage_get_range_and_stream(s3_storage, filestreams):
+    mp4_stream = filestreams[0]
+    storage_id = s3_storage.put(
+        content=mp4_stream,
+        filename='sample_video.mp4',
+        project_id='project_one',
+        asset_type='project'
+    )
+
+    assert s3_storage.get_range(storage_id, 1000000, 1000000) == mp4_stream[1000000:2000000]
+    assert len(s3_storage.get_range(storage_id, 2000000, 1000000)) == 617862
+    assert len(s3_storage.get_range(storage_id, 3000000, 1000000)) == 0
+
+    with s3_storage.local_file(storage_id) as file_path:
+        with open(file_path, 'rb') as f:
+            assert f.read() == mp4_stream
+    assert not os.path.exists(file_path)
+
+    chunks = list(s3_storage.get_stream(storage_id, start=1000000, length=100000, chunk_size=65536))
+    assert b''.join(chunks) == mp4_stream[1000000:1100000]
+    assert b''.join(s3_storage.get_stream(storage_id)) == mp4_stream
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_s3_storage_media_input(test_app, s3_storage, filestreams):
+    mp4_stream = filestreams[0]
+    storage_id = s3_storage.put(
+        content=mp4_stream,
+        filename='sample_video.mp4',
+        project_id='project_one',
+        asset_type='project'
+    )
+
+    # media tools read an object by a presigned url
+    with s3_storage.media_input(storage_id) as url:
+        assert url.startswith('https://')
+        assert storage_id in url
+    with pytest.raises(FileNotFoundError):
+        with s3_storage.media_input(storage_id + '.random.mp4'):
+            pass
+
+    test_app.config['AMAZON_S3_PRESIGNED_URL_EXPIRES'] = 0
+    with s3_storage.media_input(storage_id) as file_path:
+        with open(file_path, 'rb') as f:
+            assert f.read() == mp4_stream
+    assert not os.path.exists(file_path)
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.jpg', 'sample_1.jpg')], indirect=True)
+def test_s3_storage_replace(s3_storage, filestreams):
+    jpg_stream_0, jpg_stream_1 = filestreams
+    storage_id = s3_storage.put(
+        content=jpg_stream_0,
+        filename='sample_image.jpg',
+        project_id='project_one',
+        asset_type='project'
+    )
+    validators = s3_storage.get_validators(storage_id)
+
+    s3_storage.replace(content=jpg_stream_1, storage_id=storage_id)
+    assert s3_storage.get(storage_id) == jpg_stream_1
+    assert s3_storage.get_validators(storage_id)['etag'] != validators['etag']
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
+def test_s3_storage_delete_dir(s3_storage, filestreams):
+    mp4_stream, jpg_stream_0 = filestreams
+    storage_id = s3_storage.put(
+        content=mp4_stream,
+        filename='sample_video.mp4',
+        project_id='project_one',
+        asset_type='project'
+    )
+    thumbn_storage_ids = [
+        s3_storage.put(
+            content=jpg_stream_0,
+            filename=f'sample_image_{i}.jpg',
+            storage_id=storage_id,
+            asset_type='thumbnail'
+        ) for i in range(3)
+    ]
+    other_storage_id = s3_storage.put(
+        content=jpg_stream_0,
+        filename='sample_image.jpg',
+        project_id='project_two',
+        asset_type='project'
+    )
+
+    s3_storage.delete(thumbn_storage_ids[0])
+    with pytest.raises(FileNotFoundError):
+        s3_storage.get(thumbn_storage_ids[0])
+
+    s3_storage.delete_dir(storage_id)
+    for _storage_id in (storage_id, *thumbn_storage_ids):
+        with pytest.raises(FileNotFoundError):
+            s3_storage.get(_storage_id)
+    assert s3_storage.get(other_storage_id) == jpg_stream_0
@@ -1,4 +1,7 @@
+import hashlib
 import os
+from io import BytesIO
+from tempfile import NamedTemporaryFile
 
 import pytest
 from videoserver.lib.storage.file_system_storage import FileSystemStorage
@@ -40,6 +43,33 @@ def test_fs_storage_put(test_app, filestreams):
         )
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
+def test_fs_storage_put_file_object(test_app, filestreams):
+    storage = FileSystemStorage()
+    mp4_stream, jpg_stream_0 = filestreams
+
+    with test_app.app_context():
+        # named file is linked into a storage
+        with NamedTemporaryFile('wb+', dir=test_app.config['FS_MEDIA_STORAGE_PATH']) as tmp_file:
+            tmp_file.write(mp4_stream)
+            storage_id = storage.put(
+                content=tmp_file,
+                filename='sample_video.mp4',
+                project_id='project_one',
+                asset_type='project'
+            )
+        assert storage.get(storage_id) == mp4_stream
+
+        # any other file-like object is copied
+        thumbn_storage_id = storage.put(
+            content=BytesIO(jpg_stream_0),
+            filename='sample_image.jpg',
+            storage_id=storage_id,
+            asset_type='thumbnail'
+        )
+        assert storage.get(thumbn_storage_id) == jpg_stream_0
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
 def test_fs_storage_put_already_exist(test_app, filestreams):
     storage = FileSystemStorage()
@@ -115,6 +145,56 @@ def test_fs_storage_get_range(test_app, filestreams):
         assert len(filestream_range) == 0
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_fs_storage_get_stream(test_app, filestreams):
+    storage = FileSystemStorage()
+    project_id = 'project_one'
+    mp4_stream = filestreams[0]
+    with test_app.app_context():
+        storage_id = storage.put(
+            content=mp4_stream,
+            filename='sample_video.mp4',
+            project_id=project_id,
+            asset_type='project'
+        )
+        chunks = list(storage.get_stream(storage_id, chunk_size=65536))
+        assert b''.join(chunks) == mp4_stream
+        assert max(len(chunk) for chunk in chunks) == 65536
+
+        chunks = list(storage.get_stream(storage_id, start=1000000, length=100000, chunk_size=65536))
+        assert b''.join(chunks) == mp4_stream[1000000:1100000]
+        assert [len(chunk) for chunk in chunks] == [65536, 34464]
+
+        chunks = list(storage.get_stream(storage_id, start=2600000))
+        assert b''.join(chunks) == mp4_stream[2600000:]
+
+        with pytest.raises(FileNotFoundError):
+            storage.get_stream(storage_id + '.random.png')
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.jpg', 'sample_1.jpg')], indirect=True)
+def test_fs_storage_get_validators(test_app, filestreams):
+    storage = FileSystemStorage()
+    jpg_stream_0, jpg_stream_1 = filestreams
+    with test_app.app_context():
+        storage_id = storage.put(
+            content=jpg_stream_0,
+            filename='sample_image.jpg',
+            project_id='project_one',
+            asset_type='project'
+        )
+        validators = storage.get_validators(storage_id)
+        assert validators['etag']
+        assert validators['last_modified']
+        assert validators == storage.get_validators(storage_id)
+
+        storage.replace(
+            content=jpg_stream_1,
+            storage_id=storage_id,
+        )
+        assert validators['etag'] != storage.get_validators(storage_id)['etag']
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg', 'sample_1.jpg')], indirect=True)
 def test_fs_storage_replace(test_app, filestreams):
     storage = FileSystemStorage()
@@ -182,3 +262,97 @@ def test_fs_storage_delete_dir(test_app, filestreams):
             storage.get(thumbn_0_storage_id)
 
         assert not os.path.exists(os.path.dirname(storage._get_file_path(storage_id)))
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
+def test_fs_storage_shares_identical_content(test_app, filestreams):
+    storage = FileSystemStorage()
+    mp4_stream, jpg_stream_0 = filestreams
+    blob_path = os.path.join(
+        test_app.config['FS_MEDIA_STORAGE_PATH'],
+        FileSystemStorage.BLOBS_DIR,
+        hashlib.sha256(mp4_stream).hexdigest()[:2],
+        hashlib.sha256(mp4_stream).hexdigest()
+    )
+
+    with test_app.app_context():
+        storage_id_0 = storage.put(
+            content=mp4_stream,
+            filename='sample_video.mp4',
+            project_id='project_one',
+            asset_type='project'
+        )
+        storage_id_1 = storage.put(
+            content=BytesIO(mp4_stream),
+            filename='sample_video.mp4',
+            project_id='project_two',
+            asset_type='project'
+        )
+        storage_id_2 = storage.copy(
+            src_storage_id=storage_id_0,
+            filename='sample_video.mp4',
+            project_id='project_three'
+        )
+        storage_id_3 = storage.put_by_digest(
+            digest=hashlib.sha256(mp4_stream).hexdigest(),
+            filename='sample_video.mp4',
+            project_id='project_four'
+        )
+        storage_ids = (storage_id_0, storage_id_1, storage_id_2, storage_id_3)
+        inodes = {os.stat(storage.get_local_path(_storage_id)).st_ino for _storage_id in storage_ids}
+        assert inodes == {os.stat(blob_path).st_ino}
+        assert os.stat(blob_path).st_nlink == 5
+
+        assert storage.put_by_digest(
+            digest=hashlib.sha256(b'unknown').hexdigest(),
+            filename='sample_video.mp4',
+            project_id='project_five'
+        ) is None
+
+        # replace doesn't affect files which share a blob
+        storage.replace(content=jpg_stream_0, storage_id=storage_id_0)
+        assert storage.get(storage_id_0) == jpg_stream_0
+        assert storage.get(storage_id_1) == mp4_stream
+        assert os.stat(blob_path).st_nlink == 4
+
+        # blob is removed with the last file
+        for _storage_id in storage_ids[1:]:
+            storage.delete_dir(_storage_id)
+        assert not os.path.exists(blob_path)
+        storage.delete(storage_id_0)
+        assert os.listdir(os.path.dirname(blob_path)) == []
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4', 'sample_0.jpg')], indirect=True)
+def test_fs_storage_local_file_and_staging_path(test_app, filestreams):
+    storage = FileSystemStorage()
+    mp4_stream, jpg_stream_0 = filestreams
+
+    with test_app.app_context():
+        storage_id = storage.put(
+            content=mp4_stream,
+            filename='sample_video.mp4',
+            project_id='project_one',
+            asset_type='project'
+        )
+        with storage.local_file(storage_id) as file_path:
+            assert file_path == storage.get_local_path(storage_id)
+        with storage.media_input(storage_id) as file_path:
+            assert file_path == storage.get_local_path(storage_id)
+
+        with pytest.raises(FileNotFoundError):
+            with storage.local_file(storage_id + '.random.mp4'):
+                pass
+
+        with storage.staging_path(suffix='.jpg') as staging_path:
+            assert staging_path.endswith('.jpg')
+            assert not os.path.exists(staging_path)
+            with open(staging_path, 'wb') as f:
+                f.write(jpg_stream_0)
+            staging_ino = os.stat(staging_path).st_ino
+            with open(staging_path, 'rb') as f:
+                storage.replace(f, storage_id)
+        assert not os.path.exists(staging_path)
+        # staged file is moved into the storage
+        assert os.stat(storage.get_local_path(storage_id)).st_ino == staging_ino
+        assert storage.get(storage_id) == jpg_stream_0
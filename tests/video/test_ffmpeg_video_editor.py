@@ -1,5 +1,10 @@
+import subprocess
+from unittest import mock
+
 import pytest
 
+from videoserver.lib.utils import find_keyframe_offset
+from videoserver.lib.video_editor.exceptions import ProcessCancelled, ProcessTimeout
 from videoserver.lib.video_editor.ffmpeg import FFMPEGVideoEditor
 
 
@@ -58,6 +63,104 @@ def test_ffmpeg_video_editor_rotate(test_app, filestreams):
         assert metadata['height'] == 1280
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_rotate_metadata(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_rotated = tmp_path / 'sample_rotated.mp4'
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        source_metadata = editor._get_meta(str(path_input))
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_input),
+            path_output=str(path_rotated),
+            rotate=270
+        )
+        assert metadata['width'] == 720
+        assert metadata['height'] == 1280
+        # streams are copied
+        assert metadata['nb_frames'] == source_metadata['nb_frames']
+        assert abs(metadata['size'] - source_metadata['size']) < 1024
+
+        # rotation is added to rotation of the source
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_rotated),
+            path_output=str(path_output),
+            rotate=90
+        )
+        assert metadata['width'] == 1280
+        assert metadata['height'] == 720
+
+        # re-encoding applies rotation of the source
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_rotated),
+            path_output=str(path_output),
+            scale=360
+        )
+        assert metadata['width'] == 360
+        assert metadata['height'] == 640
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_rotate_metadata_unsupported(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_rotated.mp4'
+    run_ffmpeg = editor._run_ffmpeg
+
+    def run_ffmpeg_5(*args, preoptions=tuple(), **kwargs):
+        # `-display_rotation` was added in ffmpeg 6.0
+        if '-display_rotation' in preoptions:
+            raise RuntimeError("Unrecognized option 'display_rotation'.")
+        return run_ffmpeg(*args, preoptions=preoptions, **kwargs)
+
+    with test_app.app_context(), mock.patch.object(editor, '_run_ffmpeg', side_effect=run_ffmpeg_5):
+        source_metadata = editor._get_meta(str(path_input))
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_input),
+            path_output=str(path_output),
+            rotate=90
+        )
+        # video is re-encoded
+        assert metadata['width'] == 720
+        assert metadata['height'] == 1280
+        assert metadata['size'] != source_metadata['size']
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_faststart(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_faststart = tmp_path / 'sample_faststart.mp4'
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        source_metadata = editor.get_meta_from_path(str(path_input))
+        assert source_metadata['faststart'] is False
+
+        metadata = editor.remux_faststart_from_path(str(path_input), str(path_faststart))
+        assert metadata['faststart'] is True
+        assert metadata['nb_frames'] == source_metadata['nb_frames']
+        assert abs(metadata['size'] - source_metadata['size']) < 1024
+
+        # edited videos are written with faststart
+        for changes in ({'trim': {'start': 2, 'end': 14}}, {'trim': {'start': 2, 'end': 14, 'snap': True}},
+                        {'rotate': 90}, {'scale': 640}):
+            metadata = editor.edit_video_from_path(str(path_input), str(path_output), **changes)
+            assert metadata['faststart'] is True, changes
+
+        test_app.config['FFMPEG_FASTSTART'] = False
+        try:
+            metadata = editor.edit_video_from_path(str(path_input), str(path_output), rotate=90)
+            assert metadata['faststart'] is False
+        finally:
+            test_app.config['FFMPEG_FASTSTART'] = True
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
 def test_ffmpeg_video_editor_scale(test_app, filestreams):
     editor = FFMPEGVideoEditor()
@@ -74,6 +177,96 @@ def test_ffmpeg_video_editor_scale(test_app, filestreams):
         assert metadata['height'] == 720 / 2
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_encoder_profile(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    def audio_hash(path):
+        cmd = ('ffmpeg', '-v', 'error', '-i', str(path), '-map', '0:a', '-c', 'copy', '-f', 'md5', '-')
+        return subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+
+    with test_app.app_context():
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_input),
+            path_output=str(path_output),
+            scale=640,
+            profile='fast'
+        )
+        assert metadata['codec_name'] == 'h264'
+        assert metadata['width'] == 640
+        assert metadata['encoder_profile'] == 'fast'
+        # audio is copied by video-only edits
+        assert audio_hash(path_output) == audio_hash(path_input)
+
+        assert editor._get_encode_options('vp9', 'fast')[:2] == ('-c:v', 'libvpx-vp9')
+        with pytest.raises(ValueError):
+            editor._get_encode_options('h264', 'unknown')
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_progress(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+    progress = []
+
+    with test_app.app_context():
+        editor.edit_video_from_path(
+            path_input=str(path_input),
+            path_output=str(path_output),
+            trim={'start': 2, 'end': 10},
+            scale=640,
+            progress_callback=progress.append
+        )
+        assert progress
+        assert set(progress[-1]) == {'out_time', 'fps', 'speed'}
+        assert progress[-1]['out_time'] == pytest.approx(8, abs=0.1)
+        assert [p['out_time'] for p in progress] == sorted(p['out_time'] for p in progress)
+
+        progress.clear()
+        list(editor.capture_timeline_thumbnails_from_path(
+            path_video=str(path_input),
+            duration=15,
+            thumbnails_amount=3,
+            progress_callback=progress.append
+        ))
+        assert progress
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_watch(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+    test_app.config['FFMPEG_WATCHDOG_INTERVAL'] = 0.1
+
+    with test_app.app_context():
+        with pytest.raises(ProcessTimeout):
+            with editor.watch(timeout=0.2):
+                editor.edit_video_from_path(path_input=str(path_input), path_output=str(path_output), scale=1920)
+
+        with pytest.raises(ProcessCancelled):
+            with editor.watch(is_cancelled=lambda: True):
+                editor.edit_video_from_path(path_input=str(path_input), path_output=str(path_output), scale=1920)
+
+        # limits are reset on exit
+        assert editor.deadline is None
+        assert editor.is_cancelled is None
+        with editor.watch(timeout=60, is_cancelled=lambda: False):
+            metadata = editor.edit_video_from_path(
+                path_input=str(path_input),
+                path_output=str(path_output),
+                trim={'start': 2, 'end': 4},
+                scale=640
+            )
+        assert metadata['duration'] == 2.0
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
 def test_ffmpeg_video_editor_all_methods(test_app, filestreams):
     editor = FFMPEGVideoEditor()
@@ -99,6 +292,199 @@ def test_ffmpeg_video_editor_all_methods(test_app, filestreams):
         assert metadata['height'] == 320
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_edit_video_from_path(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    mp4_stream = filestreams[0]
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(mp4_stream)
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_input),
+            path_output=str(path_output),
+            trim={'start': 2, 'end': 5},
+            scale=640
+        )
+        assert metadata['duration'] == 3.0
+        assert metadata['width'] == 640
+        assert metadata['size'] == path_output.stat().st_size
+        # source is not modified
+        assert path_input.read_bytes() == mp4_stream
+
+        with pytest.raises(RuntimeError):
+            editor.edit_video_from_path(
+                path_input=str(tmp_path / 'missing.mp4'),
+                path_output=str(path_output),
+                scale=640
+            )
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_edit_video_with_thumbnails(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        # video is decoded once for all outputs
+        with mock.patch.object(editor, '_execute', wraps=editor._execute) as execute:
+            metadata, timeline_thumbnails, preview_thumbnail = editor.edit_video_with_thumbnails_from_path(
+                str(path_input), str(path_output), thumbnails_amount=5, preview_position=20,
+                trim={'start': 2, 'end': 14}, scale=640
+            )
+        assert len([call for call in execute.call_args_list if call[0][0][0] == 'ffmpeg']) == 1
+        assert metadata['width'] == 640
+        assert metadata['duration'] == 12.0
+        assert len(editor._get_video_packets(str(path_output))) == 300
+        assert len(timeline_thumbnails) == 5
+        assert timeline_thumbnails[0][1]['height'] == 50
+        assert timeline_thumbnails[0][1]['width'] == 89
+        # position outside of edited video is moved before the end
+        assert preview_thumbnail[1]['width'] == 640
+        assert preview_thumbnail[1]['codec_name'] == 'png'
+
+        # streams are copied, frames are captured from edited video
+        metadata, timeline_thumbnails, preview_thumbnail = editor.edit_video_with_thumbnails_from_path(
+            str(path_input), str(path_output), thumbnails_amount=3, rotate=90
+        )
+        assert 'encoder_profile' not in metadata
+        assert [meta['height'] for _content, meta in timeline_thumbnails] == [50, 50, 50]
+        assert preview_thumbnail is None
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_trim_smart(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    def decode(path):
+        # ffmpeg exits with 0 on broken frames, decoding errors are only logged
+        cmd = ('ffmpeg', '-v', 'error', '-i', str(path), '-map', '0:v', '-f', 'framemd5', '-')
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        assert result.stderr == b''
+        return [line.rsplit(',', 1)[-1] for line in result.stdout.decode().splitlines() if not line.startswith('#')]
+
+    with test_app.app_context():
+        # sample has keyframes at 8.4 and 12.96, GOP between them is copied
+        assert editor._trim_smart(str(path_input), str(path_output), 2, 14)
+        metadata = editor._get_meta(str(path_output))
+        assert metadata['duration'] == 12.0
+        assert metadata['codec_name'] == 'h264'
+        assert len(editor._get_video_packets(str(path_output), 0, 14)) == 300
+        # copied frames are decoded exactly as in a source
+        assert decode(path_output)[160:274] == decode(path_input)[210:324]
+
+        # parameter sets of a source differ from re-encoded parts: CAVLC, keyframes at 0, 4, 8 and 12
+        path_cavlc = tmp_path / 'sample_cavlc.mp4'
+        subprocess.run((
+            'ffmpeg', '-v', 'error', '-i', str(path_input), '-an', '-c:v', 'libx264', '-preset', 'ultrafast',
+            '-g', '100', '-x264-params', 'scenecut=0', str(path_cavlc)
+        ), check=True)
+        assert editor._trim_smart(str(path_cavlc), str(path_output), 2, 14)
+        assert decode(path_output)[50:250] == decode(path_cavlc)[100:300]
+
+        # there is no complete GOP inside a range
+        assert not editor._trim_smart(str(path_input), str(path_output), 2, 5)
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_media_index(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        media_index = editor.get_media_index_from_path(str(path_input))
+        assert media_index['duration'] == 15.0
+        assert media_index['video']['codec_name'] == 'h264'
+        assert media_index['video']['pix_fmt'] == 'yuv420p'
+        assert media_index['video']['time_base'] == '1/12800'
+        assert media_index['video']['nb_frames'] == 375
+        assert media_index['video']['keyframes'] == [[0.0, 0], [8.4, 210], [12.96, 324]]
+        assert media_index['video']['gop_size'] == 210
+        assert media_index['video']['keyframe_interval'] == 8.4
+        assert [stream['codec_name'] for stream in media_index['audio']] == ['aac']
+        assert find_keyframe_offset(media_index['video']['keyframe_offsets'], 10) == (8.4, 1945446)
+        assert find_keyframe_offset(media_index['video']['keyframe_offsets'], 0) == (0.0, 48)
+        assert find_keyframe_offset(media_index['video']['keyframe_offsets'], 8.4) == (8.4, 1945446)
+        assert find_keyframe_offset(media_index['video']['keyframe_offsets'], 100)[0] == 12.96
+        assert find_keyframe_offset(media_index['video']['keyframe_offsets'], -1) is None
+        assert find_keyframe_offset(None, 10) is None
+
+        # video is not probed when index is provided
+        with mock.patch.object(editor, '_get_video_packets', side_effect=AssertionError), \
+                mock.patch.object(editor, '_get_video_stream', wraps=editor._get_video_stream) as get_video_stream:
+            assert editor._trim_smart(str(path_input), str(path_output), 2, 14, media_index)
+            assert get_video_stream.call_args[0][1] is media_index
+        assert len(editor._get_video_packets(str(path_output))) == 300
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_segments(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        media_index = editor.get_media_index_from_path(str(path_input))
+        # edit is too short to be split
+        assert editor.plan_segments(media_index, scale=640) is None
+
+        test_app.config['FFMPEG_SEGMENT_MIN_DURATION'] = 5
+        test_app.config['FFMPEG_SEGMENT_DURATION'] = 4
+        try:
+            trim = {'start': 2, 'end': 14}
+            # segments are cut at keyframes at 8.4 and 12.96, a tail shorter than a half of segment is not cut
+            segments = editor.plan_segments(media_index, trim=trim, scale=640)
+            assert segments == [(2, 8.4), (8.4, 14)]
+            # streams are copied
+            assert editor.plan_segments(media_index, trim=trim) is None
+            assert editor.plan_segments(media_index, rotate=90) is None
+        finally:
+            test_app.config['FFMPEG_SEGMENT_MIN_DURATION'] = 600
+            test_app.config['FFMPEG_SEGMENT_DURATION'] = 120
+
+        paths_segments = []
+        for index, (start, end) in enumerate(segments):
+            path_segment = tmp_path / f'segment_{index}.mp4'
+            editor.encode_segment_from_path(str(path_input), str(path_segment), start, end, scale=640,
+                                            media_index=media_index)
+            paths_segments.append(str(path_segment))
+        metadata = editor.concat_segments_from_path(paths_segments, str(path_input), str(path_output), trim=trim)
+        assert metadata['width'] == 640
+        assert metadata['duration'] == 12.0
+        assert metadata['faststart']
+        assert len(editor._get_video_packets(str(path_output))) == 300
+        assert [stream['codec_name'] for stream in editor.get_media_index_from_path(str(path_output))['audio']] \
+            == ['aac']
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_trim_snap(test_app, filestreams, tmp_path):
+    editor = FFMPEGVideoEditor()
+    path_input = tmp_path / 'sample.mp4'
+    path_input.write_bytes(filestreams[0])
+    path_output = tmp_path / 'sample_edit.mp4'
+
+    with test_app.app_context():
+        metadata = editor.edit_video_from_path(
+            path_input=str(path_input),
+            path_output=str(path_output),
+            trim={'start': 10, 'end': 14, 'snap': True}
+        )
+        # start is moved to a keyframe at 8.4
+        assert round(metadata['duration']) == 6
+        # video starts with a keyframe
+        assert editor._get_video_packets(str(path_output), 0, 10)[0][1]
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
 def test_ffmpeg_video_editor_capture_timeline_thumbnails(test_app, filestreams):
     editor = FFMPEGVideoEditor()
@@ -116,6 +502,48 @@ def test_ffmpeg_video_editor_capture_timeline_thumbnails(test_app, filestreams):
             assert meta['height'] == 50
 
 
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+def test_ffmpeg_video_editor_capture_timeline_thumbnails_seek(test_app, filestreams):
+    editor = FFMPEGVideoEditor()
+    mp4_stream = filestreams[0]
+    # capture every thumbnail by input seeking
+    test_app.config['TIMELINE_SEEK_INTERVAL'] = 0
+    test_app.config['TIMELINE_SEEK_BATCH_SIZE'] = 2
+
+    with test_app.app_context():
+        filename = 'test_ffmpeg_video_editor_sample.mp4'
+        thumbnails = list(editor.capture_timeline_thumbnails(mp4_stream, filename, 15, 3))
+
+        assert len(thumbnails) == 3
+        for thumbnail, meta in thumbnails:
+            assert meta == {
+                'codec_name': 'png',
+                'mimetype': 'image/png',
+                'width': 89,
+                'height': 50,
+                'size': len(thumbnail)
+            }
+
+
+@pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
+@pytest.mark.parametrize('seek_interval', [10, 0])
+def test_ffmpeg_video_editor_capture_timeline_thumbnails_fast(test_app, filestreams, seek_interval):
+    editor = FFMPEGVideoEditor()
+    mp4_stream = filestreams[0]
+    test_app.config['TIMELINE_SEEK_INTERVAL'] = seek_interval
+
+    with test_app.app_context():
+        filename = 'test_ffmpeg_video_editor_sample.mp4'
+        thumbnails = list(editor.capture_timeline_thumbnails(mp4_stream, filename, 15, 10, mode='fast'))
+
+        assert len(thumbnails) == 10
+        # sample has 3 keyframes only
+        assert len({thumbnail for thumbnail, _ in thumbnails}) == 3
+        for thumbnail, meta in thumbnails:
+            assert meta['width'] == 89
+            assert meta['height'] == 50
+
+
 @pytest.mark.parametrize('filestreams', [('sample_0.mp4',)], indirect=True)
 def test_ffmpeg_video_editor_capture_thumbnail(test_app, filestreams):
     editor = FFMPEGVideoEditor()
@@ -0,0 +1,45 @@
+import pytest
+
+from videoserver.lib.video_editor.filters import compile_filters
+
+
+@pytest.mark.parametrize('rotate, expected', [
+    (None, ''),
+    (0, ''),
+    (360, ''),
+    (90, 'transpose=clock'),
+    (-270, 'transpose=clock'),
+    (270, 'transpose=cclock'),
+    (-90, 'transpose=cclock'),
+    (180, 'hflip,vflip'),
+    (-180, 'hflip,vflip'),
+])
+def test_compile_filters_rotate(rotate, expected):
+    assert compile_filters(rotate=rotate) == expected
+
+
+def test_compile_filters_order():
+    crop = {'width': 640, 'height': 360, 'x': 10, 'y': 20}
+
+    assert compile_filters(crop=crop, scale=320, rotate=90, size=(1280, 720)) == \
+        'crop=640:360:10:20,scale=320:-2,transpose=clock'
+    # upscale after rotation
+    assert compile_filters(crop=crop, scale=800, rotate=90, size=(1280, 720)) == \
+        'crop=640:360:10:20,transpose=clock,scale=-2:800'
+    assert compile_filters(crop=crop, scale=800, rotate=180, size=(1280, 720)) == \
+        'crop=640:360:10:20,hflip,vflip,scale=800:-2'
+    # size is unknown
+    assert compile_filters(scale=800, rotate=90) == 'scale=800:-2,transpose=clock'
+
+
+def test_compile_filters_skip_noop():
+    crop = {'width': 1280, 'height': 720, 'x': 0, 'y': 0}
+
+    assert compile_filters(crop=crop, scale=1280, size=(1280, 720)) == ''
+    assert compile_filters(crop=crop, rotate=-90, size=(1280, 720)) == 'transpose=cclock'
+    # scale keeps an even height
+    assert compile_filters(scale=1280, size=(1280, 719)) == 'scale=1280:-2'
+    assert compile_filters(crop=crop, scale=1280) == 'crop=1280:720:0:0'
+
+    with pytest.raises(ValueError):
+        compile_filters(rotate=45)
@@ -0,0 +1,65 @@
+import os
+import sys
+from time import monotonic
+
+import pytest
+
+from videoserver.lib.video_editor.exceptions import ProcessCancelled, ProcessTimeout
+from videoserver.lib.video_editor.ffmpeg import FFMPEGVideoEditor
+from videoserver.lib.video_editor.governor import CPUGovernor
+
+
+def test_cpu_governor_budget(tmp_path):
+    governor = CPUGovernor(str(tmp_path), tokens=2, poll_interval=0.01)
+    # another worker on the same node
+    other_governor = CPUGovernor(str(tmp_path), tokens=2, poll_interval=0.01)
+
+    with governor.acquire(1) as cpus:
+        assert len(cpus) == 1
+        # only a free token is given
+        with other_governor.acquire(4) as other_cpus:
+            assert len(other_cpus) == 1
+            if len(governor.cpus) > 1:
+                assert cpus != other_cpus
+
+            # budget is exhausted
+            with pytest.raises(ProcessTimeout):
+                with governor.acquire(1, deadline=monotonic() + 0.05):
+                    pass
+            with pytest.raises(ProcessCancelled):
+                with governor.acquire(1, is_cancelled=lambda: True):
+                    pass
+
+    # tokens are released on exit
+    with governor.acquire(2) as cpus:
+        assert len(cpus) == 2
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'), reason='affinity is not supported')
+def test_ffmpeg_video_editor_affinity(test_app, tmp_path):
+    editor = FFMPEGVideoEditor()
+    cpu = sorted(os.sched_getaffinity(0))[-1]
+
+    with test_app.app_context():
+        output = editor._execute(
+            # a process is pinned after it's started
+            (sys.executable, '-c', 'import os, time; time.sleep(0.2); print(sorted(os.sched_getaffinity(0)))'),
+            stdout=True,
+            cpus=[cpu]
+        )
+        assert output.decode().strip() == f'[{cpu}]'
+
+        governor_dir = test_app.config['FFMPEG_GOVERNOR_DIR']
+        test_app.config['FFMPEG_GOVERNOR_DIR'] = str(tmp_path)
+        try:
+            with editor._reserve_cpus(1920 * 1080) as cpus:
+                assert len(cpus) == min(9, len(os.sched_getaffinity(0)))
+            with editor._reserve_cpus() as cpus:
+                assert len(cpus) == 1
+
+            test_app.config['FFMPEG_GOVERNOR'] = False
+            with editor._reserve_cpus(1920 * 1080) as cpus:
+                assert cpus is None
+        finally:
+            test_app.config['FFMPEG_GOVERNOR_DIR'] = governor_dir
+            test_app.config['FFMPEG_GOVERNOR'] = True